@@ -0,0 +1,290 @@
+# benchmark suite: times each stage of the search engine pipeline on a synthetic collection
+# and writes one JSON line per stage, so results can be compared across commits.
+# Usage:
+#   python bench.py run <results_filename> [num_pages] [links_per_page] [words_per_page] [repeat] [id_stride]
+#   python bench.py compare <baseline_results> <new_results> [tolerance]
+# (run "make" first -- the searchio and linalgebra modules must be built)
+import sys
+import os
+import imp
+import json
+import math
+import time
+import shutil
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(root, 'pagerank'))
+sys.path.insert(0, os.path.join(root, 'k_means'))
+sys.path.append(os.path.join(root, 'svm'))
+
+import searchio
+import linalgebra
+import pagerank
+import vecrep
+import k_means
+import similarity
+import dedup
+import wikigen
+import instrument
+svm_vecrep = imp.load_source('svm_vecrep', os.path.join(root, 'svm', 'vecrep.py'))
+create_training_set = imp.load_source('create_training_set', os.path.join(root, 'svm', 'create_training_set.py'))
+create_test_set = imp.load_source('create_test_set', os.path.join(root, 'svm', 'create_test_set.py'))
+
+stopwords = set(['the', 'of', 'and', 'a', 'to', 'in', 'is'])
+num_features = 1000     # most frequent tokens used as the k-means/SVM feature space
+num_lookups = 200       # number of terms looked up in the SparseIndex stage
+kmeans_iterations = 3   # recluster passes timed -- fixed so the stage doesn't depend on convergence
+num_categories = 11
+
+
+# some of the pipeline scripts still print straight to stdout -- silence it while timing
+@contextmanager
+def quiet():
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+# output: short hash of the commit being benchmarked, or None outside of a git checkout
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# input:  1) fn -- stage to time, takes no arguments
+#         2) repeat -- number of times to run it
+# output: (list of wall-clock seconds for each run, return value of the last run)
+def time_stage(fn, repeat):
+    runs = []
+    value = None
+    for r in range(repeat):
+        start = time.time()
+        with quiet():
+            value = fn()
+        runs.append(time.time() - start)
+    return (runs, value)
+
+# input:  1) {pageID: token list}
+#         2) {pageID: canonical pageID} of near-duplicate pages to leave out, as dedup.read_duplicates returns
+# output: index in the form searchio.createIndex wants: {term: [df, [[pageID, wf, [positions]]]]}
+def build_index(tokens_map, duplicates={}):
+    index = {}
+    for pageID in sorted(tokens_map):
+        if pageID in duplicates:
+            continue
+        positions = {}
+        for (p, token) in enumerate(tokens_map[pageID]):
+            if not token in positions:
+                positions[token] = []
+            positions[token].append(p)
+        for (token, position_list) in positions.items():
+            if not token in index:
+                index[token] = [0, []]
+            index[token][0] += 1
+            index[token][1].append([pageID, 1 + math.log(len(position_list)), position_list])
+    return index
+
+# input:  index as built by build_index
+# output: list of the num_features most frequent terms
+def most_frequent_terms(index, n):
+    return sorted(index, key=lambda t: -index[t][0])[:n]
+
+# input: 1) results_filename -- JSON lines file to write
+#        2) parameters of the synthetic collection, and how many times to repeat each stage
+# output: list of result records, one per stage (also written to results_filename)
+def run(results_filename, num_pages=2000, links_per_page=10, words_per_page=200, repeat=3, id_stride=1):
+    work_dir = tempfile.mkdtemp(prefix='bench')
+    results = []
+    base = {'pages': num_pages, 'links_per_page': links_per_page, 'words_per_page': words_per_page, 'id_stride': id_stride, 'commit': current_commit(), 'timestamp': int(time.time())}
+
+    # the pipeline's own instrumentation stays silent; its counters are picked up per stage instead
+    instrument.set_sink('silent')
+    seen = {}
+    def record(stage, runs, **extra):
+        entry = dict(base)
+        entry.update(extra)
+        entry['peak_rss_kb'] = instrument.memory()[1]
+        entry['counters'] = dict((key, value - seen.get(key, 0)) for (key, value) in instrument.counters.items() if value != seen.get(key, 0))
+        seen.update(instrument.counters)
+        entry['stage'] = stage
+        entry['runs'] = runs
+        entry['best'] = min(runs)
+        entry['mean'] = sum(runs)/len(runs)
+        results.append(entry)
+        print('%-22s best %.4fs  mean %.4fs' % (stage, entry['best'], entry['mean']))
+
+    try:
+        collection_filename = os.path.join(work_dir, 'collection.xml')
+        (runs, value) = time_stage(lambda: wikigen.generate(collection_filename, num_pages, links_per_page, words_per_page, id_stride), 1)
+        record('generate', runs, bytes=os.path.getsize(collection_filename))
+
+        # parsing -- both the link parser used by pagerank and the text parser used by vecrep
+        (runs, parsed) = time_stage(lambda: pagerank.parse(collection_filename), repeat)
+        (title_map, link_map, id_list) = parsed
+        record('parse_links', runs, links=sum(len(l) for l in link_map.values()))
+        (runs, parsed) = time_stage(lambda: vecrep.parse(collection_filename), repeat)
+        (collection, maxID) = parsed
+        record('parse_text', runs)
+
+        def tokenize_all():
+            return dict((pageID, searchio.tokenize(stopwords, text, False)) for (pageID, text) in collection.items())
+        (runs, tokens_map) = time_stage(tokenize_all, repeat)
+        record('tokenize', runs, tokens=sum(len(t) for t in tokens_map.values()))
+        duplicates_filename = os.path.join(work_dir, 'duplicates.dat')
+        (runs, value) = time_stage(lambda: dedup.find_duplicates(collection_filename, stopwords, duplicates_filename), repeat)
+        record('dedup', runs, duplicates=value.duplicates)
+
+        # index write / load / lazy lookups
+        duplicates = dedup.read_duplicates(duplicates_filename)
+        index = build_index(tokens_map, duplicates)
+        num_documents = len(tokens_map) - len(duplicates) # idf counts only the pages that made it into the index
+        index_filename = os.path.join(work_dir, 'index.dat')
+        (runs, value) = time_stage(lambda: searchio.createIndex(index_filename, num_documents, index), repeat)
+        record('createIndex', runs, terms=len(index), bytes=os.path.getsize(index_filename))
+        (runs, value) = time_stage(lambda: searchio.loadIndex(index_filename), repeat)
+        record('loadIndex', runs)
+        (runs, value) = time_stage(lambda: searchio.loadSparseIndex(index_filename), repeat)
+        record('loadSparseIndex', runs)
+        (runs, value) = time_stage(lambda: searchio.loadIndex(index_filename, False), repeat)
+        record('loadIndex_no_positions', runs)
+        wf_filename = os.path.join(work_dir, 'index_wf.dat')
+        (runs, value) = time_stage(lambda: searchio.createIndex(wf_filename, num_documents, index, 0, searchio.PROFILE_WF), repeat)
+        record('createIndex_wf', runs, bytes=os.path.getsize(wf_filename))
+        (runs, value) = time_stage(lambda: searchio.loadIndex(wf_filename), repeat)
+        record('loadIndex_wf', runs)
+        terms = sorted(index)
+        step = max(1, len(terms)//num_lookups)
+        lookup_terms = terms[::step][:num_lookups]
+        def lookups():
+            (sparse, numDocuments) = searchio.loadSparseIndex(index_filename)
+            for t in lookup_terms:
+                sparse[t]
+        (runs, value) = time_stage(lookups, repeat)
+        record('sparse_lookup', runs, lookups=len(lookup_terms))
+
+        # pagerank
+        (runs, A) = time_stage(lambda: pagerank.create_adjacency_matrix(title_map, link_map), repeat)
+        record('adjacency_matrix', runs)
+        (runs, value) = time_stage(lambda: linalgebra.compute_pagerank(A, pagerank.alpha, id_list, pagerank.iterations), repeat)
+        record('pagerank_dict', runs, iterations=pagerank.iterations)
+        (runs, graph) = time_stage(lambda: linalgebra.extract_links(collection_filename), repeat)
+        (node_ids, offsets, targets) = graph
+        record('extract_links', runs, edges=len(targets))
+        (runs, value) = time_stage(lambda: linalgebra.compute_pagerank((offsets, targets), pagerank.alpha, node_ids, pagerank.iterations), repeat)
+        record('pagerank', runs, iterations=pagerank.iterations)
+        graph_filename = os.path.join(work_dir, 'links.bin')
+        (runs, value) = time_stage(lambda: linalgebra.write_link_graph(collection_filename, graph_filename), repeat)
+        record('write_link_graph', runs, bytes=os.path.getsize(graph_filename))
+        (runs, value) = time_stage(lambda: linalgebra.compute_pagerank_file(graph_filename, pagerank.alpha, pagerank.iterations), repeat)
+        record('pagerank_out_of_core', runs, iterations=pagerank.iterations)
+        teleports = [list(node_ids[c::num_categories]) for c in range(num_categories)]
+        (runs, value) = time_stage(lambda: linalgebra.compute_personalized_pagerank((offsets, targets), pagerank.alpha, node_ids, teleports, pagerank.iterations), repeat)
+        record('pagerank_topics', runs, iterations=pagerank.iterations, vectors=len(teleports))
+
+        # the k-means and SVM scripts still walk pageIDs 0..maxID, so they only run on dense collections
+        if id_stride != 1:
+            return results
+
+        # k-means -- a fixed number of recluster passes over the feature vectors
+        features = most_frequent_terms(index, num_features)
+        features_filename = os.path.join(work_dir, 'features.dat')
+        f = open(features_filename, 'w')
+        f.write('\n'.join(features)+'\n')
+        f.close()
+        (runs, value) = time_stage(lambda: vecrep.main(collection_filename, features_filename), repeat)
+        (X, F) = value
+        record('kmeans_vecrep', runs, features=F)
+        def kmeans():
+            u_dict = k_means.initialize_means1(X)
+            for i in range(kmeans_iterations):
+                k_means.recluster(u_dict, k_means.initialize_clusters(), X)
+            return u_dict
+        (runs, u_dict) = time_stage(kmeans, repeat)
+        record('kmeans', runs, iterations=kmeans_iterations, k=k_means.k)
+        query_pages = sorted(X)[::max(1, len(X)//num_lookups)][:num_lookups]
+        def similarity_queries():
+            index = similarity.build(u_dict, X)
+            for pageID in query_pages:
+                index.more_like_page(pageID)
+        (runs, value) = time_stage(similarity_queries, repeat)
+        record('similarity', runs, queries=len(query_pages), nprobe=similarity.nprobe)
+
+        # SVM training and test set generation
+        vecrep_filename = os.path.join(work_dir, 'vecrep.dat')
+        stopwords_filename = os.path.join(work_dir, 'stopwords.dat')
+        f = open(stopwords_filename, 'w')
+        f.write('\n'.join(sorted(stopwords))+'\n')
+        f.close()
+        (runs, value) = time_stage(lambda: svm_vecrep.main(stopwords_filename, collection_filename, features_filename, vecrep_filename), repeat)
+        record('svm_vecrep', runs)
+        training_filename = os.path.join(work_dir, 'training.dat')
+        f = open(training_filename, 'w')
+        for pageID in id_list[::2]:
+            f.write(str(pageID)+' '+str(pageID % num_categories)+'\n')
+        f.close()
+        def svm_sets():
+            create_training_set.main(vecrep_filename, training_filename, 0, os.path.join(work_dir, 'svmtraining0.dat'))
+            create_test_set.main(vecrep_filename, os.path.join(work_dir, 'test.dat'), training_filename)
+        (runs, value) = time_stage(svm_sets, repeat)
+        record('svm_sets', runs)
+    finally:
+        shutil.rmtree(work_dir)
+        f = open(results_filename, 'w')
+        for entry in results:
+            f.write(json.dumps(entry, sort_keys=True)+'\n')
+        f.close()
+    return results
+
+# input:  filename of a JSON lines results file written by run
+# output: dictionary {stage: result record}
+def load_results(results_filename):
+    results = {}
+    f = open(results_filename, 'r')
+    for line in f:
+        if line.strip():
+            entry = json.loads(line)
+            results[entry['stage']] = entry
+    f.close()
+    return results
+
+# input:  1) baseline and new results filenames
+#         2) tolerance -- relative slowdown of a stage's best time before it counts as a regression
+# output: list of stages that regressed (a table of ratios is printed along the way)
+def compare(baseline_filename, new_filename, tolerance=0.10):
+    baseline = load_results(baseline_filename)
+    new = load_results(new_filename)
+    regressions = []
+    for (stage, entry) in sorted(new.items()):
+        if not stage in baseline or baseline[stage]['best'] <= 0:
+            continue
+        ratio = entry['best']/baseline[stage]['best']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(stage)
+        print('%-22s %.4fs -> %.4fs  x%.2f%s' % (stage, baseline[stage]['best'], entry['best'], ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == 'run':
+        run(sys.argv[2], *[int(a) for a in sys.argv[3:]])
+    elif len(sys.argv) > 3 and sys.argv[1] == 'compare':
+        tolerance = float(sys.argv[4]) if len(sys.argv) > 4 else 0.10
+        if compare(sys.argv[2], sys.argv[3], tolerance):
+            sys.exit(1)
+    else:
+        print('usage: python bench.py run <results_filename> [num_pages] [links_per_page] [words_per_page] [repeat] [id_stride]')
+        print('       python bench.py compare <baseline_results> <new_results> [tolerance]')
+        sys.exit(2)
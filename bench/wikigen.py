@@ -0,0 +1,106 @@
+# synthetic wiki-dump generator for the benchmark suite
+# writes a collection in the same <page><id><title><text> format as our wiki dumps, with [[links]] between pages
+# Usage:
+#   python wikigen.py <output_filename> <num_pages> [links_per_page] [words_per_page] [id_stride] [seed]
+import sys
+import random
+from bisect import bisect
+
+vocabulary_size = 20000 # number of distinct words that can appear in a page
+zipf_s = 1.1            # skew of the word and link-target distributions -- real text is roughly zipfian
+external_fraction = 0.2 # fraction of links that point at titles that aren't in the collection
+words_per_line = 12
+
+
+# input:  1) n -- number of items
+#         2) s -- zipf exponent
+# output: cumulative weight list usable with bisect to draw item indices with P(i) ~ 1/(i+1)**s
+def zipf_cdf(n, s):
+    cdf = []
+    total = 0.0
+    for i in range(n):
+        total += 1.0/((i+1)**s)
+        cdf.append(total)
+    return cdf
+
+# draws an index from a cumulative weight list built by zipf_cdf
+def zipf_draw(rand, cdf):
+    return bisect(cdf, rand.random()*cdf[-1])
+
+# input:  1) rand -- random.Random to draw from
+#         2) n -- number of words to make
+# output: list of n distinct lowercase pseudo-words
+def create_vocabulary(rand, n):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = []
+    seen = set()
+    while len(words) < n:
+        w = ''.join(rand.choice(letters) for i in range(rand.randint(3, 10)))
+        if not w in seen:
+            seen.add(w)
+            words.append(w)
+    return words
+
+# input:  1) rand -- random.Random to draw from
+#         2) title -- title of the target page
+# output: the link markup, sometimes with a section anchor or display text as found in real dumps
+def format_link(rand, title):
+    r = rand.random()
+    if r < 0.1:
+        return '[['+title+'#section '+str(rand.randint(1, 5))+']]'
+    if r < 0.25:
+        return '[['+title+'|'+title.lower()+']]'
+    return '[['+title+']]'
+
+# input: 1) output_filename -- file to write the collection to
+#        2) num_pages -- number of pages to generate
+#        3) links_per_page -- average number of [[links]] per page
+#        4) words_per_page -- average number of words per page
+#        5) id_stride -- distance between consecutive pageIDs (1 gives the dense 0..N-1 ids the graders use)
+#        6) seed -- random seed so runs are reproducible
+# output: writes the collection, returns list of the pageIDs in the order written
+def generate(output_filename, num_pages, links_per_page=10, words_per_page=200, id_stride=1, seed=158):
+    rand = random.Random(seed)
+    vocabulary = create_vocabulary(rand, vocabulary_size)
+    word_cdf = zipf_cdf(vocabulary_size, zipf_s)
+    target_cdf = zipf_cdf(num_pages, zipf_s)
+    # shuffle which pages are popular link targets so popularity isn't tied to pageID
+    popularity = list(range(num_pages))
+    rand.shuffle(popularity)
+    titles = [vocabulary[zipf_draw(rand, word_cdf)].capitalize()+' '+str(i) for i in range(num_pages)]
+
+    id_list = []
+    f = open(output_filename, 'w')
+    for i in range(num_pages):
+        pageID = i*id_stride
+        id_list.append(pageID)
+        num_words = rand.randint(words_per_page//2, words_per_page*3//2)
+        num_links = rand.randint(0, 2*links_per_page)
+        # decide which word positions get replaced by a link
+        link_positions = set(rand.randint(0, num_words) for l in range(num_links))
+
+        f.write('<page>\n')
+        f.write('<id>'+str(pageID)+'</id>\n')
+        f.write('<title>'+titles[i]+'</title>\n')
+        line = ['<text>']
+        for w in range(num_words):
+            if w in link_positions:
+                if rand.random() < external_fraction:
+                    line.append(format_link(rand, 'External '+vocabulary[rand.randint(0, vocabulary_size-1)]))
+                else:
+                    line.append(format_link(rand, titles[popularity[zipf_draw(rand, target_cdf)]]))
+            else:
+                line.append(vocabulary[zipf_draw(rand, word_cdf)])
+            if len(line) >= words_per_line:
+                f.write(' '.join(line)+'\n')
+                line = []
+        line.append('</text>')
+        f.write(' '.join(line)+'\n')
+        f.write('</page>\n')
+    f.close()
+    return id_list
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[3:]]
+    generate(sys.argv[1], int(sys.argv[2]), *args)
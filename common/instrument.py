@@ -0,0 +1,134 @@
+# instrument.py
+# shared progress/timing instrumentation for the search engine pipeline: stage timers, counters, progress events
+# and peak-memory sampling, all reported through a pluggable sink instead of print statements.
+#
+# The sink is picked with the INSTRUMENT environment variable (silent, json or human -- human is the default),
+# and INSTRUMENT_FILE redirects the output from stderr to a file.  Every event is a flat dictionary with an
+# 'event' key ('stage', 'progress' or 'counters') and a 'name' key.
+import sys
+import os
+import time
+import json
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError: # not available outside of unix
+    resource = None
+
+counters = {} # {counter name: running total} for the whole process
+
+
+# discards every event -- for benchmarks and library use
+class NullSink(object):
+    def __init__(self, f=None):
+        pass
+
+    def emit(self, event):
+        pass
+
+# writes each event as one line of JSON
+class JSONSink(object):
+    def __init__(self, f=None):
+        self.f = f or sys.stderr
+
+    def emit(self, event):
+        self.f.write(json.dumps(event, sort_keys=True)+'\n')
+        self.f.flush()
+
+# writes each event as a short human readable line
+class HumanSink(object):
+    def __init__(self, f=None):
+        self.f = f or sys.stderr
+
+    def emit(self, event):
+        fields = []
+        for (key, value) in sorted(event.items()):
+            if key in ('event', 'name'):
+                continue
+            if isinstance(value, float):
+                value = '%.6g' % value
+            elif isinstance(value, dict):
+                value = ','.join('%s=%s' % item for item in sorted(value.items()))
+            fields.append('%s=%s' % (key, value))
+        self.f.write('[%s] %s: %s\n' % (event['event'], event['name'], ' '.join(fields)))
+        self.f.flush()
+
+sinks = {'silent': NullSink, 'json': JSONSink, 'human': HumanSink}
+sink = NullSink()
+
+# input: sink -- either a sink object (anything with an emit(event) method) or one of the names in sinks
+# output: the sink now in use
+def set_sink(new_sink, f=None):
+    global sink
+    if new_sink in sinks:
+        new_sink = sinks[new_sink](f)
+    sink = new_sink
+    return sink
+
+# picks the sink named by the INSTRUMENT and INSTRUMENT_FILE environment variables
+def configure():
+    name = os.environ.get('INSTRUMENT', 'human')
+    if not name in sinks:
+        name = 'human'
+    f = None
+    if os.environ.get('INSTRUMENT_FILE'):
+        f = open(os.environ['INSTRUMENT_FILE'], 'a')
+    return set_sink(name, f)
+
+# output: (current resident set size, peak resident set size) of this process in kilobytes -- None when unknown
+def memory():
+    current = None
+    peak = None
+    try:
+        f = open('/proc/self/statm', 'r')
+        current = int(f.read().split()[1]) * (os.sysconf('SC_PAGE_SIZE') // 1024)
+        f.close()
+    except (IOError, OSError, ValueError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin': # reported in bytes there
+            peak = peak // 1024
+        if current is not None and current > peak: # the kernel only updates the peak now and then
+            peak = current
+    return (current, peak)
+
+# adds n to the named counter
+def count(name, n=1):
+    counters[name] = counters.get(name, 0) + n
+
+# reports a progress event, e.g. progress('pagerank_iteration', iteration=3, residual=1e-4)
+def progress(name, **values):
+    event = {'event': 'progress', 'name': name}
+    event.update(values)
+    sink.emit(event)
+
+# callback handed to the C modules (e.g. linalgebra.set_progress): they call it as callback(name, {values})
+def callback(name, values):
+    progress(name, **values)
+
+# times the enclosed block and reports it as a stage, along with memory use and how much each counter moved
+#   with instrument.stage('parse'):
+#       ...
+@contextmanager
+def stage(name):
+    before = dict(counters)
+    start = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.time() - start
+        (rss, peak) = memory()
+        moved = {}
+        for (key, value) in counters.items():
+            if value != before.get(key, 0):
+                moved[key] = value - before.get(key, 0)
+        sink.emit({'event': 'stage', 'name': name, 'seconds': seconds, 'rss_kb': rss, 'peak_rss_kb': peak, 'counters': moved})
+
+# reports the running totals of every counter
+def report(name='total'):
+    (rss, peak) = memory()
+    sink.emit({'event': 'counters', 'name': name, 'peak_rss_kb': peak, 'counters': dict(counters)})
+
+
+configure()
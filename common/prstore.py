@@ -0,0 +1,228 @@
+# prstore.py
+# binary, ID-addressable pagerank store: written once after pagerank is computed, then memory-mapped at query time,
+# so opening it costs microseconds however big the collection is, and looking up one page's score is O(1) -- no
+# parsing the whole text file into a dictionary first.
+#
+# Layout (big-endian, like the index and link graph files):
+#   header   magic 'PRS1', item type ('d' for float64 or 'f' for float32), 3 bytes padding, number of pages N,
+#            base pageID, slot table capacity, max score
+#   scores   N items, in the order the pages were found in the collection, padded to a multiple of 8 bytes
+#   slots    only when the pageIDs aren't base, base+1, ..., base+N-1 in that order: an open-addressing hash table of
+#            <capacity> (pageID, slot) entries, empty entries having slot 0xffffffff
+#
+# Usage: python prstore.py convert <pagerank_filename> <collection_filename> <store_filename>   (text to store)
+#        python prstore.py export <store_filename> <pagerank_filename>                         (store to text)
+import sys
+import os
+import mmap
+import struct
+from array import array
+
+magic = 'PRS1'
+header_format = '>4sc3xQqQd'
+header_size = struct.calcsize(header_format)
+slot_format = '>qI'
+slot_size = struct.calcsize(slot_format)
+empty_slot = 0xffffffff
+hash_multiplier = 0x9e3779b97f4a7c15 # 2**64/golden ratio -- spreads consecutive pageIDs over the table
+
+
+# input:  1) pageID
+#         2) log2 of the slot table capacity
+# output: the entry of the table to start probing at
+def slot_hash(pageID, bits):
+    return ((pageID * hash_multiplier) & 0xffffffffffffffff) >> (64 - bits)
+
+# writes a store -- to a temporary file that's renamed into place, so a reader never maps a half-written one
+# input:  1) filename of the store to write
+#         2) pagerank, as a sequence aligned to id_list (pagerank[n] is the value for id_list[n])
+#         3) list of pageIDs in the order they were found in the collection
+#         4) item type: 'd' (float64) or 'f' (float32, half the size)
+def write_store(store_filename, pagerank, id_list, item='d'):
+    if item not in ('d', 'f'):
+        raise ValueError("the item type must be 'd' or 'f'")
+    if len(pagerank) != len(id_list):
+        raise ValueError('there must be one pagerank value per pageID')
+    N = len(id_list)
+    base = id_list[0] if N else 0
+    dense = all(id_list[n] == base+n for n in xrange(N))
+    capacity = 0
+    bits = 0
+    if not dense:
+        while (1 << bits) < 2*N: # at most half full, so probes stay short
+            bits += 1
+        capacity = 1 << bits
+
+    values = array(item, pagerank)
+    max_score = max(values) if N else 0.0
+    if sys.byteorder == 'little':
+        values.byteswap()
+    data = values.tostring()
+    data += '\0'*(-len(data) % 8)
+
+    temp_filename = store_filename+'.tmp'
+    f = open(temp_filename, 'wb')
+    f.write(struct.pack(header_format, magic, item, N, base, capacity, max_score))
+    f.write(data)
+    if capacity:
+        table = [None]*capacity
+        mask = capacity-1
+        for (slot, pageID) in enumerate(id_list):
+            e = slot_hash(pageID, bits)
+            while table[e] is not None:
+                if table[e][0] == pageID:
+                    f.close()
+                    os.unlink(temp_filename)
+                    raise ValueError('pageID '+str(pageID)+' appears more than once')
+                e = (e+1) & mask
+            table[e] = (pageID, slot)
+        empty = struct.pack(slot_format, 0, empty_slot)
+        f.write(''.join(empty if entry is None else struct.pack(slot_format, entry[0], entry[1]) for entry in table))
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.rename(temp_filename, store_filename)
+    return
+
+# output: True if the file is a pagerank store (rather than the text format)
+def is_store(filename):
+    f = open(filename, 'rb')
+    start = f.read(len(magic))
+    f.close()
+    return start == magic
+
+
+# a memory-mapped store: nothing is read until a score is asked for
+class PageRankStore(object):
+    def __init__(self, store_filename):
+        f = open(store_filename, 'rb')
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size < header_size:
+                raise IOError('pagerank store '+store_filename+' is truncated')
+            self.map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        (file_magic, self.item, self.N, self.base, self.capacity, self.max_score) = struct.unpack_from(header_format, self.map, 0)
+        if file_magic != magic or self.item not in ('d', 'f'):
+            raise IOError(store_filename+' is not a pagerank store')
+        self.item_format = '>'+self.item
+        self.item_size = struct.calcsize(self.item_format)
+        self.slots_start = header_size + self.N*self.item_size + (-(self.N*self.item_size) % 8)
+        self.bits = self.capacity.bit_length()-1
+        if size < self.slots_start + self.capacity*slot_size:
+            raise IOError('pagerank store '+store_filename+' is truncated')
+
+    def __len__(self):
+        return self.N
+
+    def __contains__(self, pageID):
+        return self.slot(pageID) is not None
+
+    # output: position of pageID's score in the scores, or None if the page isn't in the store
+    def slot(self, pageID):
+        if not self.capacity:
+            slot = pageID - self.base
+            return slot if 0 <= slot < self.N else None
+        mask = self.capacity-1
+        e = slot_hash(pageID, self.bits)
+        while True:
+            (entryID, slot) = struct.unpack_from(slot_format, self.map, self.slots_start + e*slot_size)
+            if slot == empty_slot:
+                return None
+            if entryID == pageID:
+                return slot
+            e = (e+1) & mask
+
+    # output: pagerank of the page, or default if it isn't in the store
+    def score(self, pageID, default=0.0):
+        slot = self.slot(pageID)
+        if slot is None:
+            return default
+        return struct.unpack_from(self.item_format, self.map, header_size + slot*self.item_size)[0]
+
+    get = score # so a store can stand in for the {pageID: pagerank} dictionary
+
+    # input:  pageIDs
+    # output: array('d') of their pageranks, default for those not in the store
+    def scores(self, pageIDs, default=0.0):
+        result = array('d', [default])*len(pageIDs)
+        slot = self.slot
+        unpack_from = struct.unpack_from
+        item_format = self.item_format
+        item_size = self.item_size
+        data = self.map
+        for (n, pageID) in enumerate(pageIDs):
+            s = slot(pageID)
+            if s is not None:
+                result[n] = unpack_from(item_format, data, header_size + s*item_size)[0]
+        return result
+
+    # output: array of every score, in the order the pages were found in the collection
+    def all_scores(self):
+        values = array(self.item)
+        values.fromstring(self.map[header_size:header_size + self.N*self.item_size])
+        if sys.byteorder == 'little':
+            values.byteswap()
+        return values
+
+    # output: the pageIDs, in the same order as all_scores
+    def pageIDs(self):
+        if not self.capacity:
+            return range(self.base, self.base + self.N)
+        id_list = [0]*self.N
+        for e in xrange(self.capacity):
+            (entryID, slot) = struct.unpack_from(slot_format, self.map, self.slots_start + e*slot_size)
+            if slot != empty_slot:
+                id_list[slot] = entryID
+        return id_list
+
+    def close(self):
+        self.map.close()
+
+
+# input:  filename of the collection
+# output: list of pageIDs in the order they're found -- the first <id> of each page is its pageID, as in pagerank.parse
+def read_id_list(collection_filename):
+    id_list = []
+    in_page = False
+    f = open(collection_filename, 'r')
+    for line in f:
+        if not in_page and '<id>' in line:
+            id_list.append(int(line.split('<id>', 1)[1].split('<', 1)[0]))
+            in_page = True
+        elif '</page>' in line:
+            in_page = False
+    f.close()
+    return id_list
+
+# input:  1) filename of pagerank text file, where the ith line is the pagerank of the ith page of the collection
+#         2) filename of the collection, for the pageID of each page
+# output: (list of pagerank values, list of pageIDs) aligned to each other
+def read_text(pagerank_filename, collection_filename):
+    id_list = read_id_list(collection_filename)
+    f = open(pagerank_filename, 'r')
+    pagerank = [float(line) for line in f]
+    f.close()
+    return (pagerank[:len(id_list)], id_list[:len(pagerank)])
+
+# writes the scores of a store out in the text format, the ith line being the pagerank of the ith page
+def export_text(store_filename, pagerank_filename):
+    store = PageRankStore(store_filename)
+    f = open(pagerank_filename, 'w')
+    for value in store.all_scores():
+        f.write(str(value)+'\n')
+    f.close()
+    store.close()
+    return
+
+if __name__ == '__main__':
+    if len(sys.argv) > 4 and sys.argv[1] == 'convert':
+        (pagerank, id_list) = read_text(sys.argv[2], sys.argv[3])
+        write_store(sys.argv[4], pagerank, id_list)
+    elif len(sys.argv) > 3 and sys.argv[1] == 'export':
+        export_text(sys.argv[2], sys.argv[3])
+    else:
+        sys.stderr.write('usage: python prstore.py convert <pagerank_filename> <collection_filename> <store_filename>\n'
+                         '       python prstore.py export <store_filename> <pagerank_filename>\n')
+        sys.exit(1)
@@ -0,0 +1,173 @@
+# dedup.py
+# near-duplicate detection: finds mirror pages and near-identical revisions in a collection before it's indexed,
+# clustered or classified, so each of them only counts once.
+#
+# Each page's tokens (searchio.tokenize, stopwords dropped) are cut into shingles -- every run of shingle_size tokens
+# -- and the page gets a MinHash signature of num_hashes values over those shingles.  The fraction of values two
+# signatures share estimates the Jaccard similarity of the two pages' shingles.  Rather than comparing every pair,
+# the signature is cut into bands of rows and a page is only compared with the earlier pages that share one of its
+# bands exactly (locality sensitive hashing) -- a page whose estimated similarity to one of them is at least threshold
+# is a duplicate of it.
+#
+# It's one streaming pass over the collection: a page is read, checked and either recorded as a duplicate or kept as a
+# canonical page, and only the canonical pages' signatures and bands stay in memory.  The first page seen of a group of
+# near-duplicates is the canonical page for all of them.
+#
+# Output: one line per duplicate page, <pageID> <pageID of its canonical page>, in collection order -- pages that
+# aren't in the file are canonical.
+#
+# Usage: python dedup.py <collection_filename> <stopwords_filename> <duplicates_filename> [threshold]
+import sys
+import itertools
+from array import array
+import searchio
+import instrument
+
+shingle_size = 5  # tokens per shingle
+num_hashes = 128  # values in a signature
+bands = 16        # bands the signature is cut into -- num_hashes/bands rows each.  With 8 rows, pages at 0.9
+                  # similarity share a band (and get compared) all but 1 time in 10000, at 0.8 95% of the time
+threshold = 0.9   # estimated similarity at or above which a page is a duplicate
+
+
+# input:  filename of the collection
+# output: generator of (pageID, text) for each page in turn -- the title and text, as vecrep.parse reads them, without
+#         holding more than one page at a time
+def pages(collection_filename):
+    f = open(collection_filename, 'r')
+    (pageID, title, text) = (None, None, None)
+    for line in f:
+        if text is None:
+            if pageID is None:
+                if '<id>' in line:
+                    pageID = int(line.split('<id>', 1)[1].split('<', 1)[0])
+                continue
+            if title is None:
+                if '<title>' in line:
+                    title = line.split('<title>', 1)[1].split('</title>', 1)[0]
+                continue
+            if not '<text>' in line:
+                continue
+            text = [title, '\n']
+            line = line.replace('<text>', '')
+        if '</text>' in line:
+            text.append(line.replace('</text>', ''))
+            yield (pageID, ''.join(text))
+            (pageID, title, text) = (None, None, None)
+        else:
+            text.append(line)
+    f.close()
+
+
+# keeps the signatures and bands of the canonical pages seen so far, and checks each new page against them
+class DuplicateFinder(object):
+    def __init__(self, threshold=threshold, num_hashes=num_hashes, bands=bands, shingle_size=shingle_size):
+        if num_hashes % bands:
+            raise ValueError('the signature must cut into bands evenly')
+        self.threshold = threshold
+        self.num_hashes = num_hashes
+        self.shingle_size = shingle_size
+        self.band_size = 4*(num_hashes//bands) # in bytes of the signature
+        self.signatures = {} # {canonical pageID: signature}
+        self.order = {} # {canonical pageID: how many canonical pages came before it}
+        self.buckets = [{} for b in range(bands)] # per band: {hash of the band of a signature: pageID, or list of pageIDs}
+        self.canonical_pages = 0
+        self.duplicates = 0
+
+    # output: estimated similarity of two signatures -- the fraction of their values that are the same
+    def similarity(self, signature1, signature2):
+        same = sum(1 for (x, y) in itertools.izip(array('I', signature1), array('I', signature2)) if x == y)
+        return float(same)/self.num_hashes
+
+    # input:  1) pageID
+    #         2) its tokens
+    # output: pageID of the canonical page it duplicates, or its own pageID if it isn't a duplicate
+    def add(self, pageID, tokens):
+        signature = searchio.minhash(tokens, self.shingle_size, self.num_hashes)
+        if signature is None: # nothing to compare -- an empty page isn't a duplicate of anything
+            self.canonical_pages += 1
+            return pageID
+        # bands are kept by their hash rather than their bytes to save memory -- two bands that only share a hash just
+        # make an extra candidate, which the comparison below turns away
+        keys = [hash(signature[b*self.band_size:(b+1)*self.band_size]) for b in range(len(self.buckets))]
+
+        # compare with each canonical page sharing a band, once, in the order they were seen -- the most similar wins,
+        # and of equally similar ones the earliest
+        candidates = set()
+        for (bucket, key) in itertools.izip(self.buckets, keys):
+            found = bucket.get(key)
+            if isinstance(found, list):
+                candidates.update(found)
+            elif found is not None:
+                candidates.add(found)
+        instrument.count('dedup_candidates', len(candidates))
+        best = None
+        best_similarity = self.threshold
+        for candidate in sorted(candidates, key=self.order.get):
+            s = self.similarity(signature, self.signatures[candidate])
+            if s > best_similarity or (best is None and s == best_similarity):
+                (best, best_similarity) = (candidate, s)
+        if best is not None:
+            self.duplicates += 1
+            return best
+
+        # a new canonical page
+        self.signatures[pageID] = signature
+        self.order[pageID] = self.canonical_pages
+        for (bucket, key) in itertools.izip(self.buckets, keys):
+            found = bucket.get(key)
+            if found is None:
+                bucket[key] = pageID
+            elif isinstance(found, list):
+                found.append(pageID)
+            else:
+                bucket[key] = [found, pageID]
+        self.canonical_pages += 1
+        return pageID
+
+
+# input:  1) filename of the collection
+#         2) set of stopwords
+#         3) filename to write the duplicates to
+#         4) estimated similarity at or above which a page is a duplicate
+# output: writes <pageID> <canonical pageID> for each duplicate page, and returns the DuplicateFinder
+def find_duplicates(collection_filename, stopwords, duplicates_filename, threshold=threshold):
+    finder = DuplicateFinder(threshold)
+    f = open(duplicates_filename, 'w')
+    for (pageID, text) in pages(collection_filename):
+        canonical = finder.add(pageID, searchio.tokenize(stopwords, text, False))
+        if canonical != pageID:
+            f.write(str(pageID)+' '+str(canonical)+'\n')
+        instrument.count('dedup_pages')
+    f.close()
+    instrument.count('dedup_duplicates', finder.duplicates)
+    return finder
+
+# input:  filename of duplicates written by find_duplicates, or None
+# output: dictionary {pageID: canonical pageID} of the duplicate pages -- empty if there's no file
+def read_duplicates(duplicates_filename):
+    duplicates = {}
+    if duplicates_filename is None:
+        return duplicates
+    f = open(duplicates_filename, 'r')
+    for line in f:
+        (pageID, canonical) = line.split()
+        duplicates[int(pageID)] = int(canonical)
+    f.close()
+    return duplicates
+
+# input: command line arguments (see the top of the file)
+def main(collection_filename, stopwords_filename, duplicates_filename, similarity_threshold=threshold):
+    f = open(stopwords_filename, 'r')
+    stopwords = set(line.rstrip('\n') for line in f)
+    f.close()
+    with instrument.stage('dedup'):
+        find_duplicates(collection_filename, stopwords, duplicates_filename, float(similarity_threshold))
+    instrument.report()
+    return
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        sys.stderr.write('usage: python dedup.py <collection_filename> <stopwords_filename> <duplicates_filename> [threshold]\n')
+        sys.exit(1)
+    main(*sys.argv[1:5])
@@ -1,5 +1,8 @@
 # k-means algorithm implementation
 import sys
+import instrument
+import similarity
+import dedup
 from vecrep import main as vecrep, compute_norm, normalize
 
 k = 11 # algorithm to be implemented with 11 clusters
@@ -32,33 +35,45 @@ Output: Mi clusters and their means.
 #		 2) <input_filename> -- training file to read from where each line has a pageID to assign to a cluster
 # 		 3) <clusterKM_filename> -- file to write to 
 #		 4) <features_filename> -- filename of features to read from -- pages will be represented as vectors in this feature space
+#		 5) <similarity_filename> -- file to write the "more like this" index to, from the final means (optional, see similarity.py)
+#		 6) <duplicates_filename> -- near-duplicate pages found by dedup.py, left out of the clustering (optional, --duplicates <file> on the command line)
 # output: writes to <clusterKM_filename> in format: ith line of file: <ith pageID of training file> <id of cluster ith pageID assigned to>
-def main(collection_filename, input_filename, clusterKM_filename, features_filename):
+def main(collection_filename, input_filename, clusterKM_filename, features_filename, similarity_filename=None, duplicates_filename=None):
+	# duplicates:= {pageID: canonical pageID} -- each duplicate just goes in the cluster of its canonical page
+	duplicates = dedup.read_duplicates(duplicates_filename)
 	# obtain pages as vectors and F:= len(features_dict), ie gives range to iterate over for feature-keys
-	X, F = vecrep(collection_filename, features_filename)
-	print('created X')
+	with instrument.stage('vecrep'):
+		X, F = vecrep(collection_filename, features_filename, duplicates)
 	# create initial cluster means u_i for 0<=i<k
-	u_dict = initialize_means1(X)
-	print('created u_dict')
+	with instrument.stage('initialize_means'):
+		u_dict = initialize_means1(X)
 	# compute initial max_delta as argmax ||u_i||
 	max_delta = 1
 	# initialize empty M clusters of form M_dict:= {i:set(pageID for x in cluster i) for i in range(k)} as empty dictionary at first
 	M_dict = {}
 	# run algorithm until max_delta < target e (ie, algorithm stabilized enough)
-	i = 0 #&&&&&&& take out
-	while max_delta >= e:
-		print('iteration: '+str(i))
-		# let last M_dict get garbage collected
-		M_dict = initialize_clusters()
-		# at each iteration, recomputes max_delta, M_dict, u_dict
-		(max_delta, M_dict, u_dict) = recluster(u_dict, M_dict, X)
-		print('iteration: '+str(i)+', max_delta: '+str(max_delta))
-		i += 1
+	i = 0
+	with instrument.stage('recluster'):
+		while max_delta >= e:
+			# let last M_dict get garbage collected
+			M_dict = initialize_clusters()
+			# at each iteration, recomputes max_delta, M_dict, u_dict
+			(max_delta, M_dict, u_dict) = recluster(u_dict, M_dict, X)
+			instrument.progress('kmeans_iteration', iteration=i, max_delta=max_delta)
+			i += 1
 	# compute inverse of M, ie, dictionary mapping {pageID: cluster_id}
 	M_inverse = compute_M_inverse(M_dict)
+	for (pageID, canonical) in duplicates.items():
+		if canonical in M_inverse:
+			M_inverse[pageID] = M_inverse[canonical]
 	# print results to file in same order of pageIDs in input_filename
-	print_clusters(M_inverse, input_filename, clusterKM_filename)
-	print('done')
+	with instrument.stage('print_clusters'):
+		print_clusters(M_inverse, input_filename, clusterKM_filename)
+	# keep the means around as an inverted file for similarity search, rather than throwing them away
+	if similarity_filename is not None:
+		with instrument.stage('similarity_index'):
+			similarity.write_index(similarity_filename, similarity.build(u_dict, X))
+	instrument.report()
 	return
 
 # iterative part of the k-means algorithm that recomputes max_delta, M_dict, u_dict
@@ -69,10 +84,10 @@ def main(collection_filename, input_filename, clusterKM_filename, features_filen
 def recluster(u_dict, M_dict, X):
 	# for each x in X, find j = argmin||u_j - x|| and add x to M_j
 	for pageID in X:
-		if pageID % 100 == 0:
-			print('on pageID: '+str(pageID))
 		j = best_cluster(u_dict, X[pageID]) 
 		M_dict[j].add(pageID)
+	instrument.count('pages_assigned', len(X))
+	instrument.count('distance_evaluations', len(X)*len(u_dict))
 	# compute new u_i's as mean of points in M_i and along the way compute max delta
 	max_delta = 0
 	for i in range(k):
@@ -266,4 +281,11 @@ def compute_mean(X, pageID_set):
 
 
 
-main(sys.argv[1], sys.argv[2],sys.argv[3], sys.argv[4])
\ No newline at end of file
+if __name__ == '__main__':
+	argv = sys.argv[1:]
+	duplicates_filename = None
+	if '--duplicates' in argv:
+		i = argv.index('--duplicates')
+		duplicates_filename = argv[i+1]
+		del argv[i:i+2]
+	main(argv[0], argv[1], argv[2], argv[3], (argv[4:5] or [None])[0], duplicates_filename)
\ No newline at end of file
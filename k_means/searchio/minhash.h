@@ -0,0 +1,23 @@
+/*
+    MinHash
+    MinHash signatures of the token shingles of a page, for finding near-duplicate pages.
+*/
+
+#ifndef __MINHASH_H__
+#define __MINHASH_H__
+
+#include <stddef.h>
+#include <stdint.h>
+
+/* Most hash functions in a signature */
+#define MINHASH_MAX_HASHES 1024
+
+/* Hash of one token */
+uint64_t minhash_token(const char *token, size_t length);
+
+/* Signature of a page from the hashes of its tokens: for each of numHashes hash functions, the least value it takes
+   over the page's shingles (every run of shingleSize tokens, or all of them if there are fewer) -- returns 0, or -1 if
+   there are no tokens to make shingles of */
+int minhash_signature(const uint64_t *tokenHashes, size_t numTokens, size_t shingleSize, uint32_t *signature, size_t numHashes);
+
+#endif
@@ -0,0 +1,508 @@
+/*
+    Postings
+    A compact, array-backed postings list for the CS158 Search Engine index.
+
+    A term's postings are decoded straight into contiguous typed arrays -- page IDs, wf values, and every
+    position of every posting back to back -- in a single allocation.  The arrays are handed out as
+    PostingsArray views that support the buffer protocol, so they can be used without copying (memoryview,
+    numpy.frombuffer, ...).  Indexing a Postings object still gives the old [pageID, wf, [positions]]
+    lists, built one at a time on demand, and slicing it gives a list of them.  A PostingsArray slice is
+    another view of the same memory, unless it has a step, which gives a list.
+*/
+
+#include "postings.h"
+#include <arpa/inet.h>
+#include "searchio.h"
+
+/* Object structs */
+struct Postings_s {
+    PyObject_HEAD
+    Py_ssize_t length;              // number of postings
+    Py_ssize_t numPositions;        // positions over all the postings
+    double *wf;                     // length entries
+    uint32_t *pageIDs;              // length entries
+    uint32_t *positionOffsets;      // length+1 entries: posting i's positions are positions[positionOffsets[i]:positionOffsets[i+1]]
+    uint32_t *positions;            // numPositions entries
+    void *block;                    // the one allocation all of the above live in
+    int profile;                    // what was decoded: SEARCHIO_PROFILE_DOCS (wf all 1), _WF (no positions) or _POSITIONS
+};
+
+struct PostingsArray_s {
+    PyObject_HEAD
+    PyObject *owner;                // keeps the memory alive
+    const void *data;
+    Py_ssize_t length;
+    Py_ssize_t itemSize;
+    char *format;                   // struct-module format of an item: "I" or "d"
+};
+
+/* Helpers */
+static PyObject *PostingsArray_new(PyObject *owner, const void *data, Py_ssize_t length, Py_ssize_t itemSize, char *format);
+static PyObject *Postings_GetPageIDs(PyObject *o, void *closure);
+static PyObject *Postings_GetWf(PyObject *o, void *closure);
+static PyObject *Postings_GetPositions(PyObject *o, void *closure);
+static PyObject *Postings_GetPositionOffsets(PyObject *o, void *closure);
+static PyObject *Postings_GetProfile(PyObject *o, void *closure);
+static PyObject *Postings_PositionsAt(PyObject *o, PyObject *args);
+static Py_ssize_t PostingsArray_ReadBuffer(PyObject *o, Py_ssize_t segment, void **ptr);
+static Py_ssize_t PostingsArray_SegCount(PyObject *o, Py_ssize_t *lenp);
+static int PostingsArray_GetBuffer(PyObject *o, Py_buffer *view, int flags);
+
+/* Type objects */
+static PySequenceMethods PostingsSequenceMethods = {
+    &Postings_Length,
+    NULL,
+    NULL,
+    &Postings_GetItem,
+    NULL,
+    NULL,
+    NULL,
+    NULL,
+    NULL,
+    NULL
+};
+
+static PyMappingMethods PostingsMappingMethods = {
+    &Postings_Length,                           /* mp_length */
+    &Postings_Subscript,                        /* mp_subscript */
+    NULL,                                       /* mp_ass_subscript */
+};
+
+static PyGetSetDef PostingsGetSet[] = {
+    {"pageIDs", &Postings_GetPageIDs, NULL, "page ID of each posting, as a buffer of unsigned ints", NULL},
+    {"wf", &Postings_GetWf, NULL, "wf of each posting, as a buffer of doubles", NULL},
+    {"positions", &Postings_GetPositions, NULL, "positions of every posting back to back, as a buffer of unsigned ints", NULL},
+    {"positionOffsets", &Postings_GetPositionOffsets, NULL, "where each posting's positions start in positions (plus the end), as a buffer of unsigned ints", NULL},
+    {"profile", &Postings_GetProfile, NULL, "what the postings hold: PROFILE_DOCS (every wf is 1), PROFILE_WF (no positions) or PROFILE_POSITIONS", NULL},
+    {NULL, NULL, NULL, NULL, NULL}
+};
+
+static PyMethodDef PostingsMethods[] = {
+    {"positionsAt", &Postings_PositionsAt, METH_VARARGS, "positions of the ith posting, as a buffer of unsigned ints"},
+    {NULL, NULL, 0, NULL}
+};
+
+PyTypeObject PostingsType = {
+    PyObject_HEAD_INIT(NULL)
+    0,                                          /*ob_size*/
+    "searchio.Postings",                        /*tp_name*/
+    sizeof(Postings),                           /*tp_basicsize*/
+    0,                                          /*tp_itemsize*/
+    (destructor)&Postings_dealloc,              /*tp_dealloc*/
+    0,                                          /*tp_print*/
+    0,                                          /*tp_getattr*/
+    0,                                          /*tp_setattr*/
+    0,                                          /*tp_compare*/
+    0,                                          /*tp_repr*/
+    0,                                          /*tp_as_number*/
+    &PostingsSequenceMethods,                   /*tp_as_sequence*/
+    &PostingsMappingMethods,                    /*tp_as_mapping*/
+    0,                                          /*tp_hash */
+    0,                                          /*tp_call*/
+    0,                                          /*tp_str*/
+    0,                                          /*tp_getattro*/
+    0,                                          /*tp_setattro*/
+    0,                                          /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT,                         /*tp_flags*/
+    "Postings objects",                         /* tp_doc */
+    0,                                          /* tp_traverse */
+    0,                                          /* tp_clear */
+    0,                                          /* tp_richcompare */
+    0,                                          /* tp_weaklistoffset */
+    0,                                          /* tp_iter */
+    0,                                          /* tp_iternext */
+    PostingsMethods,                            /* tp_methods */
+    0,                                          /* tp_members */
+    PostingsGetSet,                             /* tp_getset */
+};
+
+static PySequenceMethods PostingsArraySequenceMethods = {
+    &PostingsArray_Length,
+    NULL,
+    NULL,
+    &PostingsArray_GetItem,
+    NULL,
+    NULL,
+    NULL,
+    NULL,
+    NULL,
+    NULL
+};
+
+static PyMappingMethods PostingsArrayMappingMethods = {
+    &PostingsArray_Length,                      /* mp_length */
+    &PostingsArray_Subscript,                   /* mp_subscript */
+    NULL,                                       /* mp_ass_subscript */
+};
+
+static PyBufferProcs PostingsArrayBufferProcs = {
+    &PostingsArray_ReadBuffer,                  /* bf_getreadbuffer */
+    NULL,                                       /* bf_getwritebuffer */
+    &PostingsArray_SegCount,                    /* bf_getsegcount */
+    NULL,                                       /* bf_getcharbuffer */
+    &PostingsArray_GetBuffer,                   /* bf_getbuffer */
+    NULL,                                       /* bf_releasebuffer */
+};
+
+PyTypeObject PostingsArrayType = {
+    PyObject_HEAD_INIT(NULL)
+    0,                                          /*ob_size*/
+    "searchio.PostingsArray",                   /*tp_name*/
+    sizeof(PostingsArray),                      /*tp_basicsize*/
+    0,                                          /*tp_itemsize*/
+    (destructor)&PostingsArray_dealloc,         /*tp_dealloc*/
+    0,                                          /*tp_print*/
+    0,                                          /*tp_getattr*/
+    0,                                          /*tp_setattr*/
+    0,                                          /*tp_compare*/
+    0,                                          /*tp_repr*/
+    0,                                          /*tp_as_number*/
+    &PostingsArraySequenceMethods,              /*tp_as_sequence*/
+    &PostingsArrayMappingMethods,               /*tp_as_mapping*/
+    0,                                          /*tp_hash */
+    0,                                          /*tp_call*/
+    0,                                          /*tp_str*/
+    0,                                          /*tp_getattro*/
+    0,                                          /*tp_setattro*/
+    &PostingsArrayBufferProcs,                  /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_NEWBUFFER, /*tp_flags*/
+    "read-only views of the arrays inside a Postings object", /* tp_doc */
+};
+
+/* Decoding -- postings from an index of the given profile, skipping the positions unless withPositions is set */
+PyObject *Postings_decode(const char *data, size_t size, uint32_t numPostings, int profile, int withPositions)
+{
+    size_t postingSize = SEARCHIO_POSTING_SIZE(profile);
+    int hasPositions = (profile == SEARCHIO_PROFILE_POSITIONS);
+
+    /* first pass: count the positions, making sure every posting fits in the data -- without positions they're all the same size */
+    size_t offset = 0;
+    size_t numPositions = 0;
+    uint32_t i;
+    if (!hasPositions)
+        i = (size / postingSize < numPostings) ? 0 : numPostings;
+    else
+    {
+        for (i = 0; i < numPostings; i++)
+        {
+            searchio_index_posting_t posting;
+            if (size - offset < sizeof(posting))
+                break;
+            memcpy(&posting, data + offset, sizeof(posting));
+            size_t n = ntohl(posting.numPositions);
+            if ((size - offset - sizeof(posting)) / sizeof(uint32_t) < n)
+                break;
+
+            numPositions += n;
+            offset += sizeof(posting) + (n * sizeof(uint32_t));
+        }
+    }
+    if (i < numPostings)
+    {
+        PyErr_SetString(PyExc_IOError, "postings list runs past the end of the index");
+        return NULL;
+    }
+    if (!withPositions)
+        numPositions = 0;
+
+    /* allocate the object and all of its arrays in one go -- the doubles first, to keep them aligned */
+    Postings *self = PyObject_New(Postings, &PostingsType);
+    if (self == NULL)
+        return NULL;
+
+    self->length = numPostings;
+    self->numPositions = numPositions;
+    self->profile = (hasPositions && !withPositions) ? SEARCHIO_PROFILE_WF : profile;
+    self->block = malloc((numPostings * sizeof(double)) + ((2 * (size_t)numPostings + 1 + numPositions) * sizeof(uint32_t)));
+    if (self->block == NULL)
+    {
+        PyObject_Del(self);
+        return PyErr_NoMemory();
+    }
+    self->wf = (double *)self->block;
+    self->pageIDs = (uint32_t *)(self->wf + numPostings);
+    self->positionOffsets = self->pageIDs + numPostings;
+    self->positions = self->positionOffsets + numPostings + 1;
+
+    /* second pass: decode -- pages of a docs-only index all get a wf of 1 */
+    offset = 0;
+    uint32_t positionIndex = 0;
+    for (i = 0; i < numPostings; i++)
+    {
+        searchio_index_posting_t posting;
+        memcpy(&posting, data + offset, postingSize);
+        offset += postingSize;
+
+        self->pageIDs[i] = ntohl(posting.pageID);
+        self->wf[i] = (profile == SEARCHIO_PROFILE_DOCS) ? 1.0 : (double)ntohl(posting.wf) / (double)SEARCHIO_WF_SCALE;
+        self->positionOffsets[i] = positionIndex;
+        if (!hasPositions)
+            continue;
+
+        uint32_t n = ntohl(posting.numPositions);
+        if (!withPositions)
+        {
+            offset += n * sizeof(uint32_t);
+            continue;
+        }
+        uint32_t j;
+        for (j = 0; j < n; j++)
+        {
+            uint32_t position;
+            memcpy(&position, data + offset, sizeof(position));
+            self->positions[positionIndex++] = ntohl(position);
+            offset += sizeof(position);
+        }
+    }
+    self->positionOffsets[numPostings] = positionIndex;
+
+    return (PyObject *)self;
+}
+
+/* Encoding -- the arrays stay owned by the object, so it has to be kept alive while they're used; returns the profile they hold */
+int Postings_arrays(PyObject *o, uint32_t *length, const uint32_t **pageIDs, const double **wf, const uint32_t **positionOffsets, const uint32_t **positions)
+{
+    Postings *self = (Postings *)o;
+    *length = (uint32_t)self->length;
+    *pageIDs = self->pageIDs;
+    *wf = self->wf;
+    *positionOffsets = self->positionOffsets;
+    *positions = self->positions;
+    return self->profile;
+}
+
+/* Deallocators */
+void Postings_dealloc(Postings *self)
+{
+    free(self->block);
+    PyObject_Del(self);
+}
+void PostingsArray_dealloc(PostingsArray *self)
+{
+    Py_XDECREF(self->owner);
+    PyObject_Del(self);
+}
+
+/* Sequence methods */
+Py_ssize_t Postings_Length(PyObject *o)
+{
+    return ((Postings *)o)->length;
+}
+PyObject *Postings_GetItem(PyObject *o, Py_ssize_t i)
+{
+    Postings *self = (Postings *)o;
+    if (i < 0 || i >= self->length)
+    {
+        PyErr_SetString(PyExc_IndexError, "postings index out of range");
+        return NULL;
+    }
+
+    /* build the positions list */
+    uint32_t start = self->positionOffsets[i];
+    uint32_t end = self->positionOffsets[i + 1];
+    PyObject *positions = PyList_New(end - start);
+    if (positions == NULL)
+        return NULL;
+    uint32_t j;
+    for (j = start; j < end; j++)
+    {
+        PyObject *position = PyInt_FromLong((long)self->positions[j]);
+        if (position == NULL)
+        {
+            Py_DECREF(positions);
+            return NULL;
+        }
+        PyList_SET_ITEM(positions, j - start, position);
+    }
+
+    /* and the [pageID, wf, [positions]] entry around it */
+    PyObject *pageID = PyInt_FromLong((long)self->pageIDs[i]);
+    PyObject *wf = PyFloat_FromDouble(self->wf[i]);
+    PyObject *entry = (pageID != NULL && wf != NULL) ? PyList_New(3) : NULL;
+    if (entry == NULL)
+    {
+        Py_XDECREF(pageID);
+        Py_XDECREF(wf);
+        Py_DECREF(positions);
+        return NULL;
+    }
+    PyList_SET_ITEM(entry, 0, pageID);
+    PyList_SET_ITEM(entry, 1, wf);
+    PyList_SET_ITEM(entry, 2, positions);
+    return entry;
+}
+Py_ssize_t PostingsArray_Length(PyObject *o)
+{
+    return ((PostingsArray *)o)->length;
+}
+PyObject *PostingsArray_GetItem(PyObject *o, Py_ssize_t i)
+{
+    PostingsArray *self = (PostingsArray *)o;
+    if (i < 0 || i >= self->length)
+    {
+        PyErr_SetString(PyExc_IndexError, "postings array index out of range");
+        return NULL;
+    }
+
+    if (self->format[0] == 'd')
+        return PyFloat_FromDouble(((const double *)self->data)[i]);
+    return PyInt_FromLong((long)((const uint32_t *)self->data)[i]);
+}
+
+/* Mapping methods -- indexing with an int (negative counts from the end) or a slice */
+static int Subscript_indices(PyObject *o, PyObject *key, Py_ssize_t length, Py_ssize_t *start, Py_ssize_t *step, Py_ssize_t *sliceLength)
+{
+    /* 0 with *start set for an index, 1 with all three set for a slice, -1 with an exception set otherwise */
+    if (PyIndex_Check(key))
+    {
+        *start = PyNumber_AsSsize_t(key, PyExc_IndexError);
+        if (*start == -1 && PyErr_Occurred())
+            return -1;
+        if (*start < 0)
+            *start += length;
+        return 0;
+    }
+    if (!PySlice_Check(key))
+    {
+        PyErr_Format(PyExc_TypeError, "%.200s indices must be integers or slices, not %.200s", Py_TYPE(o)->tp_name, Py_TYPE(key)->tp_name);
+        return -1;
+    }
+    Py_ssize_t stop;
+    if (PySlice_GetIndicesEx((PySliceObject *)key, length, start, &stop, step, sliceLength) < 0)
+        return -1;
+    return 1;
+}
+static PyObject *Subscript_list(PyObject *o, PyObject *(*getItem)(PyObject *, Py_ssize_t), Py_ssize_t start, Py_ssize_t step, Py_ssize_t sliceLength)
+{
+    PyObject *result = PyList_New(sliceLength);
+    if (result == NULL)
+        return NULL;
+    Py_ssize_t k;
+    for (k = 0; k < sliceLength; k++)
+    {
+        PyObject *item = getItem(o, start + k*step);
+        if (item == NULL)
+        {
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyList_SET_ITEM(result, k, item);
+    }
+    return result;
+}
+PyObject *Postings_Subscript(PyObject *o, PyObject *key)
+{
+    Py_ssize_t start, step, sliceLength;
+    int kind = Subscript_indices(o, key, ((Postings *)o)->length, &start, &step, &sliceLength);
+    if (kind < 0)
+        return NULL;
+    if (kind == 0)
+        return Postings_GetItem(o, start);
+
+    return Subscript_list(o, &Postings_GetItem, start, step, sliceLength);
+}
+PyObject *PostingsArray_Subscript(PyObject *o, PyObject *key)
+{
+    PostingsArray *self = (PostingsArray *)o;
+    Py_ssize_t start, step, sliceLength;
+    int kind = Subscript_indices(o, key, self->length, &start, &step, &sliceLength);
+    if (kind < 0)
+        return NULL;
+    if (kind == 0)
+        return PostingsArray_GetItem(o, start);
+
+    /* a contiguous slice is a view of the same memory, kept alive by the same owner */
+    if (step == 1)
+        return PostingsArray_new(self->owner, (const char *)self->data + start*self->itemSize, sliceLength, self->itemSize, self->format);
+    return Subscript_list(o, &PostingsArray_GetItem, start, step, sliceLength);
+}
+
+/* Array views */
+static PyObject *PostingsArray_new(PyObject *owner, const void *data, Py_ssize_t length, Py_ssize_t itemSize, char *format)
+{
+    PostingsArray *self = PyObject_New(PostingsArray, &PostingsArrayType);
+    if (self == NULL)
+        return NULL;
+
+    Py_INCREF(owner);
+    self->owner = owner;
+    self->data = data;
+    self->length = length;
+    self->itemSize = itemSize;
+    self->format = format;
+    return (PyObject *)self;
+}
+static PyObject *Postings_GetPageIDs(PyObject *o, void *closure)
+{
+    Postings *self = (Postings *)o;
+    return PostingsArray_new(o, self->pageIDs, self->length, sizeof(uint32_t), "I");
+}
+static PyObject *Postings_GetWf(PyObject *o, void *closure)
+{
+    Postings *self = (Postings *)o;
+    return PostingsArray_new(o, self->wf, self->length, sizeof(double), "d");
+}
+static PyObject *Postings_GetPositions(PyObject *o, void *closure)
+{
+    Postings *self = (Postings *)o;
+    return PostingsArray_new(o, self->positions, self->numPositions, sizeof(uint32_t), "I");
+}
+static PyObject *Postings_GetPositionOffsets(PyObject *o, void *closure)
+{
+    Postings *self = (Postings *)o;
+    return PostingsArray_new(o, self->positionOffsets, self->length + 1, sizeof(uint32_t), "I");
+}
+static PyObject *Postings_GetProfile(PyObject *o, void *closure)
+{
+    return PyInt_FromLong(((Postings *)o)->profile);
+}
+static PyObject *Postings_PositionsAt(PyObject *o, PyObject *args)
+{
+    Postings *self = (Postings *)o;
+    Py_ssize_t i = 0;
+    if (!PyArg_ParseTuple(args, "n", &i))
+        return NULL;
+    if (i < 0)
+        i += self->length;
+    if (i < 0 || i >= self->length)
+    {
+        PyErr_SetString(PyExc_IndexError, "postings index out of range");
+        return NULL;
+    }
+
+    uint32_t start = self->positionOffsets[i];
+    return PostingsArray_new(o, self->positions + start, self->positionOffsets[i + 1] - start, sizeof(uint32_t), "I");
+}
+
+/* Buffer protocol -- both the old (for buffer() and friends) and the new (for memoryview and numpy) */
+static Py_ssize_t PostingsArray_ReadBuffer(PyObject *o, Py_ssize_t segment, void **ptr)
+{
+    PostingsArray *self = (PostingsArray *)o;
+    if (segment != 0)
+    {
+        PyErr_SetString(PyExc_SystemError, "accessing non-existent postings array segment");
+        return -1;
+    }
+    *ptr = (void *)self->data;
+    return self->length * self->itemSize;
+}
+static Py_ssize_t PostingsArray_SegCount(PyObject *o, Py_ssize_t *lenp)
+{
+    PostingsArray *self = (PostingsArray *)o;
+    if (lenp != NULL)
+        *lenp = self->length * self->itemSize;
+    return 1;
+}
+static int PostingsArray_GetBuffer(PyObject *o, Py_buffer *view, int flags)
+{
+    PostingsArray *self = (PostingsArray *)o;
+    if (PyBuffer_FillInfo(view, o, (void *)self->data, self->length * self->itemSize, 1, flags) != 0)
+        return -1;
+
+    /* describe the items, not just the bytes */
+    view->itemsize = self->itemSize;
+    view->format = ((flags & PyBUF_FORMAT) == PyBUF_FORMAT) ? self->format : NULL;
+    view->shape = ((flags & PyBUF_ND) == PyBUF_ND) ? &(self->length) : NULL;
+    view->strides = ((flags & PyBUF_STRIDES) == PyBUF_STRIDES) ? &(self->itemSize) : NULL;
+    return 0;
+}
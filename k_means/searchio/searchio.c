@@ -4,11 +4,15 @@
 */
 
 #include "searchio.h"
+#include <errno.h>
 #include <fcntl.h>
 #include <sys/stat.h>
 #include <arpa/inet.h>
 #include "stemmer.h"
 #include "sparseindex.h"
+#include "postings.h"
+#include "indexwriter.h"
+#include "minhash.h"
 
 
 /****************** ADDING C IMPLEMENTATION OF **********
@@ -32,14 +36,18 @@ static PyObject *searchio_tokenize(PyObject *self, PyObject *args);
 static PyObject *searchio_createIndex(PyObject *self, PyObject *args);
 static PyObject *searchio_loadIndex(PyObject *self, PyObject *args);
 static PyObject *searchio_loadSparseIndex(PyObject *self, PyObject *args);
+static PyObject *searchio_indexProfile(PyObject *self, PyObject *args);
+static PyObject *searchio_minhash(PyObject *self, PyObject *args);
 
 /* Module method table */
 static PyMethodDef SearchioMethods[] = {
     {"difference_normsq", &searchio_difference_normsq, METH_VARARGS, "helper for testing -- finds the norm of the difference of two vectors"},
     {"tokenize", &searchio_tokenize, METH_VARARGS, "Obtain a viable list of tokens from a string."},
-    {"createIndex", &searchio_createIndex, METH_VARARGS, "Create an on-disk representation of the provided index."},
-    {"loadIndex", &searchio_loadIndex, METH_VARARGS, "Load an index from disk."},
-    {"loadSparseIndex", &searchio_loadSparseIndex, METH_VARARGS, "Load only the terms of an index from disk, and return an object that reads postings lists on demand."},
+    {"createIndex", &searchio_createIndex, METH_VARARGS, "Create an on-disk representation of the provided index (a dictionary {term: [df, postings]}, where postings is a list of [pageID, wf, [positions]] or a Postings object), optionally encoding it on a given number of threads, and keeping only what a given profile (PROFILE_DOCS, PROFILE_WF or PROFILE_POSITIONS, the default) holds."},
+    {"loadIndex", &searchio_loadIndex, METH_VARARGS, "Load an index from disk -- skipping the positions if withPositions is false."},
+    {"loadSparseIndex", &searchio_loadSparseIndex, METH_VARARGS, "Load only the terms of an index from disk, and return an object that reads postings lists on demand -- skipping the positions if withPositions is false."},
+    {"indexProfile", &searchio_indexProfile, METH_VARARGS, "Find out what the postings of an index on disk hold: PROFILE_DOCS, PROFILE_WF or PROFILE_POSITIONS."},
+    {"minhash", &searchio_minhash, METH_VARARGS, "Find the MinHash signature of a list of tokens: the least value of each of a number of hash functions over its shingles (runs of a given number of tokens), as a string of big-endian unsigned ints -- or None if there are no tokens."},
     {NULL, NULL, 0, NULL}
 };
 
@@ -54,12 +62,27 @@ PyMODINIT_FUNC initsearchio(void)
     if (PyType_Ready(&SparseIndexType) < 0)
         return;
     
+    /* initialize the Postings types -- these only come out of the index, so they can't be created from Python */
+    if (PyType_Ready(&PostingsType) < 0 || PyType_Ready(&PostingsArrayType) < 0)
+        return;
+    
     /* initialize the module */
     PyObject *m = Py_InitModule("searchio", SearchioMethods);
     
+    /* the index profiles */
+    PyModule_AddIntConstant(m, "PROFILE_DOCS", SEARCHIO_PROFILE_DOCS);
+    PyModule_AddIntConstant(m, "PROFILE_WF", SEARCHIO_PROFILE_WF);
+    PyModule_AddIntConstant(m, "PROFILE_POSITIONS", SEARCHIO_PROFILE_POSITIONS);
+    
     /* register the SparseIndex type */
     Py_INCREF(&SparseIndexType);
     PyModule_AddObject(m, "SparseIndex", (PyObject *)&SparseIndexType);
+    
+    /* register the Postings types */
+    Py_INCREF(&PostingsType);
+    PyModule_AddObject(m, "Postings", (PyObject *)&PostingsType);
+    Py_INCREF(&PostingsArrayType);
+    PyModule_AddObject(m, "PostingsArray", (PyObject *)&PostingsArrayType);
 }
 /****************** ADDING C IMPLEMENTATION OF **********
  TODO: 
@@ -186,8 +209,10 @@ static PyObject *searchio_tokenize(PyObject *self, PyObject *args)
                 str[newEnd + 1] = '\0';
             }
             
-            /* add it to the list */
-            PyList_Append(result, PyString_FromString(str));
+            /* add it to the list -- which takes its own reference */
+            PyObject *token = PyString_FromString(str);
+            PyList_Append(result, token);
+            Py_DECREF(token);
         }
         
         Py_DECREF(pystr);
@@ -198,145 +223,56 @@ static PyObject *searchio_tokenize(PyObject *self, PyObject *args)
 }
 static PyObject *searchio_createIndex(PyObject *self, PyObject *args)
 {
-    /* grab the filename, number of documents, and our index */
+    /* grab the filename, number of documents, and our index -- plus, optionally, how many threads to encode it with and its profile */
     const char *filename = NULL;
     uint32_t numDocuments = 0;
     PyObject *index = NULL;
+    int threads = 0;
+    int profile = SEARCHIO_PROFILE_POSITIONS;
     
-    if (!PyArg_ParseTuple(args, "sIO", &filename, &numDocuments, &index))
+    if (!PyArg_ParseTuple(args, "sIO|ii", &filename, &numDocuments, &index, &threads, &profile))
         return NULL;
-    
-    /* open the index file */
-    int fd = open(filename, O_WRONLY|O_CREAT|O_TRUNC);
-    if (fd == -1)
-        return PyErr_SetFromErrno(PyExc_IOError);
-    
-    fchmod(fd, S_IRUSR|S_IWUSR|S_IRGRP|S_IROTH);
-    size_t totalWritten = 0;
-    
-    /* get the number of terms in the index */
-    Py_ssize_t numTermsPy = PyDict_Size(index);
-    uint32_t numTerms = 0;
-    if (numTermsPy > 0 && numTermsPy < UINT32_MAX)
-        numTerms = (uint32_t)numTermsPy;
-    else
+    if (profile < SEARCHIO_PROFILE_DOCS || profile > SEARCHIO_PROFILE_POSITIONS)
     {
-        PyErr_SetString(PyExc_MemoryError, "the number of terms is greater than UINT32_MAX (or less than 0)");
+        PyErr_SetString(PyExc_ValueError, "the profile must be PROFILE_DOCS, PROFILE_WF or PROFILE_POSITIONS");
         return NULL;
     }
     
-    /* write a document header */
-    searchio_index_header_t header = {htonl(numDocuments), htonl(numTerms), 0};
-    totalWritten += write(fd, (void *)&header, sizeof(header));
-    
-    /* loop once over index to write term entries */
-    PyObject *indexKeys = PyDict_Keys(index);
-    Py_ssize_t indexKeyLen = PyList_Size(indexKeys);
-    
-    uint32_t postingsOffset = 0;
-    uint32_t keyIdx;
-    for (keyIdx = 0; keyIdx < indexKeyLen; keyIdx++)
+    /* pull the terms and postings out of the index while we still need the GIL */
+    indexwriter_t writer;
+    if (indexwriter_prepare(&writer, numDocuments, index, profile) == -1)
     {
-        PyObject *key = PyList_GetItem(indexKeys, keyIdx);
-        PyObject *value = PyDict_GetItem(index, key);
-        
-        /* create a term entry */
-        searchio_index_term_t term;
-        term.postingsOffset = htonl(postingsOffset);
-        
-        /* pull out the term, its df, and a reference to the postings list */
-        const char *termStr = PyString_AS_STRING(key);
-        PyObject *pydf = PyList_GetItem(value, 0);
-        PyObject *postings = PyList_GetItem(value, 1);
-        Py_ssize_t postingsLen = PyList_Size(postings);
-        
-        /* fill in the header */
-        size_t termLen = strlen(termStr);
-        term.df = htonl(PyInt_AsUnsignedLongMask(pydf));
-        term.numDocumentsInPostings = htonl((uint32_t)postingsLen);
-        term.termLength = htons((uint16_t)termLen);
-        
-        /* write out the header, and its term */
-        totalWritten += write(fd, (void *)&term, sizeof(term));
-        totalWritten += write(fd, termStr, termLen);
-        
-        /* determine the on-disk size of the posting list */
-        uint32_t totalSize = 0;
-        Py_ssize_t i;
-        for (i = 0; i < postingsLen; i++)
-        {
-            PyObject *entryList = PyList_GetItem(postings, i);
-            PyObject *positions = PyList_GetItem(entryList, 2);
-            Py_ssize_t positionLen = PyList_Size(positions);
-            
-            /* on-disk size is size of a posting struct, plus sizeof(uint32_t) * positions */
-            totalSize += (uint32_t)sizeof(searchio_index_posting_t) + (uint32_t)(positionLen * sizeof(uint32_t));
-        }
-        
-        /* increment the postings offset */
-        postingsOffset += totalSize;
+        indexwriter_free(&writer);
+        return NULL;
     }
     
-    /* update the postings offset */
-    header.postingsStart = htonl(totalWritten);
+    /* then encode and write them without it */
+    int result;
+    int error;
+    Py_BEGIN_ALLOW_THREADS
+    result = indexwriter_write(&writer, filename, threads);
+    error = errno;
+    Py_END_ALLOW_THREADS
+    indexwriter_free(&writer);
     
-    /* loop again to write postings lists */
-    for (keyIdx = 0; keyIdx < indexKeyLen; keyIdx++)
+    if (result == -1)
     {
-        PyObject *key = PyList_GetItem(indexKeys, keyIdx);
-        PyObject *value = PyDict_GetItem(index, key);
-        
-        /* get the postings list and its length */
-        PyObject *postings = PyList_GetItem(value, 1);
-        Py_ssize_t postingsLen = PyList_Size(postings);
-        
-        /* loop over each entry in the postings list and write it out */
-        Py_ssize_t i;
-        for (i = 0; i < postingsLen; i++)
-        {
-            /* pull out some values */
-            PyObject *entryList = PyList_GetItem(postings, i);
-            PyObject *pypageID = PyList_GetItem(entryList, 0);
-            PyObject *pywf = PyList_GetItem(entryList, 1);
-            PyObject *positions = PyList_GetItem(entryList, 2);
-            Py_ssize_t positionsLen = PyList_Size(positions);
-            
-            /* create a header */
-            searchio_index_posting_t posting;
-            posting.pageID = htonl((uint32_t)PyInt_AsUnsignedLongMask(pypageID));
-            posting.wf = htonl((uint32_t)(PyFloat_AsDouble(pywf) * SEARCHIO_WF_SCALE));
-            posting.numPositions = htonl((uint32_t)positionsLen);
-            
-            /* write the header */
-            write(fd, (void *)&posting, sizeof(posting));
-            
-            /* write each of the positions */
-            Py_ssize_t j;
-            for (j = 0; j < positionsLen; j++)
-            {
-                PyObject *item = PyList_GetItem(positions, j);
-                uint32_t p = htonl((uint32_t)PyInt_AsUnsignedLongMask(item));
-                write(fd, (void *)&p, sizeof(p));
-            }
-        }
+        if (error == ENOMEM)
+            return PyErr_NoMemory();
+        errno = error;
+        return PyErr_SetFromErrnoWithFilename(PyExc_IOError, (char *)filename);
     }
     
-    /* rewrite the header with correct offsets */
-    lseek(fd, 0, SEEK_SET);
-    write(fd, (void *)&header, sizeof(header));
-    
-    /* close the index */
-    close(fd);
-    
     /* no meaningful return value here */
     Py_RETURN_NONE;
 }
 static PyObject *searchio_loadIndex(PyObject *self, PyObject *args)
 {
-    /* grab the filename */
+    /* grab the filename, and whether to decode positions */
     const char *filename = NULL;
+    int withPositions = 1;
     
-    if (!PyArg_ParseTuple(args, "s", &filename))
+    if (!PyArg_ParseTuple(args, "s|i", &filename, &withPositions))
         return NULL;
     
     /* open the file, read the header */
@@ -348,12 +284,14 @@ static PyObject *searchio_loadIndex(PyObject *self, PyObject *args)
     fstat(fd, &indexStat);
     
     searchio_index_header_t header;
-    read(fd, (void *)&header, sizeof(header));
-    
-    /* normalize header values */
-    header.numDocuments = ntohl(header.numDocuments);
-    header.numTerms = ntohl(header.numTerms);
-    header.postingsStart = ntohl(header.postingsStart);
+    int profile = searchio_read_header(fd, &header);
+    if (profile == -1 || (size_t)indexStat.st_size < header.postingsStart)
+    {
+        close(fd);
+        PyErr_SetString(PyExc_IOError, "not a readable index");
+        return NULL;
+    }
+    off_t termsStart = lseek(fd, 0, SEEK_CUR);
     
     /* allocate a postings buffer and load the postings into memory */
     size_t postingsBufSize = ((size_t)indexStat.st_size - header.postingsStart);
@@ -361,7 +299,7 @@ static PyObject *searchio_loadIndex(PyObject *self, PyObject *args)
     lseek(fd, header.postingsStart, SEEK_SET);
     read(fd, postingsBuf, postingsBufSize);
     
-    lseek(fd, sizeof(header), SEEK_SET);
+    lseek(fd, termsStart, SEEK_SET);
     
     /* create a result dictionary */
     PyObject *result = PyDict_New();
@@ -385,39 +323,19 @@ static PyObject *searchio_loadIndex(PyObject *self, PyObject *args)
         
         PyObject *termStr = PyString_FromString(searchio_tokenizerBuffer);
         
-        /* create a postings list, load the postings */
-        PyObject *postings = PyList_New(term.numDocumentsInPostings);
-        uint32_t j;
-        size_t offset = term.postingsOffset;
-        for (j = 0; j < term.numDocumentsInPostings; j++)
+        /* decode the postings into a compact Postings object */
+        PyObject *postings = NULL;
+        if (term.postingsOffset <= postingsBufSize)
+            postings = Postings_decode((const char *)postingsBuf + term.postingsOffset, postingsBufSize - term.postingsOffset, term.numDocumentsInPostings, profile, withPositions);
+        else
+            PyErr_SetString(PyExc_IOError, "postings list starts past the end of the index");
+        if (postings == NULL)
         {
-            /* grab the posting header */
-            searchio_index_posting_t posting;
-            memcpy(&posting, postingsBuf + offset, sizeof(posting));
-            
-            /* normalize it */
-            posting.pageID = ntohl(posting.pageID);
-            posting.wf = ntohl(posting.wf);
-            posting.numPositions = ntohl(posting.numPositions);
-            
-            /* create a positions list, fill it out */
-            PyObject *positions = PyList_New(posting.numPositions);
-            uint32_t k;
-            for (k = 0; k < posting.numPositions; k++)
-            {
-                uint32_t *position = ((uint32_t *)(postingsBuf + offset + sizeof(posting)) + k);
-                PyList_SetItem(positions, k, PyLong_FromUnsignedLong(ntohl(*position)));
-            }
-            
-            /* add an entry to the postings list */
-            PyObject *entry = PyList_New(3);
-            PyList_SetItem(entry, 0, PyLong_FromUnsignedLong(posting.pageID));
-            PyList_SetItem(entry, 1, PyFloat_FromDouble((double)posting.wf / (double)SEARCHIO_WF_SCALE));
-            PyList_SetItem(entry, 2, positions);
-            PyList_SetItem(postings, j, entry);
-            
-            /* move to the next posting */
-            offset += (sizeof(posting) + (sizeof(uint32_t) * posting.numPositions));
+            Py_DECREF(termStr);
+            Py_DECREF(result);
+            close(fd);
+            free(postingsBuf);
+            return NULL;
         }
         
         /* store the result in the index */
@@ -425,15 +343,46 @@ static PyObject *searchio_loadIndex(PyObject *self, PyObject *args)
         PyList_SetItem(termEntry, 0, PyLong_FromUnsignedLong(term.df));
         PyList_SetItem(termEntry, 1, postings);
         PyDict_SetItem(result, termStr, termEntry);
+        Py_DECREF(termStr);
+        Py_DECREF(termEntry);
     }
     
     /* close the index and clean up */
     close(fd);
     free(postingsBuf);
     
-    return PyTuple_Pack(2, result, PyLong_FromUnsignedLong(header.numDocuments));
+    return Py_BuildValue("NN", result, PyLong_FromUnsignedLong(header.numDocuments));
 }
 static PyObject *searchio_loadSparseIndex(PyObject *self, PyObject *args)
+{
+    /* grab the filename, and whether to decode positions */
+    const char *filename = NULL;
+    int withPositions = 1;
+    
+    if (!PyArg_ParseTuple(args, "s|i", &filename, &withPositions))
+        return NULL;
+    
+    /* open the file, read the header */
+    int fd = open(filename, O_RDONLY);
+    if (fd == -1)
+        return PyErr_SetFromErrno(PyExc_IOError);
+    
+    searchio_index_header_t header;
+    if (searchio_read_header(fd, &header) == -1)
+    {
+        close(fd);
+        PyErr_SetString(PyExc_IOError, "not a readable index");
+        return NULL;
+    }
+    
+    /* construct and return a sparse index -- it takes over the file */
+    PyObject *index = SparseIndex_new(fd, withPositions);
+    if (index == NULL)
+        return NULL;
+    
+    return Py_BuildValue("NN", index, PyLong_FromUnsignedLong(header.numDocuments));
+}
+static PyObject *searchio_indexProfile(PyObject *self, PyObject *args)
 {
     /* grab the filename */
     const char *filename = NULL;
@@ -441,21 +390,73 @@ static PyObject *searchio_loadSparseIndex(PyObject *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "s", &filename))
         return NULL;
     
-    /* open the file, read the header */
+    /* read just the header */
     int fd = open(filename, O_RDONLY);
     if (fd == -1)
         return PyErr_SetFromErrno(PyExc_IOError);
     
     searchio_index_header_t header;
-    read(fd, (void *)&header, sizeof(header));
+    int profile = searchio_read_header(fd, &header);
+    close(fd);
+    if (profile == -1)
+    {
+        PyErr_SetString(PyExc_IOError, "not a readable index");
+        return NULL;
+    }
     
-    /* normalize header values */
-    header.numDocuments = ntohl(header.numDocuments);
-    header.numTerms = ntohl(header.numTerms);
-    header.postingsStart = ntohl(header.postingsStart);
+    return PyInt_FromLong(profile);
+}
+static PyObject *searchio_minhash(PyObject *self, PyObject *args)
+{
+    /* grab the tokens, the shingle size, and how many hash functions to use */
+    PyObject *tokens = NULL;
+    unsigned int shingleSize = 0;
+    unsigned int numHashes = 0;
     
-    /* construct and return a sparse index */
-    PyObject *index = SparseIndex_new(fd);
+    if (!PyArg_ParseTuple(args, "OII", &tokens, &shingleSize, &numHashes))
+        return NULL;
+    if (numHashes == 0 || numHashes > MINHASH_MAX_HASHES)
+    {
+        PyErr_Format(PyExc_ValueError, "the number of hash functions must be between 1 and %d", MINHASH_MAX_HASHES);
+        return NULL;
+    }
     
-    return PyTuple_Pack(2, index, PyLong_FromUnsignedLong(header.numDocuments));
+    PyObject *list = PySequence_Fast(tokens, "the tokens must be a list of strings");
+    if (list == NULL)
+        return NULL;
+    
+    /* hash each token */
+    Py_ssize_t numTokens = PySequence_Fast_GET_SIZE(list);
+    uint64_t *tokenHashes = (uint64_t *)malloc(SEARCHIO_MAX(numTokens, 1) * sizeof(uint64_t));
+    if (tokenHashes == NULL)
+    {
+        Py_DECREF(list);
+        return PyErr_NoMemory();
+    }
+    Py_ssize_t i;
+    for (i = 0; i < numTokens; i++)
+    {
+        char *token = NULL;
+        Py_ssize_t length = 0;
+        if (PyString_AsStringAndSize(PySequence_Fast_GET_ITEM(list, i), &token, &length) == -1)
+        {
+            free(tokenHashes);
+            Py_DECREF(list);
+            return NULL;
+        }
+        tokenHashes[i] = minhash_token(token, (size_t)length);
+    }
+    Py_DECREF(list);
+    
+    /* find the signature, and hand it back in network byte order */
+    uint32_t signature[MINHASH_MAX_HASHES];
+    int found = minhash_signature(tokenHashes, (size_t)numTokens, shingleSize, signature, numHashes);
+    free(tokenHashes);
+    if (found == -1)
+        Py_RETURN_NONE;
+    
+    unsigned int k;
+    for (k = 0; k < numHashes; k++)
+        signature[k] = htonl(signature[k]);
+    return PyString_FromStringAndSize((const char *)signature, numHashes * sizeof(uint32_t));
 }
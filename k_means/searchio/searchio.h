@@ -7,10 +7,19 @@
 #define __SEARCHIO_H__
 
 #include <Python.h>
+#include <stdint.h>
+#include <unistd.h>
+#include <arpa/inet.h>
 
 /* Constants */
 #define SEARCHIO_TOKENIZER_BUFFER_SIZE 1024 * 1024
 #define SEARCHIO_WF_SCALE 100000
+#define SEARCHIO_INDEX_MAGIC 0x53495832     /* "SIX2" -- files without it are the original format, with positions */
+
+/* Index profiles -- what each posting holds */
+#define SEARCHIO_PROFILE_DOCS 0             /* pageID */
+#define SEARCHIO_PROFILE_WF 1               /* pageID, wf */
+#define SEARCHIO_PROFILE_POSITIONS 2        /* pageID, wf, numPositions, positions */
 
 /* Handy macros */
 #define SEARCHIO_MAX(a, b) ((a < b) ? b : a)
@@ -18,6 +27,11 @@
 
 /* Index file structures */
 #pragma pack(push, 1)
+typedef struct searchio_index_profile {
+    uint32_t magic;
+    uint32_t profile;
+} searchio_index_profile_t;
+
 typedef struct searchio_index_header {
     uint32_t numDocuments;
     uint32_t numTerms;
@@ -39,4 +53,29 @@ typedef struct searchio_index_posting {
 
 #pragma pack(pop)
 
+/* On-disk size of a posting (without its positions) in each profile: one, two or three uint32_t fields */
+#define SEARCHIO_POSTING_SIZE(profile) (((size_t)(profile) + 1) * sizeof(uint32_t))
+
+/* reads an index header, normalizing its values, and leaves fd at the first term entry -- returns the index's profile,
+   or -1 if it isn't a readable index */
+static inline int searchio_read_header(int fd, searchio_index_header_t *header)
+{
+    searchio_index_profile_t prefix;
+    uint32_t profile = SEARCHIO_PROFILE_POSITIONS;
+    off_t start = 0;
+    if (pread(fd, (void *)&prefix, sizeof(prefix), 0) == sizeof(prefix) && ntohl(prefix.magic) == SEARCHIO_INDEX_MAGIC)
+    {
+        profile = ntohl(prefix.profile);
+        start = sizeof(prefix);
+    }
+    if (profile > SEARCHIO_PROFILE_POSITIONS || pread(fd, (void *)header, sizeof(*header), start) != sizeof(*header))
+        return -1;
+    
+    header->numDocuments = ntohl(header->numDocuments);
+    header->numTerms = ntohl(header->numTerms);
+    header->postingsStart = ntohl(header->postingsStart);
+    lseek(fd, start + sizeof(*header), SEEK_SET);
+    return (int)profile;
+}
+
 #endif
@@ -15,12 +15,12 @@ typedef struct SparseIndex_s SparseIndex;
 extern PyTypeObject SparseIndexType;
 
 /* Initializers and Deallocator */
-PyObject *SparseIndex_new(int fd);
+PyObject *SparseIndex_new(int fd, int withPositions);
 int SparseIndex_init(SparseIndex *self, PyObject *args, PyObject *kwds);
 void SparseIndex_dealloc(SparseIndex *self);
 
 /* Loading the index */
-void SparseIndex_reconstruct(SparseIndex *self);
+int SparseIndex_reconstruct(SparseIndex *self);
 
 /* Mapping/sequence methods */
 Py_ssize_t SparseIndex_Length(PyObject *o);
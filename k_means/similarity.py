@@ -0,0 +1,186 @@
+# similarity.py
+# cluster-pruned "more like this" search: an inverted file over the k-means centroids, where each page's feature
+# vector is stored under its nearest centroid(s).  A query -- a page already in the index, or free text -- is only
+# scored against the pages stored under its nprobe nearest centroids, so finding related pages doesn't need a scan
+# over every vector.
+#
+# All the vectors (pages and centroids) are normalized, so cosine similarity is just the dot product, and the
+# nearest centroid by cosine is the same one k-means picks by euclidean distance.
+#
+# Usage: python similarity.py <similarity_filename> <features_filename> [nprobe] [top_k]
+#   reads queries from stdin, one per line -- a line holding just a pageID looks up pages like that page, any other
+#   line is treated as free text -- and prints the pageIDs of the most similar pages, best first, one line per query
+import sys
+import heapq
+import instrument
+from vecrep import create_features_dict, vectorize
+
+replicas = 1  # number of nearest centroids each page is stored under
+nprobe = 2    # number of nearest centroids whose pages are scored for a query
+top_k = 10    # pageIDs returned per query
+
+
+# input:  1) vec1
+#		  2) vec2
+# output: dot product of the two sparse vectors -- their cosine similarity when both are normalized
+def dot(vec1, vec2):
+	if len(vec2) < len(vec1):
+		(vec1, vec2) = (vec2, vec1)
+	total = 0
+	for f_i in vec1:
+		if f_i in vec2:
+			total += vec1[f_i]*vec2[f_i]
+	return total
+
+# input:  1) u_dict of cluster means u_i's
+#		  2) x:= vector to find nearest clusters for
+#		  3) n:= number of clusters wanted
+# output: list of the n cluster ids with the highest cosine similarity to x, nearest first
+def nearest_clusters(u_dict, x, n):
+	return heapq.nlargest(n, u_dict, key=lambda i: (dot(u_dict[i], x), -i))
+
+
+# the inverted file: the centroids, plus for each centroid the pages stored under it
+class SimilarityIndex(object):
+	# input: 1) u_dict:= {i: u_i} of cluster means
+	#		 2) X:= {pageID: feature_vector} of the pages
+	#		 3) lists:= {i: [pageID for pages stored under u_i]}
+	#		 4) features_dict:= {feature: f_i for feature in features}, needed for free text queries
+	def __init__(self, u_dict, X, lists, features_dict=None):
+		self.u_dict = u_dict
+		self.X = X
+		self.lists = lists
+		self.features_dict = features_dict
+
+	# input:  1) vector to find similar pages for
+	#		  2) number of pageIDs wanted
+	#		  3) number of nearest clusters to look in
+	#		  4) pageID to leave out of the results, if any
+	# output: list of (pageID, cosine similarity) of the best pages in those clusters, best first -- ties go to the
+	#		  lower pageID
+	def search(self, x, top_k=top_k, nprobe=nprobe, exclude=None):
+		if not x:
+			return []
+		seen = set()
+		if exclude is not None:
+			seen.add(exclude)
+		scores = []
+		for i in nearest_clusters(self.u_dict, x, nprobe):
+			for pageID in self.lists[i]:
+				if pageID in seen: # a page stored under more than one of the clusters is only scored once
+					continue
+				seen.add(pageID)
+				score = dot(self.X[pageID], x)
+				if score > 0: # nothing in common isn't similar
+					scores.append((score, pageID))
+		instrument.count('similarity_queries')
+		instrument.count('similarity_candidates', len(seen))
+		best = heapq.nsmallest(top_k, scores, key=lambda item: (-item[0], item[1]))
+		return [(pageID, score) for (score, pageID) in best]
+
+	# output: the pages most like the page with the given pageID (leaving it out), as for search
+	def more_like_page(self, pageID, top_k=top_k, nprobe=nprobe):
+		if not pageID in self.X:
+			raise KeyError('page '+str(pageID)+' is not in the similarity index')
+		return self.search(self.X[pageID], top_k, nprobe, pageID)
+
+	# output: the pages most like the given text, as for search
+	def more_like_text(self, text, top_k=top_k, nprobe=nprobe):
+		if self.features_dict is None:
+			raise ValueError('free text queries need the features the index was built with')
+		return self.search(vectorize(text, self.features_dict), top_k, nprobe)
+
+
+# input:  1) u_dict:= {i: u_i} of cluster means, as k-means leaves them
+#		  2) X:= {pageID: feature_vector} of the pages
+#		  3) number of nearest centroids to store each page under
+# output: SimilarityIndex over the pages
+def build(u_dict, X, replicas=replicas):
+	lists = dict((i, []) for i in u_dict)
+	for pageID in sorted(X):
+		if not X[pageID]: # a page with none of the features can't be similar to anything
+			continue
+		for i in nearest_clusters(u_dict, X[pageID], replicas):
+			lists[i].append(pageID)
+	instrument.count('similarity_pages_stored', sum(len(l) for l in lists.values()))
+	return SimilarityIndex(u_dict, X, lists)
+
+# input:  1) filename to write to
+#		  2) SimilarityIndex
+# output: writes the index in format:
+#			first line: <number of clusters>
+#			then one line per cluster: <cluster id> <f_i>:<value> ... (its centroid)
+#			then one line per stored page: <pageID> <cluster id>[,<cluster id>...] <f_i>:<value> ... (its vector)
+def write_index(similarity_filename, index):
+	clusters = {}
+	for (i, pageIDs) in index.lists.items():
+		for pageID in pageIDs:
+			clusters.setdefault(pageID, []).append(i)
+	f = open(similarity_filename, 'w')
+	f.write(str(len(index.u_dict))+'\n')
+	for i in sorted(index.u_dict):
+		f.write(str(i)+' '+format_vector(index.u_dict[i])+'\n')
+	for pageID in sorted(clusters):
+		f.write(str(pageID)+' '+','.join(str(i) for i in clusters[pageID])+' '+format_vector(index.X[pageID])+'\n')
+	f.close()
+	return
+
+# input:  1) filename of an index written by write_index
+#		  2) filename of the features the index was built with, for free text queries -- or None
+# output: SimilarityIndex
+def read_index(similarity_filename, features_filename=None):
+	f = open(similarity_filename, 'r')
+	num_clusters = int(f.readline())
+	u_dict = {}
+	for c in range(num_clusters):
+		(i, vector) = (f.readline().rstrip('\n').split(' ', 1)+[''])[:2]
+		u_dict[int(i)] = parse_vector(vector)
+	X = {}
+	lists = dict((i, []) for i in u_dict)
+	for line in f:
+		(pageID, clusters, vector) = (line.rstrip('\n').split(' ', 2)+[''])[:3]
+		pageID = int(pageID)
+		X[pageID] = parse_vector(vector)
+		for i in clusters.split(','):
+			lists[int(i)].append(pageID)
+	f.close()
+	features_dict = None
+	if features_filename is not None:
+		features_dict = create_features_dict(features_filename)
+	return SimilarityIndex(u_dict, X, lists, features_dict)
+
+# helpers to write_index and read_index -- a sparse vector as space separated <f_i>:<value> pairs
+def format_vector(vector):
+	return ' '.join(str(f_i)+':'+repr(vector[f_i]) for f_i in sorted(vector))
+
+def parse_vector(text):
+	vector = {}
+	for pair in text.split():
+		(f_i, value) = pair.split(':')
+		vector[int(f_i)] = float(value)
+	return vector
+
+
+# input: 1) <similarity_filename> -- index written by k_means.py
+#		 2) <features_filename> -- features the index was built with
+#		 3) number of nearest clusters to look in, and number of results (optional)
+def main(similarity_filename, features_filename, probes=nprobe, results=top_k, queries=sys.stdin, output=sys.stdout):
+	with instrument.stage('load'):
+		index = read_index(similarity_filename, features_filename)
+	with instrument.stage('queries'):
+		for query in queries:
+			query = query.strip()
+			if query.isdigit():
+				try:
+					similar = index.more_like_page(int(query), results, probes)
+				except KeyError:
+					similar = []
+			else:
+				similar = index.more_like_text(query, results, probes)
+			output.write(' '.join(str(pageID) for (pageID, score) in similar)+'\n')
+	output.flush()
+	instrument.report()
+	return
+
+if __name__ == '__main__':
+	main(sys.argv[1], sys.argv[2], *[int(arg) for arg in sys.argv[3:5]])
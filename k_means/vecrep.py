@@ -1,6 +1,7 @@
 #vecrep.py file
 # taken from classification project (augmented) -- does work of turning documents into vectors in features space
 import searchio  # import our own optimized I/O module
+import instrument
 from math import sqrt
 
 
@@ -71,6 +72,7 @@ def parse(fname):
         textString = textString + currLine
 
         dictionary[pageID] = textString
+        instrument.count('pages_parsed')
         if pageID > maxID:
             maxID = pageID
         currLine = f.readline()
@@ -95,11 +97,11 @@ def normalize(feature_vector):
 	return feature_vector
 
 # main function:
-# input: <pagesCollection filename>, <features filename>
+# input: <pagesCollection filename>, <features filename>, and optionally pageIDs to leave out (e.g. duplicates, see dedup.py)
 # output: (X, F)
 #			X: dictionary of document vectors X:= {pageID: feature_vector} where feature_vector := {f_i:float value for f_i in features} is normalized (euclidean norm)
 #			F: len(features_dict)
-def main(pagesCollection_filename, features_filename):
+def main(pagesCollection_filename, features_filename, skip=()):
 	# obtain features in a dictionary {feature: f_i for feature in features_filename} to allow both quick checking and mapping feature to its index
 	features_dict = create_features_dict(features_filename)
 	# initialize empty index, X, with structure {docID: {f_i:occ_i for feature in features}}
@@ -110,27 +112,33 @@ def main(pagesCollection_filename, features_filename):
 
 	# iterate over keys (pageID's) to fill the index
 	for i in range(maxID+1):
-		if not i in collection:
+		if not i in collection or i in skip:
 			continue
 
-		pageID = i
-		textString = collection[i]
-		feature_vector = {}
-		
-		# tokenize textString
-		token_list = searchio.tokenize(set(), textString, False) # tokenize wants to take stopwards set as first argument, but don't care about stopwords here
-		
-		# map feature to feature_occurance in index
-		for t in range(len(token_list)):
-			token = token_list[t]
-
-			if token in features_dict:
-				f_i = features_dict[token] # token is a feature, so get feature index of that feature
-				if not f_i in feature_vector:
-					feature_vector[f_i] = 0
-				feature_vector[f_i] += 1
-
-		# normalize feature-vector and insert into index X
-		X[pageID] = normalize(feature_vector)
+		# vectorize the page's text and insert it into index X
+		X[i] = vectorize(collection[i], features_dict)
 	return (X, len(features_dict))
+
+# input:  1) textString to represent as a vector
+#         2) features_dict:= {feature: f_i for feature in features}
+# output: normalized feature_vector := {f_i:float value for f_i in features}
+def vectorize(textString, features_dict):
+	feature_vector = {}
+
+	# tokenize textString
+	token_list = searchio.tokenize(set(), textString, False) # tokenize wants to take stopwards set as first argument, but don't care about stopwords here
+	instrument.count('tokens_produced', len(token_list))
+
+	# map feature to feature_occurance in index
+	for t in range(len(token_list)):
+		token = token_list[t]
+
+		if token in features_dict:
+			f_i = features_dict[token] # token is a feature, so get feature index of that feature
+			if not f_i in feature_vector:
+				feature_vector[f_i] = 0
+			feature_vector[f_i] += 1
+
+	# normalize feature-vector
+	return normalize(feature_vector)
 				
\ No newline at end of file
@@ -7,16 +7,30 @@
 #include <fcntl.h>
 #include <sys/stat.h>
 #include <stdio.h>
+#include <unistd.h>
 #include <math.h>   
 
+/* Global variables */
+static PyObject *linalgebra_progress = NULL; // callable(name, {values}) that progress is reported to, or NULL
+
 /* Module method declarations */
 static PyObject *linalgebra_difference_normsq(PyObject *self, PyObject *args);
 static PyObject *linalgebra_compute_pagerank(PyObject *self, PyObject *args);
+static PyObject *linalgebra_set_progress(PyObject *self, PyObject *args);
+static PyObject *linalgebra_extract_links(PyObject *self, PyObject *args);
+static PyObject *linalgebra_write_link_graph(PyObject *self, PyObject *args);
+static PyObject *linalgebra_compute_pagerank_file(PyObject *self, PyObject *args);
+static PyObject *linalgebra_compute_personalized_pagerank(PyObject *self, PyObject *args);
 
 /* Module method table */
 static PyMethodDef LinalgebraMethods[] = {
     {"difference_normsq", &linalgebra_difference_normsq, METH_VARARGS, "helper for testing -- finds the norm of the difference of two vectors"},
     {"compute_pagerank", &linalgebra_compute_pagerank, METH_VARARGS, "does work for pagerank.py of turning adjacentry matrix to stochastic matrix and computes pagerank vector"},
+    {"compute_personalized_pagerank", &linalgebra_compute_personalized_pagerank, METH_VARARGS, "compute_pagerank for many teleport vectors at once (e.g. one per cluster or category), sharing one pass over the graph per iteration"},
+    {"extract_links", &linalgebra_extract_links, METH_VARARGS, "parse a collection's [[links]] into (id_list, offsets, targets) arrays for compute_pagerank"},
+    {"write_link_graph", &linalgebra_write_link_graph, METH_VARARGS, "extract_links, but writing the graph to a file instead of returning it -- for graphs too big to hold in memory"},
+    {"compute_pagerank_file", &linalgebra_compute_pagerank_file, METH_VARARGS, "compute_pagerank streamed from a file written by write_link_graph, holding only the rank vectors in memory"},
+    {"set_progress", &linalgebra_set_progress, METH_VARARGS, "set a callable(name, {values}) to report progress to, or None to stay silent"},
     {NULL, NULL, 0, NULL}
 };
 
@@ -26,67 +40,349 @@ PyMODINIT_FUNC initlinalgebra(void)
     /* initialize the module */
     PyObject *m = Py_InitModule("linalgebra", LinalgebraMethods);
 }
+/**************************** PROGRESS REPORTING ****************************/
+
+/****************************
+    def set_progress(callback):
+        callback(name, {values}) gets called with progress events instead of printing them; None turns it off
+*************************************/
+static PyObject *linalgebra_set_progress(PyObject *self, PyObject *args){
+    PyObject *callback = NULL;
+    if (!PyArg_ParseTuple(args, "O", &callback))
+        return NULL;
+    if (callback != Py_None && !PyCallable_Check(callback)){
+        PyErr_SetString(PyExc_TypeError, "progress callback must be callable or None");
+        return NULL;
+    }
+    Py_XDECREF(linalgebra_progress);
+    linalgebra_progress = NULL;
+    if (callback != Py_None){
+        Py_INCREF(callback);
+        linalgebra_progress = callback;
+    }
+    Py_RETURN_NONE;
+}
+/******** Helper: reports an event to the progress callback (if there is one) as callback(name, values) ******/
+void linalgebra_report(const char *name, PyObject *values){
+    if (values == NULL){
+        PyErr_Clear();
+        return;
+    }
+    if (linalgebra_progress != NULL){
+        PyObject *result = PyObject_CallFunction(linalgebra_progress, "sO", name, values);
+        if (result == NULL)
+            PyErr_Print(); // a broken reporter shouldn't take the computation down with it
+        Py_XDECREF(result);
+    }
+    Py_DECREF(values);
+}
 /**************************** FOR PAGERANK.PY ****************************/
 
-/* linalgebra_stochastic_row_t constructor 
-input: 1) adjancy matrix A  as dictionary mapping row to list of nnz entries {i:[j for j in docIDs if i links to j]}
-       2) row i of A that this should represent
-       3) N:= total number of pageIDs
-       4) alpha:= constant in stochastic matrix
-output: row n of stochastic matrix P */
-linalgebra_stochastic_row_t* linalgebra_stochastic_row_init(PyObject *A, PyObject *i, int N, double alpha){
-    // extract row n from A
-    PyObject *nnz_listPy = PyDict_GetItem(A, i);
-    int n = (int)PyList_Size(nnz_listPy);
-
-    linalgebra_stochastic_row_t* row = malloc(sizeof(struct linalgebra_stochastic_row) + (n+1)*sizeof(int));
-    // set nnz_entry
-    row->nnz_entry = ((1-alpha)/n) + (alpha/N);
-    // fill in nnz_array
-    int j;
-    for(j=0; j<n; j++)
-        (row->nnz_array)[j] = (int)PyLong_AsLong(PyList_GetItem(nnz_listPy, j));
-    // put a (-1) in the last entry to mark the end
-    (row->nnz_array)[n] = -1;
-    return row;
-}
-/******** Helper to linalgebra_compute_pagerank: computes normsq of difference of two input vectors as arrays ******/
-double compute_normsq_diff(double vec1[], double vec2[], int N){
-    double normsq = 0;
-    int i;
-    for(i=0; i<N; i++)
-        normsq = normsq + (vec1[i] - vec2[i])*(vec1[i]-vec2[i]);
-    return normsq;
-}
-/******** Helper to linalgebra_compute_pagerank: fills array with all zeros ******/
-void zero_array(double array[], int N){
-    int i;
-    for(i=0; i<N; i++)
-        array[i] = 0;
-}
-/******** Helper to linalgebra_compute_pagerank: computes norm of "vector" ******/
-double compute_norm(double vector[], int N){
-    double normsq = 0;
-    int i;
-    for(i=0; i<N; i++)
-        normsq = normsq + vector[i]*vector[i];
-    return sqrt(normsq);
+/******** Helper: wraps len bytes of data in a new array.array of the given typecode ******/
+PyObject *linalgebra_new_array(const char *typecode, const void *data, size_t len){
+    PyObject *arrayModule = PyImport_ImportModule("array");
+    if (arrayModule == NULL)
+        return NULL;
+    PyObject *bytes = PyString_FromStringAndSize((const char *)data, (Py_ssize_t)len);
+    PyObject *result = NULL;
+    if (bytes != NULL)
+        result = PyObject_CallMethod(arrayModule, "array", "sO", typecode, bytes);
+    Py_XDECREF(bytes);
+    Py_DECREF(arrayModule);
+    return result;
+}
+/******** Helper: read-only view of an array.array (or any buffer) whose items are itemSize bytes; NULL on error ******/
+const void *linalgebra_buffer(PyObject *obj, size_t itemSize, size_t *count, const char *what){
+    const void *buffer = NULL;
+    Py_ssize_t len = 0;
+    if (PyObject_AsReadBuffer(obj, &buffer, &len) != 0)
+        return NULL;
+    PyObject *itemSizePy = PyObject_GetAttrString(obj, "itemsize");
+    if (itemSizePy == NULL)
+        PyErr_Clear(); // plain buffers carry no item size -- trust the length
+    else {
+        long objItemSize = PyInt_AsLong(itemSizePy);
+        Py_DECREF(itemSizePy);
+        if (objItemSize != (long)itemSize){
+            PyErr_Format(PyExc_TypeError, "%s must have %d-byte items", what, (int)itemSize);
+            return NULL;
+        }
+    }
+    if (len % itemSize != 0){
+        PyErr_Format(PyExc_ValueError, "%s is not a whole number of items", what);
+        return NULL;
+    }
+    *count = (size_t)len / itemSize;
+    return buffer;
+}
+/******** Helper to linalgebra_compute_pagerank: copies (offsets, targets) arrays from extract_links into a graph
+    -- the old buffer protocol doesn't stop the arrays being resized or freed once the GIL is released, so the solver
+    can't be left reading them in place ******/
+int linalgebra_graph_from_arrays(PyObject *A, size_t N, linalgebra_graph_t *graph){
+    memset(graph, 0, sizeof(linalgebra_graph_t));
+    size_t numOffsets = 0;
+    size_t numTargets = 0;
+    const void *offsets = linalgebra_buffer(PyTuple_GET_ITEM(A, 0), sizeof(unsigned long), &numOffsets, "offsets");
+    if (offsets == NULL)
+        return -1;
+    const void *targets = linalgebra_buffer(PyTuple_GET_ITEM(A, 1), sizeof(uint32_t), &numTargets, "targets");
+    if (targets == NULL)
+        return -1;
+    if (numOffsets != N + 1 || ((const unsigned long *)offsets)[N] != numTargets){
+        PyErr_SetString(PyExc_ValueError, "offsets and targets don't describe a graph over id_list");
+        return -1;
+    }
+    size_t e;
+    for(e=0; e<numTargets; e++){
+        if (((const uint32_t *)targets)[e] >= N){
+            PyErr_SetString(PyExc_ValueError, "link target out of range");
+            return -1;
+        }
+    }
+    graph->N = N;
+    graph->numEdges = numTargets;
+    graph->offsets = malloc((N + 1) * sizeof(unsigned long));
+    graph->targets = malloc(LINALGEBRA_MAX(numTargets, 1) * sizeof(uint32_t));
+    if (graph->offsets == NULL || graph->targets == NULL){
+        linalgebra_graph_free(graph);
+        PyErr_NoMemory();
+        return -1;
+    }
+    memcpy(graph->offsets, offsets, (N + 1) * sizeof(unsigned long));
+    memcpy(graph->targets, targets, numTargets * sizeof(uint32_t));
+    return 0;
+}
+/******** Helper: orders remap entries by pageID ******/
+static int linalgebra_remap_compare(const void *a, const void *b){
+    long x = ((const linalgebra_remap_entry_t *)a)->pageID;
+    long y = ((const linalgebra_remap_entry_t *)b)->pageID;
+    return (x > y) - (x < y);
+}
+/* builds the pageID -> node map for id_list, where a page's node is its position in id_list; -1 with an exception set on error */
+int linalgebra_remap_init(linalgebra_remap_t *remap, PyObject *id_listPy, size_t N){
+    remap->N = N;
+    remap->entries = malloc(LINALGEBRA_MAX(N, 1) * sizeof(linalgebra_remap_entry_t));
+    if (remap->entries == NULL){
+        PyErr_NoMemory();
+        return -1;
+    }
+    size_t i;
+    for(i=0; i<N; i++){
+        PyObject *pageIDPy = PySequence_GetItem(id_listPy, i);
+        long pageID = (pageIDPy != NULL) ? PyInt_AsLong(pageIDPy) : -1;
+        Py_XDECREF(pageIDPy);
+        if (pageID == -1 && PyErr_Occurred()){
+            linalgebra_remap_free(remap);
+            return -1;
+        }
+        remap->entries[i].pageID = pageID;
+        remap->entries[i].node = i;
+    }
+    qsort(remap->entries, N, sizeof(linalgebra_remap_entry_t), &linalgebra_remap_compare);
+    for(i=1; i<N; i++){
+        if (remap->entries[i].pageID == remap->entries[i-1].pageID){
+            PyErr_Format(PyExc_ValueError, "pageID %ld appears more than once in id_list", remap->entries[i].pageID);
+            linalgebra_remap_free(remap);
+            return -1;
+        }
+    }
+    return 0;
+}
+/* node of pageID, or -1 if it isn't in id_list */
+int64_t linalgebra_remap_lookup(const linalgebra_remap_t *remap, long pageID){
+    size_t low = 0;
+    size_t high = remap->N;
+    while (low < high){
+        size_t middle = low + (high - low)/2;
+        long middleID = remap->entries[middle].pageID;
+        if (middleID == pageID)
+            return (int64_t)remap->entries[middle].node;
+        if (middleID < pageID)
+            low = middle + 1;
+        else
+            high = middle;
+    }
+    return -1;
+}
+void linalgebra_remap_free(linalgebra_remap_t *remap){
+    free(remap->entries);
+    remap->entries = NULL;
+}
+/******** Helper to linalgebra_compute_pagerank: copies adjacency matrix A {i:[j for j in docIDs if i links to j]} into a graph
+    rows are taken in id_list order, and each pageID j is remapped to its position in id_list; links to pageIDs
+    outside id_list are dropped, but a row or pageID that can't be converted is an error: -1 with an exception set ******/
+int linalgebra_graph_from_dict(PyObject *A, PyObject *id_listPy, size_t N, linalgebra_graph_t *graph){
+    memset(graph, 0, sizeof(linalgebra_graph_t));
+    linalgebra_remap_t remap;
+    if (linalgebra_remap_init(&remap, id_listPy, N) != 0)
+        return -1;
+    graph->N = N;
+    graph->offsets = malloc((N + 1) * sizeof(unsigned long));
+    size_t capacity = LINALGEBRA_MAX(N, 1);
+    graph->targets = malloc(capacity * sizeof(uint32_t));
+    if (graph->offsets == NULL || graph->targets == NULL){
+        linalgebra_graph_free(graph);
+        linalgebra_remap_free(&remap);
+        PyErr_NoMemory();
+        return -1;
+    }
+    size_t i;
+    size_t e = 0;
+    for(i=0; i<N; i++){
+        graph->offsets[i] = e;
+        PyObject *row_indexPy = PySequence_GetItem(id_listPy, i);
+        if (row_indexPy == NULL){
+            linalgebra_graph_free(graph);
+            linalgebra_remap_free(&remap);
+            return -1;
+        }
+        PyObject *nnz_listPy = PyDict_GetItem(A, row_indexPy);
+        Py_DECREF(row_indexPy);
+        if (nnz_listPy == NULL)
+            continue; // pages without outlinks have no row
+        PyObject *nnz_fastPy = PySequence_Fast(nnz_listPy, "rows of A must be sequences of pageIDs");
+        if (nnz_fastPy == NULL){
+            linalgebra_graph_free(graph);
+            linalgebra_remap_free(&remap);
+            return -1;
+        }
+        Py_ssize_t n = PySequence_Fast_GET_SIZE(nnz_fastPy);
+        Py_ssize_t j;
+        for(j=0; j<n; j++){
+            long pageID = PyInt_AsLong(PySequence_Fast_GET_ITEM(nnz_fastPy, j));
+            if (pageID == -1 && PyErr_Occurred()){
+                Py_DECREF(nnz_fastPy);
+                linalgebra_graph_free(graph);
+                linalgebra_remap_free(&remap);
+                return -1;
+            }
+            int64_t target = linalgebra_remap_lookup(&remap, pageID);
+            if (target < 0)
+                continue; // links outside id_list never matched a column
+            if (e == capacity){
+                capacity *= 2;
+                uint32_t *targets = realloc(graph->targets, capacity * sizeof(uint32_t));
+                if (targets == NULL){
+                    Py_DECREF(nnz_fastPy);
+                    linalgebra_graph_free(graph);
+                    linalgebra_remap_free(&remap);
+                    PyErr_NoMemory();
+                    return -1;
+                }
+                graph->targets = targets;
+            }
+            graph->targets[e++] = (uint32_t)target;
+        }
+        Py_DECREF(nnz_fastPy);
+    }
+    graph->offsets[N] = e;
+    graph->numEdges = e;
+    linalgebra_remap_free(&remap);
+    return 0;
+}
+/******** Helper: the link graph for A, which is either extract_links' (offsets, targets) arrays or an adjacency
+    dictionary -- copied out of either while the GIL is held, so the caller frees it; -1 with an exception set on error ******/
+int linalgebra_graph_from_object(PyObject *A, PyObject *id_listPy, size_t N, linalgebra_graph_t *graph){
+    if (PyTuple_Check(A) && PyTuple_GET_SIZE(A) == 2)
+        return linalgebra_graph_from_arrays(A, N, graph);
+    if (PyDict_Check(A))
+        return linalgebra_graph_from_dict(A, id_listPy, N, graph);
+    PyErr_SetString(PyExc_TypeError, "A must be an adjacency dictionary or an (offsets, targets) tuple");
+    return -1;
+}
+/******** Helper to linalgebra_compute_personalized_pagerank: fills column c of the N x K teleport block from one
+    teleport vector -- a dictionary {pageID: weight} or a sequence of pageIDs (weighted equally) -- scaled to sum to 1.
+    pageIDs that aren't in id_list are ignored; -1 with an exception set on error ******/
+int linalgebra_teleport_column(PyObject *vectorPy, const linalgebra_remap_t *remap, size_t K, size_t c, double *teleport){
+    PyObject *keys = PyDict_Check(vectorPy) ? PyDict_Keys(vectorPy) : PySequence_Fast(vectorPy, "teleport vectors must be dictionaries or sequences of pageIDs");
+    if (keys == NULL)
+        return -1;
+    Py_ssize_t n = PySequence_Fast_GET_SIZE(keys);
+    Py_ssize_t i;
+    double total = 0;
+    for(i=0; i<n; i++){
+        PyObject *pageIDPy = PySequence_Fast_GET_ITEM(keys, i);
+        long pageID = PyInt_AsLong(pageIDPy);
+        double weight = 1;
+        if (!(pageID == -1 && PyErr_Occurred()) && PyDict_Check(vectorPy))
+            weight = PyFloat_AsDouble(PyDict_GetItem(vectorPy, pageIDPy));
+        if (PyErr_Occurred()){
+            Py_DECREF(keys);
+            return -1;
+        }
+        if (weight < 0){
+            Py_DECREF(keys);
+            PyErr_Format(PyExc_ValueError, "teleport weight for pageID %ld is negative", pageID);
+            return -1;
+        }
+        int64_t node = linalgebra_remap_lookup(remap, pageID);
+        if (node < 0)
+            continue;
+        teleport[node*K + c] += weight;
+        total += weight;
+    }
+    Py_DECREF(keys);
+    if (total <= 0){
+        PyErr_Format(PyExc_ValueError, "teleport vector %d has no weight on any page in id_list", (int)c);
+        return -1;
+    }
+    for(i=0; i<(Py_ssize_t)remap->N; i++)
+        teleport[i*K + c] /= total;
+    return 0;
 }
 
 /****************************
-            adjancy matrix A  as dictionary mapping row to list of nnz entries {i:[j for j in docIDs if i links to j]}
-    def compute_pagerank(A, alpha, id_list, iterations):
-        compute stochastic matrix as:
-        
-        int N
-        zero_entry = alpha/N
-        stochastic_row_t rows[N]
+    def extract_links(collection_filename):
+        parse collection_filename the way pagerank.parse does, but in C, resolving each [[link]] to the node
+        (position in id_list) of the page with that title on the way
+        return (id_list, offsets, targets) as array.array('l'), array.array('L'), array.array('I') -- node i links
+        to targets[offsets[i]:offsets[i+1]]
+*************************************/
+static PyObject *linalgebra_extract_links(PyObject *self, PyObject *args){
+    const char *filename = NULL;
+    if (!PyArg_ParseTuple(args, "s", &filename))
+        return NULL;
+
+    linalgebra_graph_t graph;
+    linkextract_stats_t stats;
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = linkextract_collection(filename, &graph, &stats);
+    Py_END_ALLOW_THREADS
+    if (status != 0)
+        return PyErr_SetFromErrnoWithFilename(PyExc_IOError, (char *)filename);
+
+    if (linalgebra_progress != NULL)
+        linalgebra_report("extract_links", Py_BuildValue("{s:n,s:n,s:n,s:n}", "pages_parsed", (Py_ssize_t)stats.pages, "links_extracted", (Py_ssize_t)stats.links,
+            "edges", (Py_ssize_t)graph.numEdges, "repeated_titles", (Py_ssize_t)stats.repeatedTitles));
+
+    PyObject *id_list = linalgebra_new_array("l", graph.pageIDs, graph.N * sizeof(long));
+    PyObject *offsets = linalgebra_new_array("L", graph.offsets, (graph.N + 1) * sizeof(unsigned long));
+    PyObject *targets = linalgebra_new_array("I", graph.targets, graph.numEdges * sizeof(uint32_t));
+    linalgebra_graph_free(&graph);
+
+    PyObject *result = NULL;
+    if (id_list != NULL && offsets != NULL && targets != NULL)
+        result = PyTuple_Pack(3, id_list, offsets, targets);
+    Py_XDECREF(id_list);
+    Py_XDECREF(offsets);
+    Py_XDECREF(targets);
+    return result;
+}
+
+/****************************
+    def compute_pagerank(A, alpha, id_list, iterations, threads=0):
+        A is either the adjancy matrix as dictionary mapping row to list of nnz entries {i:[j for j in docIDs if i links to j]},
+        or the (offsets, targets) arrays from extract_links
+        the iterations run on <threads> threads (one per processor when 0) with the GIL released; the result
+        doesn't depend on the number of threads
 
         pagerank = [1,0,0,...0]
         for i in range(iterations):
             pagerank = pagerank*P
+            pagerank = pagerank/norm(pagerank)
 
-        return pagerank
+        return array.array('d') of pagerank values, the ith value for the ith pageID of id_list
 *************************************/
 static PyObject *linalgebra_compute_pagerank(PyObject *self, PyObject *args){
     /************ unpack arguments ***********/
@@ -94,86 +390,276 @@ static PyObject *linalgebra_compute_pagerank(PyObject *self, PyObject *args){
     double alpha = 0;
     PyObject *id_listPy = NULL;
     int iterations = 0;
-    if (!PyArg_ParseTuple(args, "OdOi", &A, &alpha, &id_listPy, &iterations))
+    int threads = 0;
+    if (!PyArg_ParseTuple(args, "OdOi|i", &A, &alpha, &id_listPy, &iterations, &threads))
         return NULL;
     /************ unpack arguments ***********/
-    
-    /******************************* initialize:  
-        int N = total pageIDs
-        double zero_entry:= alpha/N  <-- value of entries that don't appear in sparse representation
-        int pageIDs[N]:= array of pageIDs
-        rows[N]:= array of rows taken from A as array of pointers to linalgebra_stochastic_row_t's
-    ***********/
-    Py_ssize_t NPy = PyList_Size(id_listPy);
-    int N = (int)NPy;
+    Py_ssize_t NPy = PySequence_Size(id_listPy);
+    if (NPy < 0)
+        return NULL;
+    size_t N = (size_t)NPy;
+    if (N == 0)
+        return linalgebra_new_array("d", NULL, 0);
+
+    /************ the link graph, copied out of extract_links' arrays or out of A ***********/
+    linalgebra_graph_t graph;
+    if (linalgebra_graph_from_object(A, id_listPy, N, &graph) != 0)
+        return NULL;
+    if (threads <= 0)
+        threads = linalgebra_default_threads();
     double zero_entry = alpha/N;
-    int pageIDs[N];
-    linalgebra_stochastic_row_t* rows[N];
-    int i,j,k;
-    for(i=0; i<N; i++){
-        PyObject *row_indexPy = PyList_GetItem(id_listPy, i);
-        pageIDs[i] = (int)PyLong_AsLong(row_indexPy);
-        rows[i] = linalgebra_stochastic_row_init(A, row_indexPy, N, alpha);
-    }
-    /************************* initialized: have stochastic matrix as array of rows ***********/
-    printf("N:%i, alpha:%f, zero_entry:%f\n",N,alpha,zero_entry);
+    if (linalgebra_progress != NULL)
+        linalgebra_report("pagerank_start", Py_BuildValue("{s:n,s:n,s:d,s:d,s:i}", "N", (Py_ssize_t)N, "edges", (Py_ssize_t)graph.numEdges, "alpha", alpha, "zero_entry", zero_entry, "threads", threads));
 
     /************************ Initilize pagerank[N]:= [1,0,0,....,0] ******************/
-    double pagerank[N];
-    double temp[N];
-    zero_array(pagerank,N); //zeros out the array of doubles
+    double *pagerank = calloc(N, sizeof(double));
+    linalgebra_iteration_t *stats = malloc(LINALGEBRA_MAX(iterations, 1) * sizeof(linalgebra_iteration_t));
+    if (pagerank == NULL || stats == NULL){
+        free(pagerank);
+        free(stats);
+        linalgebra_graph_free(&graph);
+        return PyErr_NoMemory();
+    }
     pagerank[0] = 1;
-    /************************ Initilized pagerank[N]:= [1,0,0,....,0] ******************/
-    printf("pagerank initialized\n");
-    /************** Compute pagerank*P <iterations> times! *******************/
-    for(k=0; k<iterations; k++){
-        zero_array(temp,N);
-        for(i=0; i<N; i++){
-            // extract all necessary values for this particular row before looking at column by column
-            double vec_i = pagerank[i];
-            linalgebra_stochastic_row_t* row_i = rows[i];
-            double nnz_entry = row_i->nnz_entry;
-
-            // setup starting variables
-            int nnz_index = 0;
-            int nnz = (row_i->nnz_array)[0];
-            double value;
-
-            for(j=0; j<N; j++){
-                // get value we're multiplying vec_i by
-                if((nnz > j)||(nnz < 0)) // I put a (-1) at the end of each row's nnz_array to mark the end
-                    value = zero_entry;
-                else{
-                    value = nnz_entry;
-                    nnz_index ++;
-                    nnz = (row_i->nnz_array)[nnz_index];
-                }
-                temp[j] = temp[j] + (vec_i*value);
+    /************** Compute pagerank*P <iterations> times, normalizing each time -- without the GIL *******************/
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = linalgebra_solve(&graph, alpha, iterations, threads, pagerank, stats);
+    Py_END_ALLOW_THREADS
+    linalgebra_graph_free(&graph);
+    if (status != 0){
+        free(pagerank);
+        free(stats);
+        return PyErr_SetFromErrno(PyExc_MemoryError);
+    }
+    /* the progress callback needs the GIL, so the iterations get reported once they're done */
+    int k;
+    for(k=0; k<iterations && linalgebra_progress != NULL; k++)
+        linalgebra_report("pagerank_iteration", Py_BuildValue("{s:i,s:d,s:d,s:d}", "iteration", k, "residual", stats[k].residual, "norm", stats[k].norm, "sum", stats[k].sum));
+    free(stats);
+
+    /* hand back the vector as an array aligned to id_list */
+    PyObject *result = linalgebra_new_array("d", pagerank, N*sizeof(double));
+    free(pagerank);
+    return result;
+}
+
+/****************************
+    def compute_personalized_pagerank(A, alpha, id_list, teleports, iterations, threads=0):
+        topic-sensitive pagerank: compute_pagerank once for each vector in teleports, where teleporting lands on
+        that vector's pages (a dictionary {pageID: weight} or a list of pageIDs, scaled to sum to 1) instead of on
+        every page alike.  All of them are solved together -- the graph is walked once per iteration for the whole
+        N x len(teleports) block -- so the cost is close to one compute_pagerank run.
+        A, id_list, iterations and threads are as for compute_pagerank
+
+        return list of array.array('d'), one per teleport vector, each aligned to id_list
+*************************************/
+static PyObject *linalgebra_compute_personalized_pagerank(PyObject *self, PyObject *args){
+    PyObject *A = NULL;
+    double alpha = 0;
+    PyObject *id_listPy = NULL;
+    PyObject *teleportsPy = NULL;
+    int iterations = 0;
+    int threads = 0;
+    if (!PyArg_ParseTuple(args, "OdOOi|i", &A, &alpha, &id_listPy, &teleportsPy, &iterations, &threads))
+        return NULL;
+    Py_ssize_t NPy = PySequence_Size(id_listPy);
+    Py_ssize_t KPy = PySequence_Size(teleportsPy);
+    if (NPy < 0 || KPy < 0)
+        return NULL;
+    size_t N = (size_t)NPy;
+    size_t K = (size_t)KPy;
+    if (N == 0 || K == 0){
+        PyObject *result = PyList_New(K);
+        size_t c;
+        for(c=0; c<K && result != NULL; c++){
+            PyObject *empty = linalgebra_new_array("d", NULL, 0);
+            if (empty == NULL){
+                Py_DECREF(result);
+                return NULL;
             }
+            PyList_SET_ITEM(result, c, empty);
         }
-        // obtained result!
-        double norm = compute_norm(temp, N);
-        printf("iteration %i: ***********************\nnormsq(pagerank, temp)= %f\nnorm: %f\n", k, compute_normsq_diff(pagerank, temp, N),norm);
-        // reset pagerank as (normalized) result:
-        double sum = 0;
-        for(j=0; j<N; j++){
-            pagerank[j] = temp[j]/norm; // <-- scaling each entry up by norm -- bad idea?  Definitely not quite honest
-            sum = sum + pagerank[j];
+        return result;
+    }
+
+    /************ the teleport block, node-major, one column per teleport vector ***********/
+    linalgebra_remap_t remap;
+    if (linalgebra_remap_init(&remap, id_listPy, N) != 0)
+        return NULL;
+    double *teleport = calloc(N * K, sizeof(double));
+    if (teleport == NULL){
+        linalgebra_remap_free(&remap);
+        return PyErr_NoMemory();
+    }
+    size_t c;
+    for(c=0; c<K; c++){
+        PyObject *vectorPy = PySequence_GetItem(teleportsPy, c);
+        int failed = (vectorPy == NULL || linalgebra_teleport_column(vectorPy, &remap, K, c, teleport) != 0);
+        Py_XDECREF(vectorPy);
+        if (failed){
+            free(teleport);
+            linalgebra_remap_free(&remap);
+            return NULL;
         }
-        printf("new pagerank entries sum to %f\n",sum);
     }
-    // free all the rows
-    for(i=0; i<N; i++){
-        int row_index = pageIDs[i];
-        free(rows[row_index]);
+    linalgebra_remap_free(&remap);
+
+    linalgebra_graph_t graph;
+    if (linalgebra_graph_from_object(A, id_listPy, N, &graph) != 0){
+        free(teleport);
+        return NULL;
     }
+    if (threads <= 0)
+        threads = linalgebra_default_threads();
+    if (linalgebra_progress != NULL)
+        linalgebra_report("pagerank_start", Py_BuildValue("{s:n,s:n,s:d,s:i,s:n}", "N", (Py_ssize_t)N, "edges", (Py_ssize_t)graph.numEdges, "alpha", alpha, "threads", threads, "vectors", (Py_ssize_t)K));
 
-    /* create a result dictionary and fill it in */
-    PyObject *result = PyDict_New();
-    for(i=0; i<N; i++){
-        PyObject *id = PyFloat_FromDouble(pageIDs[i]);
-        PyDict_SetItem(result, id, PyFloat_FromDouble(pagerank[i]));
+    /* every vector starts from [1,0,0,...,0], like compute_pagerank */
+    double *pagerank = calloc(N * K, sizeof(double));
+    linalgebra_iteration_t *stats = malloc(LINALGEBRA_MAX(iterations, 1) * K * sizeof(linalgebra_iteration_t));
+    if (pagerank == NULL || stats == NULL){
+        free(pagerank);
+        free(stats);
+        free(teleport);
+        linalgebra_graph_free(&graph);
+        return PyErr_NoMemory();
+    }
+    for(c=0; c<K; c++)
+        pagerank[c] = 1;
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = linalgebra_solve_block(&graph, alpha, iterations, threads, K, teleport, pagerank, stats);
+    Py_END_ALLOW_THREADS
+    free(teleport);
+    linalgebra_graph_free(&graph);
+    if (status != 0){
+        free(pagerank);
+        free(stats);
+        return PyErr_SetFromErrno(PyExc_MemoryError);
+    }
+    /* one event per iteration, with the slowest-converging vector's residual */
+    int k;
+    for(k=0; k<iterations && linalgebra_progress != NULL; k++){
+        double residual = 0;
+        for(c=0; c<K; c++)
+            residual = LINALGEBRA_MAX(residual, stats[k*K + c].residual);
+        linalgebra_report("pagerank_iteration", Py_BuildValue("{s:i,s:d,s:n}", "iteration", k, "residual", residual, "vectors", (Py_ssize_t)K));
+    }
+    free(stats);
+
+    /* split the block into one array per vector */
+    PyObject *result = PyList_New(K);
+    double *column = malloc(N * sizeof(double));
+    if (result == NULL || column == NULL){
+        Py_XDECREF(result);
+        free(column);
+        free(pagerank);
+        return PyErr_NoMemory();
+    }
+    for(c=0; c<K; c++){
+        size_t i;
+        for(i=0; i<N; i++)
+            column[i] = pagerank[i*K + c];
+        PyObject *values = linalgebra_new_array("d", column, N*sizeof(double));
+        if (values == NULL){
+            Py_DECREF(result);
+            result = NULL;
+            break;
+        }
+        PyList_SET_ITEM(result, c, values);
+    }
+    free(column);
+    free(pagerank);
+    return result;
+}
+
+/****************************
+    def write_link_graph(collection_filename, graph_filename):
+        the same links extract_links finds, written to graph_filename (see linalgebra_graph_header_t) instead of
+        being returned, so the edges never have to fit in memory
+        return (number of pages, number of edges)
+*************************************/
+static PyObject *linalgebra_write_link_graph(PyObject *self, PyObject *args){
+    const char *filename = NULL;
+    const char *graphFilename = NULL;
+    if (!PyArg_ParseTuple(args, "ss", &filename, &graphFilename))
+        return NULL;
+
+    linkextract_stats_t stats;
+    size_t N = 0;
+    size_t numEdges = 0;
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = linkextract_collection_to_file(filename, graphFilename, &stats, &N, &numEdges);
+    Py_END_ALLOW_THREADS
+    if (status != 0) // blame the collection if it can't be read, otherwise the graph file
+        return PyErr_SetFromErrnoWithFilename(PyExc_IOError, (char *)((access(filename, R_OK) != 0) ? filename : graphFilename));
+
+    if (linalgebra_progress != NULL)
+        linalgebra_report("extract_links", Py_BuildValue("{s:n,s:n,s:n,s:n}", "pages_parsed", (Py_ssize_t)stats.pages, "links_extracted", (Py_ssize_t)stats.links,
+            "edges", (Py_ssize_t)numEdges, "repeated_titles", (Py_ssize_t)stats.repeatedTitles));
+    return Py_BuildValue("nn", (Py_ssize_t)N, (Py_ssize_t)numEdges);
+}
+
+/****************************
+    def compute_pagerank_file(graph_filename, alpha, iterations):
+        compute_pagerank over a graph file from write_link_graph, reading the file once per iteration instead of
+        holding the graph in memory.  Runs on one thread with the GIL released; matches compute_pagerank to rounding.
+        return (id_list, pagerank) as array.array('l') and array.array('d'), the ith value for the ith pageID
+*************************************/
+static PyObject *linalgebra_compute_pagerank_file(PyObject *self, PyObject *args){
+    const char *graphFilename = NULL;
+    double alpha = 0;
+    int iterations = 0;
+    if (!PyArg_ParseTuple(args, "sdi", &graphFilename, &alpha, &iterations))
+        return NULL;
+
+    linalgebra_graph_file_t graphFile;
+    if (linalgebra_graph_file_open(&graphFile, graphFilename) != 0)
+        return PyErr_SetFromErrnoWithFilename(PyExc_IOError, (char *)graphFilename);
+    size_t N = graphFile.N;
+    if (linalgebra_progress != NULL)
+        linalgebra_report("pagerank_start", Py_BuildValue("{s:n,s:n,s:d,s:d,s:i}", "N", (Py_ssize_t)N, "edges", (Py_ssize_t)graphFile.numEdges, "alpha", alpha, "zero_entry", (N > 0) ? alpha/N : 0, "threads", 1));
+
+    long *pageIDs = malloc(LINALGEBRA_MAX(N, 1) * sizeof(long));
+    double *pagerank = calloc(LINALGEBRA_MAX(N, 1), sizeof(double));
+    linalgebra_iteration_t *stats = malloc(LINALGEBRA_MAX(iterations, 1) * sizeof(linalgebra_iteration_t));
+    if (pageIDs == NULL || pagerank == NULL || stats == NULL){
+        free(pageIDs);
+        free(pagerank);
+        free(stats);
+        linalgebra_graph_file_close(&graphFile);
+        return PyErr_NoMemory();
     }
+    pagerank[0] = 1;
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = linalgebra_graph_file_page_ids(&graphFile, pageIDs);
+    if (status == 0)
+        status = linalgebra_solve_file(&graphFile, alpha, iterations, pagerank, stats);
+    Py_END_ALLOW_THREADS
+    linalgebra_graph_file_close(&graphFile);
+    if (status != 0){
+        free(pageIDs);
+        free(pagerank);
+        free(stats);
+        return PyErr_SetFromErrnoWithFilename(PyExc_IOError, (char *)graphFilename);
+    }
+    int k;
+    for(k=0; k<iterations && N > 0 && linalgebra_progress != NULL; k++)
+        linalgebra_report("pagerank_iteration", Py_BuildValue("{s:i,s:d,s:d,s:d}", "iteration", k, "residual", stats[k].residual, "norm", stats[k].norm, "sum", stats[k].sum));
+    free(stats);
+
+    PyObject *id_list = linalgebra_new_array("l", pageIDs, N*sizeof(long));
+    PyObject *values = linalgebra_new_array("d", pagerank, N*sizeof(double));
+    free(pageIDs);
+    free(pagerank);
+    PyObject *result = NULL;
+    if (id_list != NULL && values != NULL)
+        result = PyTuple_Pack(2, id_list, values);
+    Py_XDECREF(id_list);
+    Py_XDECREF(values);
     return result;
 }
 
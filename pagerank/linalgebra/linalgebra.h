@@ -7,16 +7,85 @@
 #define __LINALGEBRA_H__
 
 #include <Python.h>
+#include <stdint.h>
 
 /* Handy macros */
 #define LINALGEBRA_MAX(a, b) ((a < b) ? b : a)
 #define LINALGEBRA_MIN(a, b) ((a > b) ? b : a)
 
 
-typedef struct linalgebra_stochastic_row {
-    double nnz_entry;
-    int nnz_array[];
-} linalgebra_stochastic_row_t;
+/* Link graph in compressed sparse row form: node i links to targets[offsets[i]] .. targets[offsets[i+1]-1].
+   Nodes are dense 0..N-1 in the order pages were found in the collection. */
+typedef struct linalgebra_graph {
+    size_t N;
+    size_t numEdges;
+    long *pageIDs;              // pageID of each node (may be NULL when the caller keeps them)
+    unsigned long *offsets;     // N+1 entries
+    uint32_t *targets;          // numEdges entries (extract_links keeps each row sorted and unique)
+} linalgebra_graph_t;
 
+/* Dense remapping of arbitrary pageIDs to node IDs 0..N-1 (their positions in id_list) */
+typedef struct linalgebra_remap_entry {
+    long pageID;
+    size_t node;
+} linalgebra_remap_entry_t;
 
-#endif
\ No newline at end of file
+typedef struct linalgebra_remap {
+    size_t N;
+    linalgebra_remap_entry_t *entries;  // sorted by pageID
+} linalgebra_remap_t;
+
+int linalgebra_remap_init(linalgebra_remap_t *remap, PyObject *id_listPy, size_t N);
+int64_t linalgebra_remap_lookup(const linalgebra_remap_t *remap, long pageID);
+void linalgebra_remap_free(linalgebra_remap_t *remap);
+
+/* Multi-threaded power iteration (solver.c) */
+typedef struct linalgebra_iteration {
+    double residual;            // squared norm of the change made by the iteration
+    double norm;
+    double sum;
+} linalgebra_iteration_t;
+
+int linalgebra_solve(const linalgebra_graph_t *graph, double alpha, int iterations, int threads, double *pagerank, linalgebra_iteration_t *stats);
+int linalgebra_solve_block(const linalgebra_graph_t *graph, double alpha, int iterations, int threads, size_t K, const double *teleport, double *pagerank, linalgebra_iteration_t *stats);
+int linalgebra_default_threads(void);
+
+/* Link graph file written by linkextract_collection_to_file, in network byte order: the header, then for
+   each node in order its out-degree followed by that many targets (all uint32), then the pageID of each
+   node as a signed 64-bit integer, high word first */
+#define LINALGEBRA_GRAPH_MAGIC 0x4c4e4b31   // "LNK1"
+#define LINALGEBRA_IO_BUFFER_SIZE (1 << 22)
+
+#pragma pack(push, 1)
+typedef struct linalgebra_graph_header {
+    uint32_t magic;
+    uint32_t numNodes;
+    uint32_t numEdgesHigh;
+    uint32_t numEdgesLow;
+} linalgebra_graph_header_t;
+#pragma pack(pop)
+
+/* Out-of-core power iteration over a graph file (outofcore.c) */
+typedef struct linalgebra_graph_file {
+    FILE *f;
+    size_t N;
+    size_t numEdges;
+} linalgebra_graph_file_t;
+
+int linalgebra_graph_file_open(linalgebra_graph_file_t *graphFile, const char *filename);
+int linalgebra_graph_file_page_ids(linalgebra_graph_file_t *graphFile, long *pageIDs);
+int linalgebra_solve_file(linalgebra_graph_file_t *graphFile, double alpha, int iterations, double *pagerank, linalgebra_iteration_t *stats);
+void linalgebra_graph_file_close(linalgebra_graph_file_t *graphFile);
+
+/* Link extraction (linkextract.c) */
+typedef struct linkextract_stats {
+    size_t pages;
+    size_t links;               // every [[link]] found, including ones to pages outside the collection
+    size_t repeatedTitles;
+} linkextract_stats_t;
+
+int linkextract_collection(const char *filename, linalgebra_graph_t *graph, linkextract_stats_t *stats);
+int linkextract_collection_to_file(const char *filename, const char *graphFilename, linkextract_stats_t *stats, size_t *numNodes, size_t *numEdges);
+void linalgebra_graph_free(linalgebra_graph_t *graph);
+
+#endif
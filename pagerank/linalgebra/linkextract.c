@@ -0,0 +1,530 @@
+/*
+    linkextract
+    A single-pass [[link]] extractor for CS158 collections.  Titles and link targets are interned to
+    dense node IDs while scanning, and the result is a compact CSR link graph for PageRank.
+*/
+
+#include "linalgebra.h"
+#include <fcntl.h>
+#include <errno.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <arpa/inet.h>
+
+/* An interned title or link target; str points into the mapped collection */
+typedef struct linkextract_symbol {
+    const char *str;
+    uint32_t len;
+    uint32_t hash;
+    int64_t node;               // node of the page with this title, or -1 if no page has it (yet)
+} linkextract_symbol_t;
+
+/* Open-addressed hash table over the symbols, in order of first appearance */
+typedef struct linkextract_table {
+    linkextract_symbol_t *symbols;
+    size_t numSymbols;
+    size_t symbolsCapacity;
+    uint32_t *slots;            // symbol index + 1, or 0 for an empty slot
+    size_t numSlots;            // always a power of two
+} linkextract_table_t;
+
+/* Growable arrays used while scanning */
+typedef struct linkextract_scan {
+    long *pageIDs;
+    size_t *pageEdgeStart;      // index into edgeSymbols where each page's links begin
+    size_t pageEdgeStartCapacity;
+    size_t numPages;
+    size_t pagesCapacity;
+    uint32_t *edgeSymbols;      // symbol of every link, page by page
+    size_t numEdges;
+    size_t edgesCapacity;
+    FILE *edgeFile;             // when set, link symbols are written here instead of to edgeSymbols
+} linkextract_scan_t;
+
+enum { LINKEXTRACT_WANT_ID, LINKEXTRACT_WANT_TITLE, LINKEXTRACT_IN_PAGE };
+
+/******** Helper: FNV-1a hash of a string ******/
+static uint32_t linkextract_hash(const char *str, size_t len){
+    uint32_t hash = 2166136261u;
+    size_t i;
+    for(i=0; i<len; i++){
+        hash ^= (unsigned char)str[i];
+        hash *= 16777619u;
+    }
+    return hash;
+}
+/******** Helper: grows an array to hold at least (count+1) items; returns 0 on success ******/
+static int linkextract_reserve(void **array, size_t *capacity, size_t count, size_t itemSize){
+    if (count < *capacity)
+        return 0;
+    size_t newCapacity = LINALGEBRA_MAX(2 * (*capacity), 1024);
+    void *newArray = realloc(*array, newCapacity * itemSize);
+    if (newArray == NULL)
+        return -1;
+    *array = newArray;
+    *capacity = newCapacity;
+    return 0;
+}
+/******** Helper: doubles the slot table and rehashes every symbol into it ******/
+static int linkextract_rehash(linkextract_table_t *table){
+    size_t numSlots = LINALGEBRA_MAX(2 * table->numSlots, 4096);
+    uint32_t *slots = calloc(numSlots, sizeof(uint32_t));
+    if (slots == NULL)
+        return -1;
+    size_t i;
+    for(i=0; i<table->numSymbols; i++){
+        size_t slot = table->symbols[i].hash & (numSlots - 1);
+        while (slots[slot] != 0)
+            slot = (slot + 1) & (numSlots - 1);
+        slots[slot] = (uint32_t)(i + 1);
+    }
+    free(table->slots);
+    table->slots = slots;
+    table->numSlots = numSlots;
+    return 0;
+}
+/******** Helper: index of the symbol for str, adding it if it's new; -1 when out of memory ******/
+static int64_t linkextract_intern(linkextract_table_t *table, const char *str, size_t len){
+    if (2 * (table->numSymbols + 1) > table->numSlots && linkextract_rehash(table) != 0)
+        return -1;
+
+    uint32_t hash = linkextract_hash(str, len);
+    size_t slot = hash & (table->numSlots - 1);
+    while (table->slots[slot] != 0){
+        linkextract_symbol_t *symbol = &(table->symbols[table->slots[slot] - 1]);
+        if (symbol->hash == hash && symbol->len == len && memcmp(symbol->str, str, len) == 0)
+            return table->slots[slot] - 1;
+        slot = (slot + 1) & (table->numSlots - 1);
+    }
+
+    if (linkextract_reserve((void **)&(table->symbols), &(table->symbolsCapacity), table->numSymbols, sizeof(linkextract_symbol_t)) != 0)
+        return -1;
+    linkextract_symbol_t *symbol = &(table->symbols[table->numSymbols]);
+    symbol->str = str;
+    symbol->len = (uint32_t)len;
+    symbol->hash = hash;
+    symbol->node = -1;
+    table->slots[slot] = (uint32_t)(table->numSymbols + 1);
+    return (int64_t)(table->numSymbols++);
+}
+/******** Helper: finds needle in [start, end), like strstr for unterminated lines ******/
+static const char *linkextract_find(const char *start, const char *end, const char *needle, size_t needleLen){
+    while ((size_t)(end - start) >= needleLen){
+        const char *c = memchr(start, needle[0], (end - start) - needleLen + 1);
+        if (c == NULL)
+            return NULL;
+        if (memcmp(c, needle, needleLen) == 0)
+            return c;
+        start = c + 1;
+    }
+    return NULL;
+}
+/******** Helper: parses the (optionally signed) integer at the start of [start, end) ******/
+static long linkextract_parse_long(const char *start, const char *end){
+    while (start < end && (*start == ' ' || *start == '\t'))
+        start++;
+    int sign = 1;
+    if (start < end && (*start == '-' || *start == '+')){
+        sign = (*start == '-') ? -1 : 1;
+        start++;
+    }
+    long value = 0;
+    while (start < end && *start >= '0' && *start <= '9'){
+        value = value * 10 + (*start - '0');
+        start++;
+    }
+    return sign * value;
+}
+/******** Helper: records every [[link]] on one line as an edge from the current page; -1 when out of memory or the edge file can't be written ******/
+static int linkextract_line_links(const char *line, const char *lineEnd, linkextract_table_t *table, linkextract_scan_t *scan, linkextract_stats_t *stats){
+    const char *c = line;
+    while (c + 1 < lineEnd){
+        const char *open = linkextract_find(c, lineEnd, "[[", 2);
+        if (open == NULL)
+            break;
+        const char *start = open + 2;
+        const char *close = linkextract_find(start, lineEnd, "]]", 2);
+        if (close == NULL)
+            break;
+
+        // the link target is everything up to a section anchor (#) or display text (|)
+        const char *stop = start;
+        while (stop < close && *stop != '#' && *stop != '|')
+            stop++;
+
+        int64_t symbol = linkextract_intern(table, start, stop - start);
+        if (symbol < 0)
+            return -1;
+        if (scan->edgeFile != NULL){
+            uint32_t edgeSymbol = (uint32_t)symbol;
+            if (fwrite(&edgeSymbol, sizeof(uint32_t), 1, scan->edgeFile) != 1)
+                return -1;
+            scan->numEdges++;
+        }
+        else {
+            if (linkextract_reserve((void **)&(scan->edgeSymbols), &(scan->edgesCapacity), scan->numEdges, sizeof(uint32_t)) != 0)
+                return -1;
+            scan->edgeSymbols[scan->numEdges++] = (uint32_t)symbol;
+        }
+        stats->links++;
+        c = close + 2;
+    }
+    return 0;
+}
+/******** Helper: starts a new page with the given pageID and title; -1 when out of memory ******/
+static int linkextract_add_page(long pageID, const char *title, size_t titleLen, linkextract_table_t *table, linkextract_scan_t *scan, linkextract_stats_t *stats){
+    if (linkextract_reserve((void **)&(scan->pageIDs), &(scan->pagesCapacity), scan->numPages, sizeof(long)) != 0)
+        return -1;
+    if (linkextract_reserve((void **)&(scan->pageEdgeStart), &(scan->pageEdgeStartCapacity), scan->numPages, sizeof(size_t)) != 0)
+        return -1;
+
+    int64_t symbol = linkextract_intern(table, title, titleLen);
+    if (symbol < 0)
+        return -1;
+    if (table->symbols[symbol].node >= 0)
+        stats->repeatedTitles++; // like the python parser, the later page takes over the title
+    table->symbols[symbol].node = (int64_t)scan->numPages;
+
+    scan->pageIDs[scan->numPages] = pageID;
+    scan->pageEdgeStart[scan->numPages] = scan->numEdges;
+    scan->numPages++;
+    stats->pages++;
+    return 0;
+}
+/******** Helper: sorts a row of targets ******/
+static int linkextract_compare(const void *a, const void *b){
+    uint32_t x = *(const uint32_t *)a;
+    uint32_t y = *(const uint32_t *)b;
+    return (x > y) - (x < y);
+}
+/******** Helper: turns the scanned links into a CSR graph, dropping links to titles outside the collection ******/
+static int linkextract_resolve(linkextract_table_t *table, linkextract_scan_t *scan, linalgebra_graph_t *graph){
+    size_t N = scan->numPages;
+    graph->offsets = malloc((N + 1) * sizeof(unsigned long));
+    if (graph->offsets == NULL)
+        return -1;
+
+    // resolve in place: each row is written at or before where it was read from
+    uint32_t *targets = scan->edgeSymbols;
+    size_t written = 0;
+    size_t i;
+    for(i=0; i<N; i++){
+        size_t rowStart = written;
+        size_t e = scan->pageEdgeStart[i];
+        size_t rowEnd = (i + 1 < N) ? scan->pageEdgeStart[i + 1] : scan->numEdges;
+        graph->offsets[i] = rowStart;
+        for(; e<rowEnd; e++){
+            int64_t node = table->symbols[scan->edgeSymbols[e]].node;
+            if (node >= 0)
+                targets[written++] = (uint32_t)node;
+        }
+        // a page links to another page at most once
+        qsort(targets + rowStart, written - rowStart, sizeof(uint32_t), &linkextract_compare);
+        size_t unique = rowStart;
+        for(e=rowStart; e<written; e++){
+            if (e == rowStart || targets[e] != targets[unique - 1])
+                targets[unique++] = targets[e];
+        }
+        written = unique;
+    }
+    graph->offsets[N] = written;
+
+    graph->N = N;
+    graph->numEdges = written;
+    graph->pageIDs = scan->pageIDs;
+    graph->targets = targets;
+    scan->pageIDs = NULL;
+    scan->edgeSymbols = NULL;
+    return 0;
+}
+
+/******** Helper: maps the collection read-only for one sequential pass; -1 with errno set on failure ******/
+static int linkextract_map(const char *filename, const char **data, size_t *size){
+    *data = NULL;
+    *size = 0;
+    int fd = open(filename, O_RDONLY);
+    if (fd == -1)
+        return -1;
+    struct stat collectionStat;
+    if (fstat(fd, &collectionStat) == -1){
+        close(fd);
+        return -1;
+    }
+    *size = (size_t)collectionStat.st_size;
+    if (*size > 0){
+        *data = mmap(NULL, *size, PROT_READ, MAP_PRIVATE, fd, 0);
+        if (*data == MAP_FAILED){
+            *data = NULL;
+            close(fd);
+            return -1;
+        }
+        madvise((void *)*data, *size, MADV_SEQUENTIAL);
+    }
+    close(fd);
+    return 0;
+}
+/******** Helper: the walk over the collection shared by both extractors; -1 on failure ******/
+static int linkextract_scan_collection(const char *data, size_t size, linkextract_table_t *table, linkextract_scan_t *scan, linkextract_stats_t *stats){
+    int failed = 0;
+    long pageID = 0;
+
+    int state = LINKEXTRACT_WANT_ID;
+    const char *line = data;
+    const char *end = data + size;
+    while (line < end && !failed){
+        const char *newline = memchr(line, '\n', end - line);
+        const char *lineEnd = (newline != NULL) ? newline : end;
+
+        if (state == LINKEXTRACT_WANT_ID){
+            const char *tag = linkextract_find(line, lineEnd, "<id>", 4);
+            if (tag != NULL){
+                pageID = linkextract_parse_long(tag + 4, lineEnd);
+                state = LINKEXTRACT_WANT_TITLE;
+            }
+        }
+        if (state == LINKEXTRACT_WANT_TITLE){
+            const char *tag = linkextract_find(line, lineEnd, "<title>", 7);
+            if (tag != NULL){
+                const char *title = tag + 7;
+                const char *titleEnd = linkextract_find(title, lineEnd, "</title>", 8);
+                if (titleEnd == NULL)
+                    titleEnd = lineEnd;
+                failed = (linkextract_add_page(pageID, title, titleEnd - title, table, scan, stats) != 0);
+                state = LINKEXTRACT_IN_PAGE;
+            }
+        }
+        if (state == LINKEXTRACT_IN_PAGE && !failed){
+            failed = (linkextract_line_links(line, lineEnd, table, scan, stats) != 0);
+            if (linkextract_find(line, lineEnd, "</page>", 7) != NULL)
+                state = LINKEXTRACT_WANT_ID;
+        }
+
+        line = (newline != NULL) ? newline + 1 : end;
+    }
+    return failed ? -1 : 0;
+}
+
+/****************************
+    def linkextract_collection(filename):
+        same walk over the collection as pagerank.parse: <id> line, <title> line, then every line up to </page>
+        has its [[links]] pulled out.  Titles become node IDs in the order pages are found, and links to
+        titles that aren't in the collection are dropped.
+        returns 0, or -1 with errno set
+*************************************/
+int linkextract_collection(const char *filename, linalgebra_graph_t *graph, linkextract_stats_t *stats){
+    memset(graph, 0, sizeof(linalgebra_graph_t));
+    memset(stats, 0, sizeof(linkextract_stats_t));
+
+    const char *data;
+    size_t size;
+    if (linkextract_map(filename, &data, &size) != 0)
+        return -1;
+
+    linkextract_table_t table;
+    linkextract_scan_t scan;
+    memset(&table, 0, sizeof(table));
+    memset(&scan, 0, sizeof(scan));
+
+    int failed = (linkextract_scan_collection(data, size, &table, &scan, stats) != 0);
+    if (!failed)
+        failed = (linkextract_resolve(&table, &scan, graph) != 0);
+    int savedErrno = errno;
+
+    /* clean up -- the graph took over the arrays it needs */
+    free(table.symbols);
+    free(table.slots);
+    free(scan.pageIDs);
+    free(scan.pageEdgeStart);
+    free(scan.edgeSymbols);
+    if (data != NULL)
+        munmap((void *)data, size);
+
+    if (failed){
+        linalgebra_graph_free(graph);
+        errno = savedErrno;
+        return -1;
+    }
+    return 0;
+}
+
+/******** Helper: fills in a graph file header ******/
+static void linkextract_graph_header(linalgebra_graph_header_t *header, size_t numNodes, size_t numEdges){
+    header->magic = htonl(LINALGEBRA_GRAPH_MAGIC);
+    header->numNodes = htonl((uint32_t)numNodes);
+    header->numEdgesHigh = htonl((uint32_t)((uint64_t)numEdges >> 32));
+    header->numEdgesLow = htonl((uint32_t)numEdges);
+}
+/******** Helper: writes count 32-bit values in network byte order; -1 on a short write ******/
+static int linkextract_write_uint32(FILE *f, const uint32_t *values, size_t count){
+    uint32_t buffer[1024];
+    while (count > 0){
+        size_t n = LINALGEBRA_MIN(count, 1024);
+        size_t k;
+        for(k=0; k<n; k++)
+            buffer[k] = htonl(values[k]);
+        if (fwrite(buffer, sizeof(uint32_t), n, f) != n)
+            return -1;
+        values += n;
+        count -= n;
+    }
+    return 0;
+}
+/******** Helper: streams the spilled link symbols back in and writes each page's resolved row to the graph file ******/
+static int linkextract_resolve_to_file(linkextract_table_t *table, linkextract_scan_t *scan, FILE *graphFile, size_t *numEdges){
+    size_t N = scan->numPages;
+    uint32_t *row = NULL;
+    size_t rowCapacity = 0;
+    size_t written = 0;
+    size_t i;
+
+    rewind(scan->edgeFile);
+    for(i=0; i<N; i++){
+        size_t rowLength = ((i + 1 < N) ? scan->pageEdgeStart[i + 1] : scan->numEdges) - scan->pageEdgeStart[i];
+        if (rowLength > rowCapacity){
+            uint32_t *newRow = realloc(row, rowLength * sizeof(uint32_t));
+            if (newRow == NULL)
+                goto fail;
+            row = newRow;
+            rowCapacity = rowLength;
+        }
+        if (fread(row, sizeof(uint32_t), rowLength, scan->edgeFile) != rowLength){
+            errno = EIO;
+            goto fail;
+        }
+
+        // same rules as linkextract_resolve: drop links out of the collection, then sort and de-duplicate
+        size_t kept = 0;
+        size_t e;
+        for(e=0; e<rowLength; e++){
+            int64_t node = table->symbols[row[e]].node;
+            if (node >= 0)
+                row[kept++] = (uint32_t)node;
+        }
+        qsort(row, kept, sizeof(uint32_t), &linkextract_compare);
+        size_t unique = 0;
+        for(e=0; e<kept; e++){
+            if (e == 0 || row[e] != row[unique - 1])
+                row[unique++] = row[e];
+        }
+
+        uint32_t degree = (uint32_t)unique;
+        if (linkextract_write_uint32(graphFile, &degree, 1) != 0 || linkextract_write_uint32(graphFile, row, unique) != 0)
+            goto fail;
+        written += unique;
+    }
+    free(row);
+    *numEdges = written;
+    return 0;
+
+fail:
+    free(row);
+    return -1;
+}
+
+/****************************
+    def linkextract_collection_to_file(filename, graphFilename):
+        the out-of-core version of linkextract_collection: the same walk and the same resolved rows, but written
+        to graphFilename in the linalgebra_graph_header_t format instead of being built in memory.
+        Link symbols are spilled to graphFilename.edges while scanning, so only the pageIDs, one row and the
+        table of distinct titles/link targets are ever held in memory -- never the edges themselves.
+        returns 0, or -1 with errno set
+*************************************/
+int linkextract_collection_to_file(const char *filename, const char *graphFilename, linkextract_stats_t *stats, size_t *numNodes, size_t *numEdges){
+    memset(stats, 0, sizeof(linkextract_stats_t));
+    *numNodes = 0;
+    *numEdges = 0;
+
+    const char *data;
+    size_t size;
+    if (linkextract_map(filename, &data, &size) != 0)
+        return -1;
+
+    linkextract_table_t table;
+    linkextract_scan_t scan;
+    memset(&table, 0, sizeof(table));
+    memset(&scan, 0, sizeof(scan));
+    FILE *graphFile = NULL;
+    int failed = 0;
+
+    size_t nameLength = strlen(graphFilename);
+    char *edgeFilename = malloc(nameLength + 7);
+    if (edgeFilename == NULL)
+        failed = 1;
+    else {
+        memcpy(edgeFilename, graphFilename, nameLength);
+        memcpy(edgeFilename + nameLength, ".edges", 7);
+        scan.edgeFile = fopen(edgeFilename, "w+b");
+        failed = (scan.edgeFile == NULL);
+    }
+    if (!failed){
+        setvbuf(scan.edgeFile, NULL, _IOFBF, LINALGEBRA_IO_BUFFER_SIZE);
+        failed = (linkextract_scan_collection(data, size, &table, &scan, stats) != 0 || fflush(scan.edgeFile) != 0);
+    }
+    if (!failed){
+        graphFile = fopen(graphFilename, "wb");
+        failed = (graphFile == NULL);
+    }
+    if (!failed){
+        setvbuf(graphFile, NULL, _IOFBF, LINALGEBRA_IO_BUFFER_SIZE);
+
+        // the header is written again once the number of edges is known
+        linalgebra_graph_header_t header;
+        linkextract_graph_header(&header, scan.numPages, 0);
+        failed = (fwrite(&header, sizeof(header), 1, graphFile) != 1);
+        if (!failed)
+            failed = (linkextract_resolve_to_file(&table, &scan, graphFile, numEdges) != 0);
+
+        // pageIDs go after the rows, high word first
+        size_t i;
+        for(i=0; i<scan.numPages && !failed; i++){
+            uint32_t words[2];
+            words[0] = (uint32_t)((uint64_t)(int64_t)scan.pageIDs[i] >> 32);
+            words[1] = (uint32_t)((uint64_t)(int64_t)scan.pageIDs[i]);
+            failed = (linkextract_write_uint32(graphFile, words, 2) != 0);
+        }
+
+        if (!failed){
+            linkextract_graph_header(&header, scan.numPages, *numEdges);
+            failed = (fseek(graphFile, 0, SEEK_SET) != 0 || fwrite(&header, sizeof(header), 1, graphFile) != 1);
+        }
+    }
+    int savedErrno = errno;
+
+    /* clean up -- the spilled symbols are only needed until the rows are resolved */
+    if (graphFile != NULL && fclose(graphFile) != 0 && !failed){
+        failed = 1;
+        savedErrno = errno;
+    }
+    if (scan.edgeFile != NULL){
+        fclose(scan.edgeFile);
+        unlink(edgeFilename);
+    }
+    free(edgeFilename);
+    free(table.symbols);
+    free(table.slots);
+    free(scan.pageIDs);
+    free(scan.pageEdgeStart);
+    if (data != NULL)
+        munmap((void *)data, size);
+
+    if (failed){
+        if (graphFile != NULL)
+            unlink(graphFilename);
+        errno = savedErrno;
+        return -1;
+    }
+    *numNodes = scan.numPages;
+    return 0;
+}
+
+/* frees whatever arrays the graph owns */
+void linalgebra_graph_free(linalgebra_graph_t *graph){
+    free(graph->pageIDs);
+    free(graph->offsets);
+    free(graph->targets);
+    graph->pageIDs = NULL;
+    graph->offsets = NULL;
+    graph->targets = NULL;
+}
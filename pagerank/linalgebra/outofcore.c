@@ -0,0 +1,194 @@
+/*
+    outofcore
+    PageRank power iteration streamed from a link graph file, for graphs too big to hold in memory.
+    Only the rank vectors live in memory; every iteration reads the file's rows once, front to back,
+    and pushes each page's share out to the pages it links to.
+*/
+
+#include "linalgebra.h"
+#include <errno.h>
+#include <math.h>
+#include <string.h>
+#include <fcntl.h>
+#include <sys/stat.h>
+#include <arpa/inet.h>
+
+#define OUTOFCORE_CHUNK_SIZE 65536
+
+/* Sequential reader over the 32-bit values of a graph file */
+typedef struct outofcore_reader {
+    FILE *f;
+    uint32_t *buffer;
+    size_t position;
+    size_t count;
+} outofcore_reader_t;
+
+/******** Helper: refills the reader's buffer; -1 at the end of the file or on a read error ******/
+static int outofcore_fill(outofcore_reader_t *reader){
+    reader->count = fread(reader->buffer, sizeof(uint32_t), OUTOFCORE_CHUNK_SIZE, reader->f);
+    reader->position = 0;
+    if (reader->count == 0){
+        errno = ferror(reader->f) ? EIO : EINVAL; // a row ran past the end of the file
+        return -1;
+    }
+    return 0;
+}
+/******** Helper: next value from the file, in host byte order ******/
+static int outofcore_next(outofcore_reader_t *reader, uint32_t *value){
+    if (reader->position == reader->count && outofcore_fill(reader) != 0)
+        return -1;
+    *value = ntohl(reader->buffer[reader->position++]);
+    return 0;
+}
+
+/****************************
+    def linalgebra_graph_file_open(graphFile, filename):
+        opens a file written by linkextract_collection_to_file and checks its header against its size
+        returns 0, or -1 with errno set (EINVAL when it isn't a graph file)
+*************************************/
+int linalgebra_graph_file_open(linalgebra_graph_file_t *graphFile, const char *filename){
+    memset(graphFile, 0, sizeof(linalgebra_graph_file_t));
+    FILE *f = fopen(filename, "rb");
+    if (f == NULL)
+        return -1;
+
+    linalgebra_graph_header_t header;
+    struct stat graphStat;
+    if (fread(&header, sizeof(header), 1, f) != 1 || fstat(fileno(f), &graphStat) == -1){
+        fclose(f);
+        errno = EINVAL;
+        return -1;
+    }
+    size_t N = ntohl(header.numNodes);
+    uint64_t numEdges = ((uint64_t)ntohl(header.numEdgesHigh) << 32) | ntohl(header.numEdgesLow);
+    uint64_t expected = sizeof(header) + 4*((uint64_t)N + numEdges) + 8*(uint64_t)N;
+    if (ntohl(header.magic) != LINALGEBRA_GRAPH_MAGIC || (uint64_t)graphStat.st_size != expected){
+        fclose(f);
+        errno = EINVAL;
+        return -1;
+    }
+    setvbuf(f, NULL, _IOFBF, LINALGEBRA_IO_BUFFER_SIZE);
+#ifdef POSIX_FADV_SEQUENTIAL
+    posix_fadvise(fileno(f), 0, 0, POSIX_FADV_SEQUENTIAL);
+#endif
+
+    graphFile->f = f;
+    graphFile->N = N;
+    graphFile->numEdges = (size_t)numEdges;
+    return 0;
+}
+
+/****************************
+    def linalgebra_graph_file_page_ids(graphFile, pageIDs):
+        reads the pageID of every node (they're stored after the rows) into pageIDs
+        returns 0, or -1 with errno set
+*************************************/
+int linalgebra_graph_file_page_ids(linalgebra_graph_file_t *graphFile, long *pageIDs){
+    off_t offset = (off_t)(sizeof(linalgebra_graph_header_t) + 4*((uint64_t)graphFile->N + graphFile->numEdges));
+    if (fseeko(graphFile->f, offset, SEEK_SET) != 0)
+        return -1;
+    uint32_t words[2];
+    size_t i;
+    for(i=0; i<graphFile->N; i++){
+        if (fread(words, sizeof(uint32_t), 2, graphFile->f) != 2){
+            errno = EIO;
+            return -1;
+        }
+        pageIDs[i] = (long)(int64_t)(((uint64_t)ntohl(words[0]) << 32) | ntohl(words[1]));
+    }
+    return 0;
+}
+
+/****************************
+    def linalgebra_solve_file(graphFile, alpha, iterations, pagerank, stats):
+        same power iteration as linalgebra_solve, streamed from the file:
+            temp = [alpha/N*sum(pagerank)]*N
+            for each row i in the file:  temp[j] += pagerank[i]*(1-alpha)/outdegree(i)  for every j in row i
+            pagerank = temp/norm(temp)
+        Sums are taken in a different order than linalgebra_solve, so results agree to rounding, not bit for bit.
+        returns 0, or -1 with errno set
+*************************************/
+int linalgebra_solve_file(linalgebra_graph_file_t *graphFile, double alpha, int iterations, double *pagerank, linalgebra_iteration_t *stats){
+    size_t N = graphFile->N;
+    if (N == 0 || iterations <= 0)
+        return 0;
+
+    outofcore_reader_t reader = {graphFile->f, NULL, 0, 0};
+    reader.buffer = malloc(OUTOFCORE_CHUNK_SIZE * sizeof(uint32_t));
+    double *temp = malloc(N * sizeof(double));
+    int status = -1;
+    if (reader.buffer == NULL || temp == NULL){
+        errno = ENOMEM;
+        goto cleanup;
+    }
+
+    size_t i, j;
+    double sum = 0;
+    for(i=0; i<N; i++)
+        sum = sum + pagerank[i];
+    int k;
+    for(k=0; k<iterations; k++){
+        double base = sum * (alpha/N);
+        for(j=0; j<N; j++)
+            temp[j] = base;
+
+        if (fseeko(graphFile->f, (off_t)sizeof(linalgebra_graph_header_t), SEEK_SET) != 0)
+            goto cleanup;
+        reader.position = 0;
+        reader.count = 0;
+        for(i=0; i<N; i++){
+            uint32_t outdegree;
+            if (outofcore_next(&reader, &outdegree) != 0)
+                goto cleanup;
+            double share = (outdegree > 0) ? pagerank[i] * ((1-alpha)/outdegree) : 0; // no links: the row is all alpha/N
+            while (outdegree > 0){
+                if (reader.position == reader.count && outofcore_fill(&reader) != 0)
+                    goto cleanup;
+                size_t n = LINALGEBRA_MIN(outdegree, reader.count - reader.position);
+                const uint32_t *targets = reader.buffer + reader.position;
+                size_t e;
+                for(e=0; e<n; e++){
+                    uint32_t target = ntohl(targets[e]);
+                    if (target >= N){
+                        errno = EINVAL;
+                        goto cleanup;
+                    }
+                    temp[target] += share;
+                }
+                reader.position += n;
+                outdegree -= (uint32_t)n;
+            }
+        }
+
+        double normsq = 0;
+        double residual = 0;
+        for(j=0; j<N; j++){
+            normsq = normsq + temp[j]*temp[j];
+            residual = residual + (pagerank[j] - temp[j])*(pagerank[j] - temp[j]);
+        }
+        double norm = sqrt(normsq);
+        sum = 0;
+        for(j=0; j<N; j++){
+            pagerank[j] = temp[j]/norm;
+            sum = sum + pagerank[j];
+        }
+        if (stats != NULL){
+            stats[k].residual = residual;
+            stats[k].norm = norm;
+            stats[k].sum = sum;
+        }
+    }
+    status = 0;
+
+cleanup:
+    free(reader.buffer);
+    free(temp);
+    return status;
+}
+
+/* closes the file, if it's open */
+void linalgebra_graph_file_close(linalgebra_graph_file_t *graphFile){
+    if (graphFile->f != NULL)
+        fclose(graphFile->f);
+    graphFile->f = NULL;
+}
@@ -3,7 +3,7 @@
 
 from distutils.core import setup, Extension
 
-linalgebra = Extension("linalgebra", sources = ["linalgebra.c"])
+linalgebra = Extension("linalgebra", sources = ["linalgebra.c", "linkextract.c", "solver.c", "outofcore.c"], libraries = ["pthread"])
 
 setup(
     name = "linalgebra",
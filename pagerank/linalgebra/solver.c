@@ -0,0 +1,372 @@
+/*
+    solver
+    Multi-threaded PageRank power iteration over a CSR link graph.  Runs without touching any Python
+    objects, so the caller can release the GIL for the whole solve.
+
+    Several vectors (one per personalization/teleport vector) can be solved at once: they're stored
+    node-major as an N x K block, so each in-link is followed once per iteration for all K of them.
+
+    Each iteration is pull-based over the transposed graph: every thread owns a range of destination
+    nodes and sums the shares flowing into them, in increasing order of source node.  Sums over the
+    whole vector are taken per fixed-size block and the block sums are then added in block order, so
+    the result is bit-for-bit the same no matter how many threads run it.
+*/
+
+#include "linalgebra.h"
+#include <errno.h>
+#include <math.h>
+#include <string.h>
+#include <pthread.h>
+#include <unistd.h>
+
+#define SOLVER_BLOCK_SIZE 1024
+
+/* A reusable barrier (pthread_barrier_t isn't available everywhere) */
+typedef struct solver_barrier {
+    pthread_mutex_t mutex;
+    pthread_cond_t cond;
+    int count;
+    int waiting;
+    unsigned long generation;
+} solver_barrier_t;
+
+/* State shared by the worker threads */
+typedef struct solver_shared {
+    size_t N;
+    size_t K;                   // number of vectors solved together; every per-node array below has K entries per node
+    size_t numBlocks;
+    double alpha;
+    int iterations;
+    const double *teleport;     // N x K teleport vectors, each summing to 1 -- NULL for the uniform alpha/N
+    unsigned long *inOffsets;   // transposed graph: node j is linked from inSources[inOffsets[j]] .. inSources[inOffsets[j+1]-1]
+    uint32_t *inSources;
+    double *factor;             // (1-alpha)/outdegree, or 0 for nodes without links
+    double *pagerank;
+    double *temp;
+    double *contrib;            // pagerank[i]*factor[i]
+    double *blockSum;           // per-block (and per-vector) sums of pagerank, of temp^2 and of (pagerank-temp)^2
+    double *blockNormsq;
+    double *blockResidual;
+    linalgebra_iteration_t *stats; // K entries per iteration
+    solver_barrier_t barrier;
+    pthread_mutex_t gateMutex;  // workers wait here until every thread has been created
+    pthread_cond_t gateCond;
+    int gate;                   // 0 while starting up, 1 to go, -1 to give up
+} solver_shared_t;
+
+/* One worker's slice: blocks [firstBlock, lastBlock) */
+typedef struct solver_worker {
+    solver_shared_t *shared;
+    size_t firstBlock;
+    size_t lastBlock;
+    int index;
+    double *scratch;            // K doubles
+} solver_worker_t;
+
+static void solver_barrier_init(solver_barrier_t *barrier, int count){
+    pthread_mutex_init(&(barrier->mutex), NULL);
+    pthread_cond_init(&(barrier->cond), NULL);
+    barrier->count = count;
+    barrier->waiting = 0;
+    barrier->generation = 0;
+}
+static void solver_barrier_destroy(solver_barrier_t *barrier){
+    pthread_mutex_destroy(&(barrier->mutex));
+    pthread_cond_destroy(&(barrier->cond));
+}
+static void solver_barrier_wait(solver_barrier_t *barrier){
+    if (barrier->count == 1)
+        return;
+    pthread_mutex_lock(&(barrier->mutex));
+    unsigned long generation = barrier->generation;
+    if (++(barrier->waiting) == barrier->count){
+        barrier->waiting = 0;
+        barrier->generation++;
+        pthread_cond_broadcast(&(barrier->cond));
+    }
+    else {
+        while (generation == barrier->generation)
+            pthread_cond_wait(&(barrier->cond), &(barrier->mutex));
+    }
+    pthread_mutex_unlock(&(barrier->mutex));
+}
+/******** Helper: sums vector c's per-block values in block order ******/
+static double solver_total(const double *blocks, size_t numBlocks, size_t K, size_t c){
+    double total = 0;
+    size_t b;
+    for(b=0; b<numBlocks; b++)
+        total = total + blocks[b*K + c];
+    return total;
+}
+
+/****************************
+    one worker's share of every iteration, for each of the K vectors:
+        contrib = pagerank*factor                                   (own blocks)
+        temp[j] = alpha*sum(pagerank)*teleport[j] + sum(contrib[i] for i linking to j)  (own blocks)
+        pagerank = temp/norm(temp)                                  (own blocks)
+    with barriers in between so every thread sees the others' blocks
+*************************************/
+static void *solver_work(void *arg){
+    solver_worker_t *worker = (solver_worker_t *)arg;
+    solver_shared_t *shared = worker->shared;
+    size_t N = shared->N;
+    size_t K = shared->K;
+    size_t first = worker->firstBlock * SOLVER_BLOCK_SIZE;
+    size_t last = LINALGEBRA_MIN(worker->lastBlock * SOLVER_BLOCK_SIZE, N);
+    double *base = worker->scratch;
+    size_t b, c, i, j;
+    unsigned long e;
+    int k;
+    for(k=0; k<shared->iterations; k++){
+        for(i=first; i<last; i++){
+            for(c=0; c<K; c++)
+                shared->contrib[i*K + c] = shared->pagerank[i*K + c] * shared->factor[i];
+        }
+        solver_barrier_wait(&(shared->barrier));
+
+        for(c=0; c<K; c++){
+            double sum = solver_total(shared->blockSum, shared->numBlocks, K, c);
+            base[c] = (shared->teleport == NULL) ? sum * (shared->alpha/N) : sum * shared->alpha;
+        }
+        for(b=worker->firstBlock; b<worker->lastBlock; b++){
+            double *normsq = shared->blockNormsq + b*K;
+            double *residual = shared->blockResidual + b*K;
+            for(c=0; c<K; c++){
+                normsq[c] = 0;
+                residual[c] = 0;
+            }
+            size_t end = LINALGEBRA_MIN((b+1) * SOLVER_BLOCK_SIZE, N);
+            for(j=b * SOLVER_BLOCK_SIZE; j<end; j++){
+                double *value = shared->temp + j*K;
+                if (shared->teleport == NULL){
+                    for(c=0; c<K; c++)
+                        value[c] = base[c];
+                }
+                else {
+                    for(c=0; c<K; c++)
+                        value[c] = base[c] * shared->teleport[j*K + c];
+                }
+                for(e=shared->inOffsets[j]; e<shared->inOffsets[j+1]; e++){
+                    const double *in = shared->contrib + (size_t)shared->inSources[e]*K;
+                    for(c=0; c<K; c++)
+                        value[c] += in[c];
+                }
+                for(c=0; c<K; c++){
+                    double change = shared->pagerank[j*K + c] - value[c];
+                    normsq[c] = normsq[c] + value[c]*value[c];
+                    residual[c] = residual[c] + change*change;
+                }
+            }
+        }
+        solver_barrier_wait(&(shared->barrier));
+
+        double *norm = base; // base isn't needed again this iteration
+        for(c=0; c<K; c++)
+            norm[c] = sqrt(solver_total(shared->blockNormsq, shared->numBlocks, K, c));
+        for(b=worker->firstBlock; b<worker->lastBlock; b++){
+            double *sum = shared->blockSum + b*K;
+            for(c=0; c<K; c++)
+                sum[c] = 0;
+            size_t end = LINALGEBRA_MIN((b+1) * SOLVER_BLOCK_SIZE, N);
+            for(j=b * SOLVER_BLOCK_SIZE; j<end; j++){
+                for(c=0; c<K; c++){
+                    shared->pagerank[j*K + c] = shared->temp[j*K + c]/norm[c];
+                    sum[c] = sum[c] + shared->pagerank[j*K + c];
+                }
+            }
+        }
+        solver_barrier_wait(&(shared->barrier));
+
+        if (worker->index == 0 && shared->stats != NULL){
+            for(c=0; c<K; c++){
+                shared->stats[k*K + c].residual = solver_total(shared->blockResidual, shared->numBlocks, K, c);
+                shared->stats[k*K + c].norm = norm[c];
+                shared->stats[k*K + c].sum = solver_total(shared->blockSum, shared->numBlocks, K, c);
+            }
+        }
+    }
+    return NULL;
+}
+
+/******** Helper: entry point of the extra threads -- waits for the go-ahead before starting ******/
+static void *solver_thread(void *arg){
+    solver_shared_t *shared = ((solver_worker_t *)arg)->shared;
+    pthread_mutex_lock(&(shared->gateMutex));
+    while (shared->gate == 0)
+        pthread_cond_wait(&(shared->gateCond), &(shared->gateMutex));
+    int go = (shared->gate > 0);
+    pthread_mutex_unlock(&(shared->gateMutex));
+    return go ? solver_work(arg) : NULL;
+}
+static void solver_open_gate(solver_shared_t *shared, int value){
+    pthread_mutex_lock(&(shared->gateMutex));
+    shared->gate = value;
+    pthread_cond_broadcast(&(shared->gateCond));
+    pthread_mutex_unlock(&(shared->gateMutex));
+}
+
+/******** Helper: builds the transposed graph, with each node's in-links in increasing order of source ******/
+static int solver_transpose(const linalgebra_graph_t *graph, unsigned long *inOffsets, uint32_t *inSources){
+    size_t N = graph->N;
+    size_t i;
+    unsigned long e;
+    memset(inOffsets, 0, (N + 1) * sizeof(unsigned long));
+    for(e=0; e<graph->numEdges; e++)
+        inOffsets[graph->targets[e] + 1]++;
+    for(i=0; i<N; i++)
+        inOffsets[i+1] += inOffsets[i];
+    unsigned long *fill = malloc(LINALGEBRA_MAX(N, 1) * sizeof(unsigned long));
+    if (fill == NULL)
+        return -1;
+    memcpy(fill, inOffsets, N * sizeof(unsigned long));
+    for(i=0; i<N; i++){
+        for(e=graph->offsets[i]; e<graph->offsets[i+1]; e++)
+            inSources[fill[graph->targets[e]]++] = (uint32_t)i;
+    }
+    free(fill);
+    return 0;
+}
+
+/******** Helper: splits the blocks into (at most) numThreads slices of roughly equal work (nodes plus in-links) ******/
+static int solver_partition(solver_shared_t *shared, solver_worker_t *workers, int numThreads){
+    double totalWork = (double)shared->N + (double)shared->inOffsets[shared->N];
+    double workPerThread = totalWork / numThreads;
+    size_t block = 0;
+    int t;
+    for(t=0; t<numThreads && block<shared->numBlocks; t++){
+        workers[t].shared = shared;
+        workers[t].index = t;
+        workers[t].firstBlock = block;
+        double work = 0;
+        // the last thread takes whatever is left
+        while (block < shared->numBlocks && (work < workPerThread || t == numThreads - 1)){
+            size_t start = block * SOLVER_BLOCK_SIZE;
+            size_t end = LINALGEBRA_MIN((block+1) * SOLVER_BLOCK_SIZE, shared->N);
+            work += (double)(end - start) + (double)(shared->inOffsets[end] - shared->inOffsets[start]);
+            block++;
+        }
+        workers[t].lastBlock = block;
+    }
+    return t;
+}
+
+/* number of threads to use when asked for threads <= 0: one per online processor */
+int linalgebra_default_threads(void){
+    long cpus = sysconf(_SC_NPROCESSORS_ONLN);
+    return (cpus > 0) ? (int)cpus : 1;
+}
+
+/****************************
+    def linalgebra_solve(graph, alpha, iterations, threads, pagerank, stats):
+        runs <iterations> power iterations of pagerank = pagerank*P / norm(pagerank*P), starting from the
+        vector passed in and leaving the result there; stats[k] gets iteration k's residual, norm and sum
+        returns 0, or -1 with errno set
+*************************************/
+int linalgebra_solve(const linalgebra_graph_t *graph, double alpha, int iterations, int threads, double *pagerank, linalgebra_iteration_t *stats){
+    return linalgebra_solve_block(graph, alpha, iterations, threads, 1, NULL, pagerank, stats);
+}
+
+/****************************
+    def linalgebra_solve_block(graph, alpha, iterations, threads, K, teleport, pagerank, stats):
+        linalgebra_solve for K vectors at once, each with its own teleport vector: pagerank and teleport are
+        N x K, node-major (pagerank[i*K + c] is vector c's value for node i), and each teleport column sums to 1.
+        With teleport NULL every vector teleports uniformly, which for K = 1 is exactly linalgebra_solve.
+        stats[k*K + c] gets vector c's residual, norm and sum after iteration k
+        returns 0, or -1 with errno set
+*************************************/
+int linalgebra_solve_block(const linalgebra_graph_t *graph, double alpha, int iterations, int threads, size_t K, const double *teleport, double *pagerank, linalgebra_iteration_t *stats){
+    size_t N = graph->N;
+    if (N == 0 || K == 0 || iterations <= 0)
+        return 0;
+    if (threads <= 0)
+        threads = linalgebra_default_threads();
+
+    solver_shared_t shared;
+    memset(&shared, 0, sizeof(shared));
+    shared.N = N;
+    shared.K = K;
+    shared.numBlocks = (N + SOLVER_BLOCK_SIZE - 1) / SOLVER_BLOCK_SIZE;
+    shared.alpha = alpha;
+    shared.iterations = iterations;
+    shared.teleport = teleport;
+    shared.pagerank = pagerank;
+    shared.stats = stats;
+    shared.inOffsets = malloc((N + 1) * sizeof(unsigned long));
+    shared.inSources = malloc(LINALGEBRA_MAX(graph->numEdges, 1) * sizeof(uint32_t));
+    shared.factor = malloc(N * sizeof(double));
+    shared.temp = malloc(N * K * sizeof(double));
+    shared.contrib = malloc(N * K * sizeof(double));
+    shared.blockSum = malloc(shared.numBlocks * K * sizeof(double));
+    shared.blockNormsq = malloc(shared.numBlocks * K * sizeof(double));
+    shared.blockResidual = malloc(shared.numBlocks * K * sizeof(double));
+    threads = LINALGEBRA_MIN(threads, (int)LINALGEBRA_MIN(shared.numBlocks, 1024));
+    solver_worker_t *workers = malloc(threads * sizeof(solver_worker_t));
+    pthread_t *handles = malloc(threads * sizeof(pthread_t));
+    double *scratch = malloc(threads * K * sizeof(double));
+
+    int status = -1;
+    if (shared.inOffsets == NULL || shared.inSources == NULL || shared.factor == NULL || shared.temp == NULL || shared.contrib == NULL
+        || shared.blockSum == NULL || shared.blockNormsq == NULL || shared.blockResidual == NULL || workers == NULL || handles == NULL
+        || scratch == NULL || solver_transpose(graph, shared.inOffsets, shared.inSources) != 0){
+        errno = ENOMEM;
+        goto cleanup;
+    }
+
+    size_t i, b, c;
+    for(i=0; i<N; i++){
+        unsigned long outdegree = graph->offsets[i+1] - graph->offsets[i];
+        shared.factor[i] = (outdegree > 0) ? (1-alpha)/outdegree : 0; // no links: the row is all teleport
+    }
+    for(b=0; b<shared.numBlocks; b++){
+        for(c=0; c<K; c++){
+            double sum = 0;
+            for(i=b * SOLVER_BLOCK_SIZE; i<LINALGEBRA_MIN((b+1) * SOLVER_BLOCK_SIZE, N); i++)
+                sum = sum + pagerank[i*K + c];
+            shared.blockSum[b*K + c] = sum;
+        }
+    }
+
+    threads = solver_partition(&shared, workers, threads);
+    int t;
+    for(t=0; t<threads; t++)
+        workers[t].scratch = scratch + t*K;
+    solver_barrier_init(&(shared.barrier), threads);
+    pthread_mutex_init(&(shared.gateMutex), NULL);
+    pthread_cond_init(&(shared.gateCond), NULL);
+    int started = 1;
+    for(t=1; t<threads; t++){
+        if (pthread_create(&(handles[t]), NULL, &solver_thread, &(workers[t])) != 0)
+            break;
+        started++;
+    }
+    solver_open_gate(&shared, (started == threads) ? 1 : -1);
+    if (started == threads)
+        solver_work(&(workers[0]));
+    for(t=1; t<started; t++)
+        pthread_join(handles[t], NULL);
+    solver_barrier_destroy(&(shared.barrier));
+    pthread_mutex_destroy(&(shared.gateMutex));
+    pthread_cond_destroy(&(shared.gateCond));
+    if (started != threads){
+        // couldn't get every thread we wanted -- the answer is the same with one, just slower
+        solver_worker_t single = {&shared, 0, shared.numBlocks, 0, scratch};
+        solver_barrier_init(&(shared.barrier), 1);
+        solver_work(&single);
+        solver_barrier_destroy(&(shared.barrier));
+    }
+    status = 0;
+
+cleanup:
+    free(shared.inOffsets);
+    free(shared.inSources);
+    free(shared.factor);
+    free(shared.temp);
+    free(shared.contrib);
+    free(shared.blockSum);
+    free(shared.blockNormsq);
+    free(shared.blockResidual);
+    free(workers);
+    free(handles);
+    free(scratch);
+    return status;
+}
@@ -1,58 +1,170 @@
 # pagerank main file
 import sys
+import itertools
 import linalgebra
+import instrument
+import prstore
 # global variables
 alpha = 0.1
 iterations = 128
+threads = 0 # worker threads for the C pagerank iterations -- 0 means one per processor; the output is the same either way
 
 
 
 # computes pagerank of collection and writes pagerank out to file where the ith line is the ith component of the pagerank vector
 # input: 1) filename of collection of documents
 #        2) filename of document to write to
-def main(collection_filename, output_filename):
+#        3) optional number of worker threads (defaults to the global above)
+#        4) optional filename to also write the pagerank to as a binary store, for looking up scores by pageID (see prstore.py)
+def main(collection_filename, output_filename, threads=threads, store_filename=None):
+    linalgebra.set_progress(instrument.callback)
+    # 1) extract the links in C: id_list of pageIDs in the order found, and the adjacency matrix as (offsets, targets) arrays,
+    #    where row i (the ith page found) links to the pages at positions targets[offsets[i]:offsets[i+1]] of id_list
+    with instrument.stage('extract_links'):
+        (id_list, offsets, targets) = linalgebra.extract_links(collection_filename)
+    # 2) compute pagerank straight off those arrays
+    with instrument.stage('compute_pagerank'):
+        pagerank = linalgebra.compute_pagerank((offsets, targets), alpha, id_list, iterations, threads)
+    # print pagerank to file
+    with instrument.stage('print_output'):
+        print_output(output_filename, pagerank, id_list)
+    if store_filename is not None:
+        with instrument.stage('write_store'):
+            prstore.write_store(store_filename, pagerank, id_list)
+    instrument.report()
+    return
+
+# out-of-core version, for link graphs too big to hold in memory: the links are written to graph_filename, sorted by
+# source page, and the file is streamed through once per iteration -- only the pagerank vectors stay in memory.
+# Gives the same output as main to rounding.
+# input: 1) filename of collection of documents
+#        2) filename of document to write to
+#        3) filename for the on-disk link graph (left in place afterwards, so it can be reused)
+#        4) optional filename to also write the pagerank to as a binary store
+def main_out_of_core(collection_filename, output_filename, graph_filename, store_filename=None):
+    linalgebra.set_progress(instrument.callback)
+    with instrument.stage('write_link_graph'):
+        linalgebra.write_link_graph(collection_filename, graph_filename)
+    with instrument.stage('compute_pagerank'):
+        (id_list, pagerank) = linalgebra.compute_pagerank_file(graph_filename, alpha, iterations)
+    with instrument.stage('print_output'):
+        print_output(output_filename, pagerank, id_list)
+    if store_filename is not None:
+        with instrument.stage('write_store'):
+            prstore.write_store(store_filename, pagerank, id_list)
+    instrument.report()
+    return
+
+# topic-sensitive version: one pagerank vector per topic, where a topic is a k-means cluster (from a clusterKM.dat file)
+# or an SVM category (from a labelSVM.dat file), and teleporting lands only on that topic's pages.
+# All the topics are solved together in a single pass over the link graph per iteration.
+# input: 1) filename of collection of documents
+#        2) filename of document to write to -- the ith line holds the ith page's score under each topic, space
+#           separated, with the topics in sorted order
+#        3) filename of the clusterKM.dat or labelSVM.dat file the topics come from
+#        4) 'clusters' or 'labels', saying which kind of file that is
+#        5) for labels, filename of the test.dat file (from create_test_set.py) the labels were predicted for
+# output: sorted list of topics (the columns of the output file)
+def main_topics(collection_filename, output_filename, topics_filename, kind='clusters', test_filename=None, threads=threads):
+    linalgebra.set_progress(instrument.callback)
+    with instrument.stage('extract_links'):
+        (id_list, offsets, targets) = linalgebra.extract_links(collection_filename)
+    if kind == 'labels':
+        topic_pages = read_labels(topics_filename, test_filename)
+    else:
+        topic_pages = read_clusters(topics_filename)
+    topics = sorted(topic_pages)
+    with instrument.stage('compute_pagerank'):
+        vectors = linalgebra.compute_personalized_pagerank((offsets, targets), alpha, id_list, [topic_pages[t] for t in topics], iterations, threads)
+    with instrument.stage('print_output'):
+        f = open(output_filename, 'w')
+        for values in zip(*vectors):
+            f.write(' '.join(str(value) for value in values)+'\n')
+        f.close()
+    instrument.report()
+    return topics
+
+# input:  filename of a clusterKM.dat file: lines of <pageID> <cluster> (pages that weren't clustered have no cluster)
+# output: dictionary {cluster: [pageIDs in that cluster]}
+def read_clusters(clusterKM_filename):
+    topic_pages = {}
+    f = open(clusterKM_filename, 'r')
+    for line in f:
+        fields = line.split()
+        if len(fields) == 2:
+            topic_pages.setdefault(int(fields[1]), []).append(int(fields[0]))
+    f.close()
+    return topic_pages
+
+# input:  1) filename of a labelSVM.dat file: the ith line holds the (space separated, possibly no) labels of the page
+#            on the ith line of the test set
+#         2) filename of that test.dat file, where each line ends with a # <pageID> comment (see create_test_set.py)
+# output: dictionary {label: [pageIDs with that label]}
+def read_labels(labelSVM_filename, test_filename):
+    test = open(test_filename, 'r')
+    labels = open(labelSVM_filename, 'r')
+    topic_pages = {}
+    for (test_line, line) in itertools.izip_longest(test, labels):
+        if test_line is None or line is None:
+            raise ValueError(labelSVM_filename+' and '+test_filename+' have different numbers of lines')
+        if not '#' in test_line:
+            raise ValueError(test_filename+' has no pageIDs -- recreate it with create_test_set.py')
+        pageID = int(test_line.rsplit('#', 1)[1])
+        for label in line.split():
+            topic_pages.setdefault(int(label), []).append(pageID)
+    labels.close()
+    test.close()
+    return topic_pages
+
+# version that parses in python and hands the adjacency matrix to the C module as a dictionary
+def main1(collection_filename, output_filename, threads=threads):
     # 1) create dictionary mapping title_map: {title: DocID}, dictionary mapping link_map: {docID: set(link for link in document)}, sorted list of docIDs
-    (title_map, link_map, id_list) = parse(collection_filename)
-    print('parsed')
+    with instrument.stage('parse'):
+        (title_map, link_map, id_list) = parse(collection_filename)
     # 2) create adjancy matrix A  as dictionary mapping row to list of nnz entries {i:[j for j in docIDs if i links to j]}
-    A = create_adjacency_matrix(title_map, link_map)
-    print('create_adjacency_matrix')
-    pagerank = linalgebra.compute_pagerank(A, alpha, id_list, iterations)
-    print('done with pagerank')
+    with instrument.stage('create_adjacency_matrix'):
+        A = create_adjacency_matrix(title_map, link_map)
+    with instrument.stage('compute_pagerank'):
+        linalgebra.set_progress(instrument.callback)
+        pagerank = linalgebra.compute_pagerank(A, alpha, id_list, iterations, threads)
     # print pagerank to file
-    print_output(output_filename, pagerank, id_list)
+    with instrument.stage('print_output'):
+        print_output(output_filename, pagerank, id_list)
+    instrument.report()
     return
 
 # version that uses python rather than C module
 def main2(collection_filename, output_filename):
     # 1) create dictionary mapping title_map: {title: DocID}, dictionary mapping link_map: {docID: set(link for link in document)}, sorted list of docIDs
-    (title_map, link_map, id_list) = parse(collection_filename)
-    print('parsed')
+    with instrument.stage('parse'):
+        (title_map, link_map, id_list) = parse(collection_filename)
     # 2) create adjancy matrix A  as dictionary mapping row to list of nnz entries {i:[j for j in docIDs if i links to j]}
-    A = create_adjacency_matrix(title_map, link_map)
-    print('create_adjacency_matrix')
+    with instrument.stage('create_adjacency_matrix'):
+        A = create_adjacency_matrix(title_map, link_map)
 
     # 3) create stochastic matrix P from A, as defined in section 12.2.1 of textbook with damping factor alpha=0.1
-    P = create_stochastic_matrix(A, alpha, id_list) # alpha defined as global variable above
-    print('create_stochastic_matrix')
+    with instrument.stage('create_stochastic_matrix'):
+        P = create_stochastic_matrix(A, alpha, id_list) # alpha defined as global variable above
     # create initial vector x with its only 1 in the first entry
     x = {j:0 for j in id_list}
     x[id_list[0]]=1
-    print('now to compute pagerank')
     # now compute pagerank after so many vector-matrix-multiply iterations of x*P
-    pagerank = compute_pagerank(x,P, id_list, 128)
+    with instrument.stage('compute_pagerank'):
+        pagerank = compute_pagerank(x,P, id_list, 128)
     # print pagerank to file
-    print_output(output_filename, pagerank, id_list)
+    with instrument.stage('print_output'):
+        print_output(output_filename, [pagerank[i] for i in id_list], id_list)
+    instrument.report()
     return #(A,P,pagerank)
 
 # input:  1) filename of output file to write to
-#         2) pagerank to represent on file
+#         2) pagerank to represent on file, as a sequence aligned to id_list (pagerank[n] is the value for id_list[n])
 #         3) sorted list of docIDs (sorted in the order they were found in collection)
 # prints to file such that the ith line of the file is the ith component of the pagerank -- should be in same order documents were found in collection
 def print_output(output_filename, pagerank, id_list):
     f = open(output_filename, 'w')
-    for i in id_list:
-        f.write(str(pagerank[i])+'\n')
+    for value in pagerank:
+        f.write(str(value)+'\n')
     f.close()
 
 # input:  1) vector x:={pageID: value for pageID in collection}
@@ -65,7 +177,7 @@ def compute_pagerank(x,P,id_list,iterations):
     pagerank = x
     while count < iterations:
         new_pagerank = pagerank_P_multiply(pagerank, P, id_list)
-        print('iteration: '+str(count)+', squared norm of difference: '+str(difference_normsq(pagerank, new_pagerank)))
+        instrument.progress('pagerank_iteration', iteration=count, residual=difference_normsq(pagerank, new_pagerank))
         pagerank = new_pagerank
         count += 1
     return pagerank
@@ -88,9 +200,6 @@ def pagerank_P_multiply(vector, P, keys):
                 result[j] += v_i*nnz_entry
             else:
                 result[j] += v_i*zero_entry
-    print('result:')
-    for j in keys:
-        print('result['+str(j)+']='+str(result[j]))
     return result
 
 # builds SPARSE stochastic matrix P from adjacency matrix as defined in section 12.2.1 of textbook
@@ -193,6 +302,8 @@ def parse(fname):
         title_map[title] = docID 
         link_map[docID] = link_set
         id_list.append(docID)
+        instrument.count('pages_parsed')
+        instrument.count('links_extracted', len(link_set))
         
         currline = f.readline() # now we're done with this page, so lets keep parsing next page
 
@@ -200,4 +311,20 @@ def parse(fname):
     f.close()
     return (title_map, link_map, id_list)
 
-main(sys.argv[1], sys.argv[2])
+if __name__ == '__main__':
+    argv = sys.argv
+    store_filename = None
+    if '--store' in argv: # --store <store_filename> also writes the binary store, alongside the text output
+        i = argv.index('--store')
+        store_filename = argv[i+1]
+        argv = argv[:i]+argv[i+2:]
+    if len(argv) > 4 and argv[3] == '--out-of-core':
+        main_out_of_core(argv[1], argv[2], argv[4], store_filename)
+    elif len(argv) > 4 and argv[3] == '--clusters':
+        main_topics(argv[1], argv[2], argv[4], 'clusters')
+    elif len(argv) > 5 and argv[3] == '--labels': # --labels <labelSVM_filename> <test_filename>
+        main_topics(argv[1], argv[2], argv[4], 'labels', argv[5])
+    elif len(argv) > 3:
+        main(argv[1], argv[2], int(argv[3]), store_filename)
+    else:
+        main(argv[1], argv[2], threads, store_filename)
@@ -0,0 +1 @@
+../common/prstore.py
\ No newline at end of file
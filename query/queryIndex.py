@@ -0,0 +1,104 @@
+# queryIndex.py
+# thin client to query_server.py, taking the same arguments: reads queries from stdin, one per line, and prints the
+# top pageIDs for each on its own line.  A server for the index is started in the background the first time, and
+# every later run just connects to it, so answering a query no longer includes loading the index.  The server's output
+# goes to <socket_path>.log (<index_filename>.log when it listens on a TCP address).
+# Usage: python queryIndex.py <stopwords_filename> <index_filename> [<pagerank_filename> [<collection_filename>]]
+#                             [--address <address>] [--cache <entries>] [--ttl <seconds>]
+import sys
+import os
+import time
+import socket
+import subprocess
+from query_server import parse_arguments
+
+window = 64             # queries sent ahead of the answers read back
+startup_timeout = 120   # seconds to wait for a new server to load the index
+
+# input:  address -- Unix socket path or (host, port)
+# output: connected socket, or None if no server is listening there
+def connect(address):
+    if isinstance(address, tuple):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+# input:  output of parse_arguments
+# output: filename the server's output goes to -- next to its Unix socket, or next to the index for a TCP address
+def log_filename(arguments):
+    address = arguments[4]
+    if isinstance(address, tuple):
+        return os.path.abspath(arguments[1])+'.log'
+    return address+'.log'
+
+# starts query_server.py with the given arguments, detached from this process, with its output going to log_name
+# output: the server's Popen handle
+def start_server(argv, log_name):
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_server.py')
+    devnull = open(os.devnull, 'r')
+    log = open(log_name, 'w')
+    process = subprocess.Popen([sys.executable, server] + list(argv), stdin=devnull, stdout=log, stderr=subprocess.STDOUT,
+                               close_fds=True, preexec_fn=os.setsid)
+    devnull.close()
+    log.close()
+    return process
+
+# input:  filename of the server's log
+# output: its last few lines, for an error message
+def log_tail(log_name, lines=10):
+    try:
+        f = open(log_name, 'r')
+    except IOError:
+        return ''
+    tail = f.readlines()[-lines:]
+    f.close()
+    return ''.join(tail)
+
+# input: 1) command line arguments, passed on to the server if one has to be started
+#        2) file of queries, one per line
+#        3) file to write the answers to
+def main(argv, queries=sys.stdin, output=sys.stdout):
+    arguments = parse_arguments(argv)
+    address = arguments[4]
+    sock = connect(address)
+    if sock is None:
+        log = log_filename(arguments)
+        process = start_server(argv, log)
+        deadline = time.time() + startup_timeout
+        while sock is None and time.time() < deadline:
+            time.sleep(0.05)
+            # a server that exited without anyone listening won't start listening later
+            exited = process.poll() is not None
+            sock = connect(address)
+            if sock is None and exited:
+                raise IOError('query server exited with status '+str(process.returncode)+' before listening on '
+                              +str(address)+'; '+log+' ends with:\n'+log_tail(log))
+        if sock is None:
+            raise IOError('query server did not start listening on '+str(address)+' within '+str(startup_timeout)
+                          +'s; see '+log)
+
+    # keep up to <window> queries in flight, reading an answer for each one sent beyond that
+    answers = sock.makefile('rb')
+    in_flight = 0
+    for query in queries:
+        sock.sendall(query.rstrip('\r\n')+'\n')
+        in_flight += 1
+        if in_flight == window:
+            output.write(answers.readline())
+            in_flight -= 1
+    sock.shutdown(socket.SHUT_WR)
+    while in_flight > 0:
+        output.write(answers.readline())
+        in_flight -= 1
+    output.flush()
+    answers.close()
+    sock.close()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
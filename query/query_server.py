@@ -0,0 +1,396 @@
+# query_server.py
+# long-running query server: opens the index once (lazily, through searchio's SparseIndex) along with the stopwords
+# and pagerank, then answers queries over a Unix socket or local TCP, so no query pays for loading them.
+#
+# Protocol: the client sends one query per line and gets back one line per query, in the order it sent them --
+# the pageIDs of the top results, best first, separated by spaces.  Queries that are in flight at the same time
+# (from any number of connections) are answered as one batch, so a term shared by several of them has its
+# postings fetched once.  Once max_pending queries are waiting, or a connection has max_unsent answers it isn't
+# reading, the server stops reading from connections until it catches up.
+#
+# Answers are cached by the query's tokens (after stopwords are dropped and the rest stemmed), so a popular query is
+# only ranked once -- the least recently used answers are evicted past cache_size of them, and with a ttl, answers
+# older than that are ranked again.  The server looks at the index file every index_check_interval seconds, and when
+# it has been replaced (e.g. by createIndex writing a new one into place) reopens it and drops every cached answer.
+#
+# Built on asyncore/asynchat, since the pipeline is python 2 (asyncio is python 3 only).
+#
+# Usage: python query_server.py <stopwords_filename> <index_filename> [<pagerank_filename> [<collection_filename>]]
+#                                [--address <address>] [--cache <entries>] [--ttl <seconds>]
+#   the address is a Unix socket path or host:port, and defaults to <index_filename>.sock -- the collection is only
+#   needed when the pagerank is in the text format rather than a store written by prstore.py.  --cache 0 turns the
+#   answer cache off, and without --ttl cached answers last until they're evicted or the index changes
+import sys
+import os
+import time
+import math
+import heapq
+import itertools
+import errno
+import signal
+import socket
+import asyncore
+import asynchat
+from collections import OrderedDict
+import searchio
+import instrument
+import prstore
+
+num_results = 10       # pageIDs returned per query
+max_pending = 256      # queries waiting for an answer before the server stops reading
+max_batch = 64         # queries answered together
+max_unsent = 256       # answers queued on one connection before the server stops reading its queries
+pagerank_weight = 1.0  # a result's score is scaled by (1 + pagerank_weight*pagerank/max pagerank)
+cache_size = 10000     # answers kept in the cache
+cache_ttl = None       # seconds an answer stays in the cache, or None to keep it until it's evicted
+index_check_interval = 1.0 # seconds between looks at whether the index file has been replaced
+
+
+# input:  command line arguments, as for this script or queryIndex.py
+# output: (stopwords_filename, index_filename, pagerank_filename or None, collection_filename or None, address,
+#          cache size, cache ttl or None)
+def parse_arguments(argv):
+    argv = list(argv)
+    options = {'--address': None, '--cache': cache_size, '--ttl': cache_ttl}
+    for option in options:
+        if option in argv:
+            i = argv.index(option)
+            options[option] = argv[i+1]
+            del argv[i:i+2]
+    if len(argv) < 2:
+        raise ValueError('usage: <stopwords_filename> <index_filename> [<pagerank_filename> [<collection_filename>]] '
+                         '[--address <address>] [--cache <entries>] [--ttl <seconds>]')
+    (stopwords_filename, index_filename) = argv[:2]
+    pagerank_filename = argv[2] if len(argv) > 2 else None
+    collection_filename = argv[3] if len(argv) > 3 else None
+    address = options['--address']
+    if address is None:
+        address = os.path.abspath(index_filename)+'.sock'
+    ttl = options['--ttl']
+    if ttl is not None:
+        ttl = float(ttl)
+    return (stopwords_filename, index_filename, pagerank_filename, collection_filename, parse_address(address),
+            int(options['--cache']), ttl)
+
+# input:  address string -- a Unix socket path, or host:port
+# output: the path, or a (host, port) tuple
+def parse_address(address):
+    if not '/' in address and ':' in address:
+        (host, port) = address.rsplit(':', 1)
+        return (host or 'localhost', int(port))
+    return address
+
+# input:  filename of the stopwords file
+# output: set of stopwords
+def read_stopwords(stopwords_filename):
+    f = open(stopwords_filename, 'r')
+    stopwords = set(line.rstrip('\n') for line in f)
+    f.close()
+    return stopwords
+
+# input:  1) filename of a pagerank store, or of a pagerank text file where the ith line is the pagerank of the ith page
+#            of the collection
+#         2) filename of the collection, for the pageID of each page -- only needed for the text format
+# output: PageRankStore, or dictionary {pageID: pagerank} read from the text format
+def read_pagerank(pagerank_filename, collection_filename=None):
+    if prstore.is_store(pagerank_filename):
+        return prstore.PageRankStore(pagerank_filename)
+    if collection_filename is None:
+        raise ValueError(pagerank_filename+' is a pagerank text file, so the collection is needed for its pageIDs')
+    (pagerank, id_list) = prstore.read_text(pagerank_filename, collection_filename)
+    return dict(zip(id_list, pagerank))
+
+# input:  filename of the index
+# output: what identifies this version of the file -- it changes when a new index is written over it
+def index_generation(index_filename):
+    s = os.stat(index_filename)
+    return (s.st_dev, s.st_ino, s.st_size, s.st_mtime)
+
+# input:  filename of the index
+# output: (generation, SparseIndex, number of documents) -- the generation is taken first, so a file replaced while
+#         it's being opened is only ever seen as changed, never as unchanged
+def open_index(index_filename):
+    generation = index_generation(index_filename)
+    # ranking only needs the pageIDs and wf's, so the positions are never decoded
+    (index, numDocuments) = searchio.loadSparseIndex(index_filename, False)
+    return (generation, index, numDocuments)
+
+
+# the answers to recent queries, keyed by the query's tokens: least recently used first, so the oldest go when it's full
+class ResultCache(object):
+    # input: 1) most answers kept -- 0 keeps none
+    #        2) seconds an answer is good for, or None for as long as it's kept
+    def __init__(self, size=cache_size, ttl=cache_ttl, clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict() # {tokens: (time it expires or None, pageIDs)}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # input:  tuple of a query's tokens
+    # output: the cached pageIDs for it, or None
+    def get(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None and entry[0] is not None and entry[0] <= self.clock():
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            instrument.count('cache_misses')
+            return None
+        self.entries[key] = entry # back to most recently used
+        self.hits += 1
+        instrument.count('cache_hits')
+        return entry[1]
+
+    def put(self, key, pageIDs):
+        if self.size <= 0:
+            return
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        self.entries.pop(key, None)
+        self.entries[key] = (expires, tuple(pageIDs))
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # drops every answer -- they were for an index that's gone
+    def invalidate(self):
+        self.entries.clear()
+        self.invalidations += 1
+
+    # output: fraction of lookups answered from the cache
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return float(self.hits)/lookups if lookups else 0.0
+
+    def stats(self):
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hit_ratio(),
+                'evictions': self.evictions, 'expirations': self.expirations, 'invalidations': self.invalidations}
+
+
+# one client connection: reads queries a line at a time and writes answers back in the same order
+class QueryChannel(asynchat.async_chat):
+    def __init__(self, server, sock):
+        asynchat.async_chat.__init__(self, sock, map=server.map)
+        self.server = server
+        self.received = []
+        self.finished = False # set once the client has stopped sending
+        self.set_terminator('\n')
+
+    def collect_incoming_data(self, data):
+        self.received.append(data)
+
+    def found_terminator(self):
+        query = ''.join(self.received).rstrip('\r')
+        self.received = []
+        self.server.submit(self, query)
+
+    # backpressure: leave queries in the socket while the server or this client is behind
+    def readable(self):
+        if self.finished or len(self.server.pending) >= max_pending or len(self.producer_fifo) >= max_unsent:
+            return False
+        return asynchat.async_chat.readable(self)
+
+    def respond(self, line):
+        self.push(line+'\n')
+
+    # the first time around the client may only be done sending, so whatever it sent before that still gets answered
+    def handle_close(self):
+        if not self.finished:
+            self.finished = True
+            if self.server.waiting(self):
+                return
+            if self.producer_fifo:
+                self.close_when_done()
+                return
+        self.server.drop(self)
+        self.close()
+
+
+# listens for connections and answers the queries that come in on them
+class QueryServer(asyncore.dispatcher):
+    # input: 1) address -- Unix socket path or (host, port)
+    #        2) set of stopwords
+    #        3) SparseIndex and number of documents, as returned by searchio.loadSparseIndex
+    #        4) PageRankStore or dictionary {pageID: pagerank}, or None to rank on the index alone
+    #        5) ResultCache for the answers, or None to not cache them
+    #        6) filename and generation of the index, to reopen it when it's replaced -- or None to never look
+    def __init__(self, address, stopwords, index, numDocuments, pagerank=None, cache=None, index_filename=None, generation=None):
+        self.map = {}
+        asyncore.dispatcher.__init__(self, map=self.map)
+        self.address = address
+        self.stopwords = stopwords
+        self.index = index
+        self.numDocuments = numDocuments
+        self.cache = cache if cache is not None else ResultCache(0)
+        self.index_filename = index_filename
+        self.generation = generation
+        self.last_check = time.time()
+        self.pagerank = pagerank
+        self.max_pagerank = 0
+        if isinstance(pagerank, prstore.PageRankStore):
+            self.max_pagerank = pagerank.max_score
+        elif pagerank:
+            self.max_pagerank = max(pagerank.values())
+        self.pending = [] # [(channel, tokens)] in the order they arrived
+
+        if isinstance(address, tuple):
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+        else:
+            remove_stale_socket(address)
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.bind(address)
+        self.listen(64)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            QueryChannel(self, pair[0])
+            instrument.count('connections')
+
+    def submit(self, channel, query):
+        self.pending.append((channel, searchio.tokenize(self.stopwords, query, False)))
+
+    # output: True if any of channel's queries are still waiting for an answer
+    def waiting(self, channel):
+        for (c, tokens) in self.pending:
+            if c is channel:
+                return True
+        return False
+
+    # forgets the queries of a connection that went away
+    def drop(self, channel):
+        self.pending = [(c, tokens) for (c, tokens) in self.pending if c is not channel]
+
+    # reopens the index if a new one has been written over it since it was opened, dropping the cached answers
+    def check_index(self):
+        if self.index_filename is None or time.time() - self.last_check < index_check_interval:
+            return
+        self.last_check = time.time()
+        try:
+            if index_generation(self.index_filename) == self.generation:
+                return
+            (generation, index, numDocuments) = open_index(self.index_filename)
+        except (IOError, OSError): # e.g. caught between a new index being removed and put in place -- keep the old one
+            return
+        (self.generation, self.index, self.numDocuments) = (generation, index, numDocuments)
+        self.cache.invalidate()
+        instrument.count('index_reloads')
+        instrument.progress('index_reload', terms=len(index), documents=numDocuments)
+
+    # answers up to max_batch waiting queries -- from the cache where it can, fetching the postings of each distinct
+    # term of the rest once, and ranking each distinct query once
+    def answer_pending(self):
+        self.check_index()
+        batch = self.pending[:max_batch]
+        del self.pending[:max_batch]
+        answers = {} # {tokens: pageIDs, or None until ranked}
+        terms = set()
+        references = 0
+        for (channel, tokens) in batch:
+            key = tuple(tokens)
+            if key in answers:
+                continue
+            answers[key] = self.cache.get(key)
+            if answers[key] is None:
+                terms.update(tokens)
+                references += len(set(tokens))
+        postings = {}
+        for term in sorted(terms):
+            if term in self.index:
+                postings[term] = self.index[term]
+        for key in answers:
+            if answers[key] is None:
+                answers[key] = self.rank(key, postings)
+                self.cache.put(key, answers[key])
+        instrument.count('queries_answered', len(batch))
+        instrument.count('postings_fetched', len(postings))
+        instrument.count('postings_shared', references - len(terms))
+        instrument.progress('query_batch', queries=len(batch), terms=len(terms), pending=len(self.pending),
+                            cache_hit_ratio=self.cache.hit_ratio())
+        for (channel, tokens) in batch:
+            if channel.connected: # it may have hung up while earlier answers were being sent
+                channel.respond(' '.join(str(pageID) for pageID in answers[tuple(tokens)]))
+        # hang up on clients that are done sending once they've had every answer
+        for channel in set(channel for (channel, tokens) in batch):
+            if channel.connected and channel.finished and not self.waiting(channel):
+                channel.close_when_done()
+
+    # input:  1) tokens of a query
+    #         2) dictionary {term: [df, searchio.Postings]} covering those tokens
+    # output: the num_results best pageIDs, by tf-idf (each page's wf times the term's idf, summed over the query),
+    #         scaled up by pagerank when there is one -- ties go to the lower pageID
+    def rank(self, tokens, postings):
+        scores = {}
+        for term in tokens:
+            if not term in postings:
+                continue
+            (df, postings_list) = postings[term]
+            idf = math.log(float(self.numDocuments)/df) if df else 0
+            for (pageID, wf) in itertools.izip(postings_list.pageIDs, postings_list.wf): # skips building each posting's list
+                scores[pageID] = scores.get(pageID, 0) + wf*idf
+        if self.pagerank and self.max_pagerank:
+            get = self.pagerank.get
+            for pageID in scores:
+                scores[pageID] *= 1 + pagerank_weight*get(pageID, 0)/self.max_pagerank
+        best = heapq.nsmallest(num_results, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [pageID for (pageID, score) in best]
+
+    def serve_forever(self):
+        try:
+            while self.map:
+                # don't sit waiting while there are queries to answer -- just pick up whatever else has arrived
+                asyncore.loop(0 if self.pending else 1.0, True, self.map, 1)
+                if self.pending:
+                    self.answer_pending()
+        finally:
+            asyncore.close_all(self.map)
+            if not isinstance(self.address, tuple) and os.path.exists(self.address):
+                os.unlink(self.address)
+
+# removes a Unix socket left behind by a server that has gone, but refuses to take over one that's still answering
+def remove_stale_socket(path):
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as e:
+        if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+            os.unlink(path)
+            return
+        raise
+    finally:
+        probe.close()
+    raise socket.error(errno.EADDRINUSE, 'a query server is already listening on '+path)
+
+
+# input: command line arguments (see the top of the file)
+def main(argv):
+    (stopwords_filename, index_filename, pagerank_filename, collection_filename, address, size, ttl) = parse_arguments(argv)
+    with instrument.stage('load'):
+        stopwords = read_stopwords(stopwords_filename)
+        (generation, index, numDocuments) = open_index(index_filename)
+        pagerank = None
+        if pagerank_filename is not None:
+            pagerank = read_pagerank(pagerank_filename, collection_filename)
+    cache = ResultCache(size, ttl)
+    server = QueryServer(address, stopwords, index, numDocuments, pagerank, cache, index_filename, generation)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0)) # so the socket gets cleaned up
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    instrument.progress('query_cache', **cache.stats())
+    instrument.report()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -7,7 +7,7 @@
 #export PYTHONPATH="/course/cs158/src/lib/btrees/py26"
 
 # Main program to be executed
-MAIN="queryIndex.py"
+MAIN="query/queryIndex.py"
 
 # Call $MAIN and pass all the script arguments
 python $MAIN $@
@@ -1,5 +1,7 @@
 # Create the test set for use with svm_classify. If an optional training.dat file is produced,
 # it limits the test.dat file to contain only pageIDs found in training.dat.
+# Each line ends with a "# <pageID>" comment, which svm_classify ignores, so the predictions
+# (and the labelSVM.dat built from them) can be matched back to their pages.
 # Usage:
 #   python create_test_set.py vecrep.dat test.dat [training.dat]
 
@@ -31,13 +33,13 @@ def recreate_vecrep(vecrep_filename, normalized_bool):
 	return vecrep
 
 # Write out a new SVM classifying file with the given vector representation
-def export_test_data(vecrep, output_filename):
+def export_test_data(vecrep, output_filename, training_filename=None):
 	output = open(output_filename, 'w')
 	
 	# load training data, if necessary
 	pageIDs = set(vecrep.keys())
-	if len(sys.argv) == 4:
-		training = open(sys.argv[3], 'r')
+	if training_filename:
+		training = open(training_filename, 'r')
 		pageIDs = set()
 		for line in training:
 			(pageID, c) = line.split()
@@ -51,12 +53,14 @@ def export_test_data(vecrep, output_filename):
 			pageString = "0"
 			for feature, val in sorted(feature_vector.items()):
 				pageString += ' '+str(feature + 1)+':'+str(val)
+			pageString += ' # '+str(pageID)
 			output.write(pageString + '\n')
 	
 	output.close()
 
-def main(vecrep_filename, output_filename):
+def main(vecrep_filename, output_filename, training_filename=None):
 	vecrep = recreate_vecrep(vecrep_filename, True)
-	export_test_data(vecrep, output_filename)
+	export_test_data(vecrep, output_filename, training_filename)
 
-main(sys.argv[1], sys.argv[2])
+if __name__ == '__main__':
+	main(*sys.argv[1:4])
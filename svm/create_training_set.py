@@ -1,8 +1,11 @@
 # Create a training set for use with SVM
 # Usage (e.g., for category 4):
-#   python create_training_set.py vecrep.dat training.dat 4 svmtraining4.dat
+#   python create_training_set.py vecrep.dat training.dat 4 svmtraining4.dat [duplicates.dat]
+# where duplicates.dat, if given, lists near-duplicate pages found by dedup.py -- they're left out, so a page with
+# mirrors doesn't weigh more than the rest.
 
 import sys, math
+import dedup
 
 # Given a vector representation of our data, recreate a native Python version
 def recreate_vecrep(vecrep_filename, normalized_bool):
@@ -30,7 +33,7 @@ def recreate_vecrep(vecrep_filename, normalized_bool):
 	return vecrep
 
 # Scan the training file, and write out a new SVM training file according to the given category
-def export_training_data(vecrep, training_filename, category, output_filename):
+def export_training_data(vecrep, training_filename, category, output_filename, duplicates={}):
 	output = open(output_filename, 'w')
 	training = open(training_filename, 'r')
 	
@@ -39,7 +42,7 @@ def export_training_data(vecrep, training_filename, category, output_filename):
 		pageID = int(pageID)
 		c = int(c)
 		
-		if pageID in vecrep:
+		if pageID in vecrep and not pageID in duplicates:
 			feature_vector = vecrep[pageID]
 			designator = "+1" if category == c else "-1"
 			pageString = designator
@@ -50,8 +53,9 @@ def export_training_data(vecrep, training_filename, category, output_filename):
 	training.close()
 	output.close()
 
-def main(vecrep_filename, training_filename, category, output_filename):
+def main(vecrep_filename, training_filename, category, output_filename, duplicates_filename=None):
 	vecrep = recreate_vecrep(vecrep_filename, True)
-	export_training_data(vecrep, training_filename, int(category), output_filename)
+	export_training_data(vecrep, training_filename, int(category), output_filename, dedup.read_duplicates(duplicates_filename))
 
-main(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
+if __name__ == '__main__':
+	main(*sys.argv[1:6])
@@ -0,0 +1 @@
+../k_means/dedup.py
\ No newline at end of file
@@ -0,0 +1,543 @@
+/*
+    IndexWriter
+    Writes CS158 Search Engine indices: buffered, encoded in parallel, and published atomically.
+
+    Writing happens in two steps.  While holding the GIL, indexwriter_prepare pulls the terms and
+    postings out of the Python index into flat host-order arrays (postings that are already Postings
+    objects are used as they are), keeping only what the index's profile holds, and encodes the header
+    and term entries.  Then indexwriter_write,
+    which touches no Python objects, has worker threads encode the postings a shard of terms at a time
+    into large buffers while the calling thread writes the finished shards out in order.
+
+    The index goes to a temporary file next to the real one, which is synced and then renamed over it,
+    so readers only ever see the old index or the complete new one.
+*/
+
+#include "indexwriter.h"
+#include <errno.h>
+#include <fcntl.h>
+#include <string.h>
+#include <unistd.h>
+#include <pthread.h>
+#include <sys/stat.h>
+#include <arpa/inet.h>
+#include "searchio.h"
+#include "postings.h"
+
+/* Most worker threads used when the caller leaves it up to us */
+#define INDEXWRITER_MAX_THREADS 8
+
+/* State shared by the writing thread and the workers */
+typedef struct indexwriter_pipeline {
+    indexwriter_t *writer;
+    size_t nextShard;               // next shard for a worker to pick up
+    size_t written;                 // shards written out so far
+    size_t window;                  // how far the workers may get ahead of the writing, in shards
+    int failed;                     // errno of the first failure, if any
+    pthread_mutex_t mutex;
+    pthread_cond_t cond;
+} indexwriter_pipeline_t;
+
+/* Helpers */
+static int indexwriter_gather(indexwriter_term_t *term, PyObject *postings, int profile);
+static int indexwriter_encode(indexwriter_t *writer, indexwriter_shard_t *shard);
+static void *indexwriter_work(void *arg);
+static int indexwriter_write_all(int fd, const char *data, size_t size);
+static void indexwriter_sync_directory(const char *filename);
+
+/* Preparing, with the GIL held */
+int indexwriter_prepare(indexwriter_t *writer, uint32_t numDocuments, PyObject *index, int profile)
+{
+    memset(writer, 0, sizeof(*writer));
+    writer->numDocuments = numDocuments;
+    writer->profile = profile;
+
+    if (!PyDict_Check(index))
+    {
+        PyErr_SetString(PyExc_TypeError, "the index must be a dictionary {term: [df, postings]}");
+        return -1;
+    }
+
+    /* get the number of terms in the index */
+    Py_ssize_t numTermsPy = PyDict_Size(index);
+    if (numTermsPy > 0 && numTermsPy < UINT32_MAX)
+        writer->numTerms = (uint32_t)numTermsPy;
+    else
+    {
+        PyErr_SetString(PyExc_MemoryError, "the number of terms is greater than UINT32_MAX (or less than 0)");
+        return -1;
+    }
+
+    /* the keys list keeps the term strings alive -- any Postings objects we encode from get appended to it */
+    writer->keep = PyDict_Keys(index);
+    writer->terms = (indexwriter_term_t *)calloc(writer->numTerms, sizeof(indexwriter_term_t));
+    if (writer->keep == NULL || writer->terms == NULL)
+    {
+        if (writer->keep != NULL)
+            PyErr_NoMemory();
+        return -1;
+    }
+
+    /* pull out each term, its df, and its postings */
+    size_t tableSize = sizeof(searchio_index_profile_t) + sizeof(searchio_index_header_t);
+    size_t postingsSize = 0;
+    uint32_t t;
+    for (t = 0; t < writer->numTerms; t++)
+    {
+        indexwriter_term_t *term = &(writer->terms[t]);
+        PyObject *key = PyList_GET_ITEM(writer->keep, t);
+        if (!PyString_Check(key))
+        {
+            PyErr_SetString(PyExc_TypeError, "index terms must be strings");
+            return -1;
+        }
+        if (PyString_GET_SIZE(key) > UINT16_MAX)
+        {
+            PyErr_Format(PyExc_ValueError, "the term '%.40s...' is longer than %d characters", PyString_AS_STRING(key), UINT16_MAX);
+            return -1;
+        }
+        term->term = PyString_AS_STRING(key);
+        term->termLength = (uint16_t)PyString_GET_SIZE(key);
+
+        PyObject *value = PySequence_Fast(PyDict_GetItem(index, key), "index entries must be [df, postings]");
+        if (value == NULL)
+            return -1;
+        if (PySequence_Fast_GET_SIZE(value) < 2)
+        {
+            Py_DECREF(value);
+            PyErr_SetString(PyExc_ValueError, "index entries must be [df, postings]");
+            return -1;
+        }
+        term->df = (uint32_t)PyInt_AsUnsignedLongMask(PySequence_Fast_GET_ITEM(value, 0));
+        int result = PyErr_Occurred() ? -1 : indexwriter_gather(term, PySequence_Fast_GET_ITEM(value, 1), profile);
+        if (result == 0 && term->block == NULL)
+            result = PyList_Append(writer->keep, PySequence_Fast_GET_ITEM(value, 1));
+        Py_DECREF(value);
+        if (result < 0)
+            return -1;
+
+        /* the offsets in the file are 32 bits */
+        if (postingsSize > UINT32_MAX)
+        {
+            PyErr_SetString(PyExc_ValueError, "the postings are too large for the index's 32-bit offsets");
+            return -1;
+        }
+        term->postingsOffset = (uint32_t)postingsSize;
+        postingsSize += term->postingsSize;
+        tableSize += sizeof(searchio_index_term_t) + term->termLength;
+    }
+    if (tableSize > UINT32_MAX)
+    {
+        PyErr_SetString(PyExc_ValueError, "the terms are too large for the index's 32-bit offsets");
+        return -1;
+    }
+
+    /* encode the document header and the term entries */
+    writer->tableSize = tableSize;
+    writer->table = (char *)malloc(tableSize);
+    if (writer->table == NULL)
+    {
+        PyErr_NoMemory();
+        return -1;
+    }
+    searchio_index_profile_t prefix = {htonl(SEARCHIO_INDEX_MAGIC), htonl((uint32_t)profile)};
+    searchio_index_header_t header = {htonl(numDocuments), htonl(writer->numTerms), htonl((uint32_t)tableSize)};
+    memcpy(writer->table, &prefix, sizeof(prefix));
+    memcpy(writer->table + sizeof(prefix), &header, sizeof(header));
+    char *out = writer->table + sizeof(prefix) + sizeof(header);
+    for (t = 0; t < writer->numTerms; t++)
+    {
+        indexwriter_term_t *term = &(writer->terms[t]);
+        searchio_index_term_t entry;
+        entry.postingsOffset = htonl(term->postingsOffset);
+        entry.df = htonl(term->df);
+        entry.numDocumentsInPostings = htonl(term->numPostings);
+        entry.termLength = htons(term->termLength);
+        memcpy(out, &entry, sizeof(entry));
+        memcpy(out + sizeof(entry), term->term, term->termLength);
+        out += sizeof(entry) + term->termLength;
+    }
+
+    /* split the terms into shards of about INDEXWRITER_SHARD_SIZE bytes of postings */
+    writer->shards = (indexwriter_shard_t *)calloc(writer->numTerms, sizeof(indexwriter_shard_t));
+    if (writer->shards == NULL)
+    {
+        PyErr_NoMemory();
+        return -1;
+    }
+    indexwriter_shard_t *shard = &(writer->shards[0]);
+    for (t = 0; t < writer->numTerms; t++)
+    {
+        if (shard->size >= INDEXWRITER_SHARD_SIZE)
+        {
+            shard++;
+            shard->firstTerm = t;
+        }
+        shard->lastTerm = t + 1;
+        shard->size += writer->terms[t].postingsSize;
+    }
+    writer->numShards = (shard - writer->shards) + 1;
+
+    return 0;
+}
+
+/* pulls a term's postings -- a Postings object, or a list of [pageID, wf, [positions]] -- into flat arrays, with only
+   as much of each posting as the profile keeps */
+static int indexwriter_gather(indexwriter_term_t *term, PyObject *postings, int profile)
+{
+    const char *message = "a postings list must be a list of [pageID, wf, [positions]]";
+    Py_ssize_t fields = profile + 1;        // how much of each entry is needed
+    int withPositions = (profile == SEARCHIO_PROFILE_POSITIONS);
+
+    /* a Postings object already has the arrays -- as long as it was loaded with everything the profile needs */
+    if (Postings_Check(postings))
+    {
+        if (Postings_arrays(postings, &(term->numPostings), &(term->pageIDs), &(term->wf), &(term->positionOffsets), &(term->positions)) < profile)
+        {
+            PyErr_SetString(PyExc_ValueError, "postings loaded without positions (or wf) can't be written to an index whose profile keeps them");
+            return -1;
+        }
+        term->postingsSize = (term->numPostings * SEARCHIO_POSTING_SIZE(profile));
+        if (withPositions)
+            term->postingsSize += term->positionOffsets[term->numPostings] * sizeof(uint32_t);
+        return 0;
+    }
+
+    PyObject *list = PySequence_Fast(postings, message);
+    if (list == NULL)
+        return -1;
+    Py_ssize_t length = PySequence_Fast_GET_SIZE(list);
+    if (length >= UINT32_MAX)
+    {
+        Py_DECREF(list);
+        PyErr_SetString(PyExc_ValueError, "a postings list has more than UINT32_MAX entries");
+        return -1;
+    }
+
+    /* first pass: count the positions */
+    size_t numPositions = 0;
+    Py_ssize_t i;
+    for (i = 0; i < length; i++)
+    {
+        PyObject *entry = PySequence_Fast(PySequence_Fast_GET_ITEM(list, i), message);
+        if (entry == NULL || PySequence_Fast_GET_SIZE(entry) < fields)
+        {
+            if (entry != NULL)
+                PyErr_SetString(PyExc_ValueError, message);
+            Py_XDECREF(entry);
+            Py_DECREF(list);
+            return -1;
+        }
+        Py_ssize_t positionsLen = withPositions ? PySequence_Size(PySequence_Fast_GET_ITEM(entry, 2)) : 0;
+        Py_DECREF(entry);
+        if (positionsLen < 0)
+        {
+            Py_DECREF(list);
+            return -1;
+        }
+        numPositions += positionsLen;
+    }
+
+    /* allocate all of the arrays in one go */
+    uint32_t *block = (uint32_t *)malloc(((3 * (size_t)length) + 1 + numPositions) * sizeof(uint32_t));
+    if (block == NULL)
+    {
+        Py_DECREF(list);
+        PyErr_NoMemory();
+        return -1;
+    }
+    uint32_t *pageIDs = block;
+    uint32_t *scaledWf = pageIDs + length;
+    uint32_t *positionOffsets = scaledWf + length;
+    uint32_t *positions = positionOffsets + length + 1;
+    term->block = block;
+    term->numPostings = (uint32_t)length;
+    term->pageIDs = pageIDs;
+    term->scaledWf = scaledWf;
+    term->positionOffsets = positionOffsets;
+    term->positions = positions;
+    term->postingsSize = (length * SEARCHIO_POSTING_SIZE(profile)) + (numPositions * sizeof(uint32_t));
+
+    /* second pass: copy the values out */
+    size_t positionIndex = 0;
+    for (i = 0; i < length; i++)
+    {
+        PyObject *entry = PySequence_Fast(PySequence_Fast_GET_ITEM(list, i), message);
+        if (entry == NULL)
+            break;
+        if (PySequence_Fast_GET_SIZE(entry) < fields)
+        {
+            Py_DECREF(entry);
+            PyErr_SetString(PyExc_RuntimeError, "a postings list changed while the index was being written");
+            break;
+        }
+        pageIDs[i] = (uint32_t)PyInt_AsUnsignedLongMask(PySequence_Fast_GET_ITEM(entry, 0));
+        scaledWf[i] = (profile == SEARCHIO_PROFILE_DOCS) ? 0 : (uint32_t)(PyFloat_AsDouble(PySequence_Fast_GET_ITEM(entry, 1)) * SEARCHIO_WF_SCALE);
+        positionOffsets[i] = (uint32_t)positionIndex;
+        if (!withPositions || PyErr_Occurred())
+        {
+            Py_DECREF(entry);
+            if (PyErr_Occurred())
+                break;
+            continue;
+        }
+        PyObject *entryPositions = PySequence_Fast(PySequence_Fast_GET_ITEM(entry, 2), message);
+        Py_DECREF(entry);
+        if (entryPositions == NULL)
+            break;
+
+        Py_ssize_t positionsLen = PySequence_Fast_GET_SIZE(entryPositions);
+        if ((size_t)positionsLen > numPositions - positionIndex)
+        {
+            Py_DECREF(entryPositions);
+            PyErr_SetString(PyExc_RuntimeError, "a postings list changed while the index was being written");
+            break;
+        }
+        Py_ssize_t j;
+        for (j = 0; j < positionsLen; j++)
+            positions[positionIndex++] = (uint32_t)PyInt_AsUnsignedLongMask(PySequence_Fast_GET_ITEM(entryPositions, j));
+        Py_DECREF(entryPositions);
+        if (PyErr_Occurred())
+            break;
+    }
+    Py_DECREF(list);
+    if (i < length)
+        return -1;
+
+    /* a list that shrank between the passes just takes up less room */
+    positionOffsets[length] = (uint32_t)positionIndex;
+    term->postingsSize = (length * SEARCHIO_POSTING_SIZE(profile)) + (positionIndex * sizeof(uint32_t));
+    return 0;
+}
+
+void indexwriter_free(indexwriter_t *writer)
+{
+    uint32_t t;
+    if (writer->terms != NULL)
+    {
+        for (t = 0; t < writer->numTerms; t++)
+            free(writer->terms[t].block);
+        free(writer->terms);
+    }
+    size_t s;
+    if (writer->shards != NULL)
+    {
+        for (s = 0; s < writer->numShards; s++)
+            free(writer->shards[s].buffer);
+        free(writer->shards);
+    }
+    free(writer->table);
+    Py_XDECREF(writer->keep);
+    memset(writer, 0, sizeof(*writer));
+}
+
+/* Writing, without the GIL -- returns 0, or -1 with errno set */
+int indexwriter_write(indexwriter_t *writer, const char *filename, int threads)
+{
+    /* write to a temporary file in the same directory, so it can be renamed over the index */
+    size_t filenameLen = strlen(filename);
+    char *tempFilename = (char *)malloc(filenameLen + 8);
+    if (tempFilename == NULL)
+        return -1;
+    memcpy(tempFilename, filename, filenameLen);
+    memcpy(tempFilename + filenameLen, ".XXXXXX", 8);
+    int fd = mkstemp(tempFilename);
+    if (fd == -1)
+    {
+        free(tempFilename);
+        return -1;
+    }
+
+    int error = 0;
+    if (fchmod(fd, S_IRUSR|S_IWUSR|S_IRGRP|S_IROTH) == -1 || indexwriter_write_all(fd, writer->table, writer->tableSize) == -1)
+        error = errno;
+
+    /* start the workers */
+    if (threads <= 0)
+        threads = (int)SEARCHIO_MIN(SEARCHIO_MAX(sysconf(_SC_NPROCESSORS_ONLN), 1), INDEXWRITER_MAX_THREADS);
+    threads = (int)SEARCHIO_MIN((size_t)threads, writer->numShards);
+    indexwriter_pipeline_t pipeline;
+    pipeline.writer = writer;
+    pipeline.nextShard = 0;
+    pipeline.written = 0;
+    pipeline.window = 2 * (size_t)threads;
+    pipeline.failed = error;
+    pthread_mutex_init(&(pipeline.mutex), NULL);
+    pthread_cond_init(&(pipeline.cond), NULL);
+
+    pthread_t *workers = (pthread_t *)malloc(threads * sizeof(pthread_t));
+    int numWorkers = 0;
+    while (workers != NULL && numWorkers < threads && pthread_create(&(workers[numWorkers]), NULL, &indexwriter_work, &pipeline) == 0)
+        numWorkers++;
+
+    /* write the shards out in order as they're finished -- encoding them here if no workers could be started */
+    size_t s;
+    for (s = 0; s < writer->numShards && error == 0; s++)
+    {
+        indexwriter_shard_t *shard = &(writer->shards[s]);
+        if (numWorkers == 0)
+        {
+            if (indexwriter_encode(writer, shard) == -1)
+                error = errno;
+        }
+        else
+        {
+            pthread_mutex_lock(&(pipeline.mutex));
+            while (!shard->ready && !pipeline.failed)
+                pthread_cond_wait(&(pipeline.cond), &(pipeline.mutex));
+            error = shard->ready ? 0 : pipeline.failed;
+            pthread_mutex_unlock(&(pipeline.mutex));
+        }
+        if (error == 0 && indexwriter_write_all(fd, shard->buffer, shard->size) == -1)
+            error = errno;
+        free(shard->buffer);
+        shard->buffer = NULL;
+
+        pthread_mutex_lock(&(pipeline.mutex));
+        pipeline.written++;
+        if (error != 0 && !pipeline.failed)
+            pipeline.failed = error;
+        pthread_cond_broadcast(&(pipeline.cond));
+        pthread_mutex_unlock(&(pipeline.mutex));
+    }
+
+    /* stop the workers */
+    pthread_mutex_lock(&(pipeline.mutex));
+    if (error != 0 && !pipeline.failed)
+        pipeline.failed = error;
+    pthread_cond_broadcast(&(pipeline.cond));
+    pthread_mutex_unlock(&(pipeline.mutex));
+    int w;
+    for (w = 0; w < numWorkers; w++)
+        pthread_join(workers[w], NULL);
+    free(workers);
+    pthread_mutex_destroy(&(pipeline.mutex));
+    pthread_cond_destroy(&(pipeline.cond));
+
+    /* make sure it's all on disk before it replaces the old index */
+    if (error == 0 && fsync(fd) == -1)
+        error = errno;
+    if (close(fd) == -1 && error == 0)
+        error = errno;
+    if (error == 0 && rename(tempFilename, filename) == -1)
+        error = errno;
+    if (error != 0)
+    {
+        unlink(tempFilename);
+        free(tempFilename);
+        errno = error;
+        return -1;
+    }
+    free(tempFilename);
+    indexwriter_sync_directory(filename);
+    return 0;
+}
+
+/* encodes the postings of a shard's terms into a buffer of their on-disk form -- returns 0, or -1 with errno set */
+static int indexwriter_encode(indexwriter_t *writer, indexwriter_shard_t *shard)
+{
+    size_t postingSize = SEARCHIO_POSTING_SIZE(writer->profile);
+    int withPositions = (writer->profile == SEARCHIO_PROFILE_POSITIONS);
+
+    char *out = (char *)malloc(SEARCHIO_MAX(shard->size, 1));
+    if (out == NULL)
+        return -1;
+    shard->buffer = out;
+
+    uint32_t t;
+    for (t = shard->firstTerm; t < shard->lastTerm; t++)
+    {
+        const indexwriter_term_t *term = &(writer->terms[t]);
+        uint32_t i;
+        for (i = 0; i < term->numPostings; i++)
+        {
+            uint32_t first = term->positionOffsets[i];
+            uint32_t last = withPositions ? term->positionOffsets[i+1] : first;
+
+            /* decoded wf values are exact multiples of 1/SEARCHIO_WF_SCALE, so round them back rather than truncating */
+            searchio_index_posting_t posting;
+            posting.pageID = htonl(term->pageIDs[i]);
+            posting.wf = htonl(term->wf != NULL ? (uint32_t)((term->wf[i] * SEARCHIO_WF_SCALE) + 0.5) : term->scaledWf[i]);
+            posting.numPositions = htonl(last - first);
+            memcpy(out, &posting, postingSize);
+            out += postingSize;
+
+            uint32_t j;
+            for (j = first; j < last; j++)
+            {
+                uint32_t p = htonl(term->positions[j]);
+                memcpy(out, &p, sizeof(p));
+                out += sizeof(p);
+            }
+        }
+    }
+    return 0;
+}
+
+/* a worker: encodes shards in order, staying at most window shards ahead of the writing */
+static void *indexwriter_work(void *arg)
+{
+    indexwriter_pipeline_t *pipeline = (indexwriter_pipeline_t *)arg;
+    indexwriter_t *writer = pipeline->writer;
+
+    pthread_mutex_lock(&(pipeline->mutex));
+    while (1)
+    {
+        while (!pipeline->failed && pipeline->nextShard < writer->numShards && pipeline->nextShard >= pipeline->written + pipeline->window)
+            pthread_cond_wait(&(pipeline->cond), &(pipeline->mutex));
+        if (pipeline->failed || pipeline->nextShard >= writer->numShards)
+            break;
+        indexwriter_shard_t *shard = &(writer->shards[pipeline->nextShard++]);
+        pthread_mutex_unlock(&(pipeline->mutex));
+
+        int result = indexwriter_encode(writer, shard);
+        int error = errno;
+
+        pthread_mutex_lock(&(pipeline->mutex));
+        if (result == -1 && !pipeline->failed)
+            pipeline->failed = error;
+        else if (result == 0)
+            shard->ready = 1;
+        pthread_cond_broadcast(&(pipeline->cond));
+    }
+    pthread_mutex_unlock(&(pipeline->mutex));
+    return NULL;
+}
+
+/* write() until all of it is written -- returns 0, or -1 with errno set */
+static int indexwriter_write_all(int fd, const char *data, size_t size)
+{
+    while (size > 0)
+    {
+        ssize_t written = write(fd, data, size);
+        if (written == -1)
+        {
+            if (errno == EINTR)
+                continue;
+            return -1;
+        }
+        data += written;
+        size -= written;
+    }
+    return 0;
+}
+
+/* syncs the directory holding filename, so the rename survives a crash -- on a best-effort basis */
+static void indexwriter_sync_directory(const char *filename)
+{
+    char *directory = strdup(filename);
+    if (directory == NULL)
+        return;
+    char *slash = strrchr(directory, '/');
+    if (slash == NULL)
+        strcpy(directory, ".");
+    else
+        *(slash == directory ? slash + 1 : slash) = '\0';
+    int fd = open(directory, O_RDONLY);
+    if (fd != -1)
+    {
+        fsync(fd);
+        close(fd);
+    }
+    free(directory);
+}
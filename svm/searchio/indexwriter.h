@@ -0,0 +1,57 @@
+/*
+    IndexWriter
+    Writes CS158 Search Engine indices: buffered, encoded in parallel, and published atomically.
+*/
+
+#ifndef __INDEXWRITER_H__
+#define __INDEXWRITER_H__
+
+#include <Python.h>
+#include <stdint.h>
+
+/* Target size of the buffer each worker thread encodes at a time */
+#define INDEXWRITER_SHARD_SIZE (4 * 1024 * 1024)
+
+/* One term, with its postings in flat host-order arrays */
+typedef struct indexwriter_term {
+    const char *term;
+    uint16_t termLength;
+    uint32_t df;
+    uint32_t numPostings;
+    uint32_t postingsOffset;        // where its postings start, from the beginning of the postings
+    size_t postingsSize;
+    const uint32_t *pageIDs;
+    const uint32_t *scaledWf;       // wf already scaled by SEARCHIO_WF_SCALE, for postings given as lists...
+    const double *wf;               // ...or as it was decoded, for postings given as a Postings object
+    const uint32_t *positionOffsets;// numPostings+1 entries: posting i's positions are positions[positionOffsets[i]:positionOffsets[i+1]] (none unless the profile keeps them)
+    const uint32_t *positions;
+    void *block;                    // the arrays copied out of lists, or NULL if they belong to a Postings object
+} indexwriter_term_t;
+
+/* A run of terms whose postings one worker encodes into one buffer */
+typedef struct indexwriter_shard {
+    uint32_t firstTerm;
+    uint32_t lastTerm;              // one past the end
+    size_t size;
+    char *buffer;                   // encoded postings, once ready
+    int ready;
+} indexwriter_shard_t;
+
+/* Everything needed to write an index file, gathered up front so the writing can happen without the GIL */
+typedef struct indexwriter {
+    uint32_t numDocuments;
+    int profile;                    // SEARCHIO_PROFILE_* -- what each posting holds
+    uint32_t numTerms;
+    indexwriter_term_t *terms;
+    char *table;                    // the encoded header and term entries
+    size_t tableSize;
+    indexwriter_shard_t *shards;
+    size_t numShards;
+    PyObject *keep;                 // the objects borrowed from (the term keys, and any Postings)
+} indexwriter_t;
+
+int indexwriter_prepare(indexwriter_t *writer, uint32_t numDocuments, PyObject *index, int profile);
+int indexwriter_write(indexwriter_t *writer, const char *filename, int threads);
+void indexwriter_free(indexwriter_t *writer);
+
+#endif
@@ -0,0 +1,71 @@
+/*
+    MinHash
+    MinHash signatures of the token shingles of a page, for finding near-duplicate pages.
+
+    Each shingle is hashed once to 64 bits, and the numHashes hash functions are then cheap
+    multiply-shift hashes of that value, (a*x + b) >> 32 with a fixed odd a and a fixed b per
+    function -- so a signature costs numHashes multiply-adds per shingle, and the same tokens
+    give the same signature on every run and every machine.
+*/
+
+#include "minhash.h"
+
+/* splitmix64's mixing step -- spreads the bits of a value over all 64 */
+static uint64_t minhash_mix(uint64_t x)
+{
+    x = (x ^ (x >> 30)) * 0xbf58476d1ce4e5b9ULL;
+    x = (x ^ (x >> 27)) * 0x94d049bb133111ebULL;
+    return x ^ (x >> 31);
+}
+
+uint64_t minhash_token(const char *token, size_t length)
+{
+    /* FNV-1a */
+    uint64_t h = 0xcbf29ce484222325ULL;
+    size_t i;
+    for (i = 0; i < length; i++)
+    {
+        h ^= (unsigned char)token[i];
+        h *= 0x100000001b3ULL;
+    }
+    return h;
+}
+
+int minhash_signature(const uint64_t *tokenHashes, size_t numTokens, size_t shingleSize, uint32_t *signature, size_t numHashes)
+{
+    if (numTokens == 0)
+        return -1;
+    if (shingleSize > numTokens)
+        shingleSize = numTokens;
+    if (shingleSize == 0)
+        shingleSize = 1;
+    
+    /* the hash functions */
+    uint64_t a[MINHASH_MAX_HASHES];
+    uint64_t b[MINHASH_MAX_HASHES];
+    size_t k;
+    for (k = 0; k < numHashes; k++)
+    {
+        a[k] = minhash_mix((2 * k) + 1) | 1;
+        b[k] = minhash_mix((2 * k) + 2);
+        signature[k] = UINT32_MAX;
+    }
+    
+    /* take the least value of each over the shingles */
+    size_t i;
+    for (i = 0; i + shingleSize <= numTokens; i++)
+    {
+        uint64_t x = 0;
+        size_t j;
+        for (j = 0; j < shingleSize; j++)
+            x = minhash_mix(x ^ tokenHashes[i + j]);
+        
+        for (k = 0; k < numHashes; k++)
+        {
+            uint32_t value = (uint32_t)(((a[k] * x) + b[k]) >> 32);
+            if (value < signature[k])
+                signature[k] = value;
+        }
+    }
+    return 0;
+}
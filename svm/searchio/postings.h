@@ -0,0 +1,42 @@
+/*
+    Postings
+    A compact, array-backed postings list for the CS158 Search Engine index.
+*/
+
+#ifndef __POSTINGS_H__
+#define __POSTINGS_H__
+
+#include <Python.h>
+#include <stdint.h>
+
+/* Object structs */
+typedef struct Postings_s Postings;
+typedef struct PostingsArray_s PostingsArray;
+
+/* Type objects */
+extern PyTypeObject PostingsType;
+extern PyTypeObject PostingsArrayType;
+
+#define Postings_Check(o) PyObject_TypeCheck(o, &PostingsType)
+
+/* Decoding postings from their on-disk form, in one of the SEARCHIO_PROFILE_* layouts */
+PyObject *Postings_decode(const char *data, size_t size, uint32_t numPostings, int profile, int withPositions);
+
+/* The arrays behind a Postings object, for encoding it again -- returns the profile they hold */
+int Postings_arrays(PyObject *o, uint32_t *length, const uint32_t **pageIDs, const double **wf, const uint32_t **positionOffsets, const uint32_t **positions);
+
+/* Deallocators */
+void Postings_dealloc(Postings *self);
+void PostingsArray_dealloc(PostingsArray *self);
+
+/* Sequence methods */
+Py_ssize_t Postings_Length(PyObject *o);
+PyObject *Postings_GetItem(PyObject *o, Py_ssize_t i);
+Py_ssize_t PostingsArray_Length(PyObject *o);
+PyObject *PostingsArray_GetItem(PyObject *o, Py_ssize_t i);
+
+/* Mapping methods */
+PyObject *Postings_Subscript(PyObject *o, PyObject *key);
+PyObject *PostingsArray_Subscript(PyObject *o, PyObject *key);
+
+#endif
@@ -5,18 +5,36 @@
 
 #include "sparseindex.h"
 #include <fcntl.h>
+#include <unistd.h>
+#include <sys/stat.h>
 #include <arpa/inet.h>
 #include "searchio.h"
+#include "postings.h"
 
 /* Object struct */
 struct SparseIndex_s {
     PyObject_HEAD
     int fd;
     uint32_t postingsStart;
+    uint32_t postingsSize;
+    uint32_t *postingsOffsets;  // every term's postings offset, sorted, so a postings list's end can be found
+    uint32_t numPostingsOffsets;
+    int profile;                // SEARCHIO_PROFILE_* the index was written with
+    int withPositions;          // whether to decode positions, when the index has them
     PyObject *terms;
 };
 
+/* Helpers */
+static int SparseIndex_compareOffsets(const void *a, const void *b);
+static uint32_t SparseIndex_postingsEnd(SparseIndex *self, uint32_t offset);
+static PyObject *SparseIndex_GetProfile(PyObject *o, void *closure);
+
 /* Type object */
+static PyGetSetDef SparseIndexGetSet[] = {
+    {"profile", &SparseIndex_GetProfile, NULL, "what the index's postings hold: PROFILE_DOCS, PROFILE_WF or PROFILE_POSITIONS", NULL},
+    {NULL, NULL, NULL, NULL, NULL}
+};
+
 static PyMappingMethods SparseIndexMappingMethods = {
     &SparseIndex_Length,
     &SparseIndex_GetItem,
@@ -67,7 +85,7 @@ PyTypeObject SparseIndexType = {
     0,                                          /* tp_iternext */
     0,                                          /* tp_methods */
     0,                                          /* tp_members */
-    0,                                          /* tp_getset */
+    SparseIndexGetSet,                          /* tp_getset */
     0,                                          /* tp_base */
     0,                                          /* tp_dict */
     0,                                          /* tp_descr_get */
@@ -79,7 +97,7 @@ PyTypeObject SparseIndexType = {
 };
 
 /* Initializers */
-PyObject *SparseIndex_new(int fd)
+PyObject *SparseIndex_new(int fd, int withPositions)
 {
     /* allocate the object */
     SparseIndex *self = (SparseIndex *)(SparseIndexType.tp_alloc(&SparseIndexType, 0));
@@ -87,10 +105,19 @@ PyObject *SparseIndex_new(int fd)
     {
         self->fd = fd;
         self->postingsStart = 0;
+        self->postingsSize = 0;
+        self->postingsOffsets = NULL;
+        self->numPostingsOffsets = 0;
+        self->profile = SEARCHIO_PROFILE_POSITIONS;
+        self->withPositions = withPositions;
         self->terms = NULL;
         
         /* rebuild the sparse index */
-        SparseIndex_reconstruct(self);
+        if (SparseIndex_reconstruct(self) == -1)
+        {
+            Py_DECREF(self);
+            return NULL;
+        }
     }
     
     return (PyObject *)self;
@@ -99,10 +126,12 @@ int SparseIndex_init(SparseIndex *self, PyObject *args, PyObject *kwds)
 {
     /* grab the filename */
     const char *filename = NULL;
-    static char *kwlist[] = {"filename", NULL};
+    int withPositions = 1;
+    static char *kwlist[] = {"filename", "withPositions", NULL};
     
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s", kwlist, &filename))
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s|i", kwlist, &filename, &withPositions))
         return -1;
+    self->withPositions = withPositions;
     
     if (filename != NULL)
     {
@@ -121,7 +150,8 @@ int SparseIndex_init(SparseIndex *self, PyObject *args, PyObject *kwds)
         }
         
         /* rebuild the sparse index */
-        SparseIndex_reconstruct(self);
+        if (SparseIndex_reconstruct(self) == -1)
+            return -1;
     }
     
     return 0;
@@ -134,36 +164,44 @@ void SparseIndex_dealloc(SparseIndex *self)
         close(self->fd);
     
     Py_XDECREF(self->terms);
+    free(self->postingsOffsets);
     self->ob_type->tp_free((PyObject *)self);
 }
 
-/* Loading the index */
-void SparseIndex_reconstruct(SparseIndex *self)
+/* Loading the index -- returns 0, or -1 with an exception set */
+int SparseIndex_reconstruct(SparseIndex *self)
 {
     /* we assume an open file */
     if (self->fd == -1)
-        return;
+        return 0;
     
     /* start by resetting our properties */
     self->postingsStart = 0;
+    self->postingsSize = 0;
     Py_XDECREF(self->terms);
     self->terms = PyDict_New();
-    
-    /* create a buffer for reading terms */
-    char *termBuffer = (char *)malloc(sizeof(char) * SEARCHIO_TOKENIZER_BUFFER_SIZE);
+    free(self->postingsOffsets);
+    self->postingsOffsets = NULL;
+    self->numPostingsOffsets = 0;
     
     /* read the header */
     searchio_index_header_t header;
-    lseek(self->fd, 0, SEEK_SET);
-    read(self->fd, (void *)&header, sizeof(header));
+    self->profile = searchio_read_header(self->fd, &header);
+    if (self->profile == -1)
+    {
+        PyErr_SetString(PyExc_IOError, "not a readable index");
+        return -1;
+    }
     
-    /* normalize header values */
-    header.numDocuments = ntohl(header.numDocuments);
-    header.numTerms = ntohl(header.numTerms);
-    header.postingsStart = ntohl(header.postingsStart);
+    /* create a buffer for reading terms */
+    char *termBuffer = (char *)malloc(sizeof(char) * SEARCHIO_TOKENIZER_BUFFER_SIZE);
     
-    /* store our postings start */
+    /* store our postings start, and how much of the file the postings take up */
     self->postingsStart = header.postingsStart;
+    struct stat indexStat;
+    if (fstat(self->fd, &indexStat) == 0 && (size_t)indexStat.st_size > header.postingsStart)
+        self->postingsSize = (uint32_t)((size_t)indexStat.st_size - header.postingsStart);
+    self->postingsOffsets = (uint32_t *)malloc(sizeof(uint32_t) * SEARCHIO_MAX(header.numTerms, 1));
     
     /* loop over the terms in the index, add them to the dictionary */
     uint32_t i;
@@ -186,15 +224,58 @@ void SparseIndex_reconstruct(SparseIndex *self)
         
         /* store the result in the index */
         PyObject *termEntry = PyDict_New();
-        PyDict_SetItemString(termEntry, "postingsOffset", PyLong_FromUnsignedLong(term.postingsOffset));
-        PyDict_SetItemString(termEntry, "df", PyLong_FromUnsignedLong(term.df));
-        PyDict_SetItemString(termEntry, "numDocumentsInPostings", PyLong_FromUnsignedLong(term.numDocumentsInPostings));
+        PyObject *postingsOffset = PyLong_FromUnsignedLong(term.postingsOffset);
+        PyObject *df = PyLong_FromUnsignedLong(term.df);
+        PyObject *numDocumentsInPostings = PyLong_FromUnsignedLong(term.numDocumentsInPostings);
+        PyDict_SetItemString(termEntry, "postingsOffset", postingsOffset);
+        PyDict_SetItemString(termEntry, "df", df);
+        PyDict_SetItemString(termEntry, "numDocumentsInPostings", numDocumentsInPostings);
+        Py_DECREF(postingsOffset);
+        Py_DECREF(df);
+        Py_DECREF(numDocumentsInPostings);
         
         PyDict_SetItem(self->terms, termStr, termEntry);
+        Py_DECREF(termStr);
+        Py_DECREF(termEntry);
+        
+        if (self->postingsOffsets != NULL)
+            self->postingsOffsets[self->numPostingsOffsets++] = term.postingsOffset;
     }
     
+    /* sort the offsets, for finding where each postings list ends */
+    if (self->postingsOffsets != NULL)
+        qsort(self->postingsOffsets, self->numPostingsOffsets, sizeof(uint32_t), &SparseIndex_compareOffsets);
+    
     /* clean up */
     free(termBuffer);
+    return 0;
+}
+/* Helper: sorts postings offsets */
+static int SparseIndex_compareOffsets(const void *a, const void *b)
+{
+    uint32_t x = *(const uint32_t *)a;
+    uint32_t y = *(const uint32_t *)b;
+    return (x > y) - (x < y);
+}
+/* Helper: where the postings list starting at offset ends -- the next offset up, or the end of the file */
+static uint32_t SparseIndex_postingsEnd(SparseIndex *self, uint32_t offset)
+{
+    uint32_t low = 0;
+    uint32_t high = self->numPostingsOffsets;
+    while (low < high)
+    {
+        uint32_t middle = low + (high - low) / 2;
+        if (self->postingsOffsets[middle] <= offset)
+            low = middle + 1;
+        else
+            high = middle;
+    }
+    return (low < self->numPostingsOffsets) ? self->postingsOffsets[low] : self->postingsSize;
+}
+/* Getter: the index's profile */
+static PyObject *SparseIndex_GetProfile(PyObject *o, void *closure)
+{
+    return PyInt_FromLong(((SparseIndex *)o)->profile);
 }
 
 /* Mapping methods */
@@ -225,52 +306,36 @@ PyObject *SparseIndex_GetItem(PyObject *o, PyObject *key)
         return postingsResult;
     }
     
-    /* looks like we have to lazily load the postings; start by seeking to the right place */
-    size_t offset = PyInt_AsUnsignedLongMask(PyDict_GetItemString(term, "postingsOffset"));
-    lseek(self->fd, self->postingsStart + offset, SEEK_SET);
-    
-    /* create a postings list, load the postings */
+    /* looks like we have to lazily load the postings; read the whole list in one go */
+    uint32_t offset = (uint32_t)PyInt_AsUnsignedLongMask(PyDict_GetItemString(term, "postingsOffset"));
     uint32_t numDocumentsInPostings = (uint32_t)PyInt_AsUnsignedLongMask(PyDict_GetItemString(term, "numDocumentsInPostings"));
-    PyObject *postings = PyList_New(numDocumentsInPostings);
+    uint32_t end = SparseIndex_postingsEnd(self, offset);
+    size_t size = (end > offset) ? (size_t)(end - offset) : 0;
     
-    uint32_t i;
-    for (i = 0; i < numDocumentsInPostings; i++)
+    char *buffer = (char *)malloc(SEARCHIO_MAX(size, 1));
+    if (buffer == NULL)
+        return PyErr_NoMemory();
+    ssize_t got = pread(self->fd, buffer, size, (off_t)self->postingsStart + offset);
+    if (got < 0)
     {
-        /* grab the posting header */
-        searchio_index_posting_t posting;
-        read(self->fd, &posting, sizeof(posting));
-            
-        /* normalize it */
-        posting.pageID = ntohl(posting.pageID);
-        posting.wf = ntohl(posting.wf);
-        posting.numPositions = ntohl(posting.numPositions);
-            
-        /* create a positions list, fill it out */
-        PyObject *positions = PyList_New(posting.numPositions);
-        uint32_t j;
-        for (j = 0; j < posting.numPositions; j++)
-        {
-            uint32_t position;
-            read(self->fd, &position, sizeof(position));
-            
-            PyList_SetItem(positions, j, PyLong_FromUnsignedLong(ntohl(position)));
-        }
-            
-        /* add an entry to the postings list */
-        PyObject *entry = PyList_New(3);
-        PyList_SetItem(entry, 0, PyLong_FromUnsignedLong(posting.pageID));
-        PyList_SetItem(entry, 1, PyFloat_FromDouble((double)posting.wf / (double)SEARCHIO_WF_SCALE));
-        PyList_SetItem(entry, 2, positions);
-        PyList_SetItem(postings, i, entry);
+        free(buffer);
+        return PyErr_SetFromErrno(PyExc_IOError);
     }
-        
+    
+    /* decode them into a compact Postings object */
+    PyObject *postings = Postings_decode(buffer, (size_t)got, numDocumentsInPostings, self->profile, self->withPositions);
+    free(buffer);
+    if (postings == NULL)
+        return NULL;
+    
     /* store the result in the index */
+    PyObject *df = PyDict_GetItemString(term, "df");
+    Py_INCREF(df);
     PyObject *termEntry = PyList_New(2);
-    PyList_SetItem(termEntry, 0, PyDict_GetItemString(term, "df"));
+    PyList_SetItem(termEntry, 0, df);
     PyList_SetItem(termEntry, 1, postings);
     PyDict_SetItemString(term, "postings", termEntry);
     
-    Py_INCREF(termEntry);
     return termEntry;
 }
 int SparseIndex_Contains(PyObject *o, PyObject *value)
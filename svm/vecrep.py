@@ -4,6 +4,7 @@ import sys
 from vecrep_util import parse, tokenize, create_stopwords_set, create_features_dict
 
 import searchio  # import our own optimized I/O module
+import instrument
 
 			
 # helper to main: after the index is created, must print it to the output_filename file
@@ -40,7 +41,8 @@ def main(stopwords_filename, pagesCollection_filename, features_filename, output
 	index = {}
 
 	# obtain dictionary mapping pageID's to list of title and text words, ie collection = {pageID: textString}
-	(collection, maxID) = parse(pagesCollection_filename)
+	with instrument.stage('parse'):
+		(collection, maxID) = parse(pagesCollection_filename)
 
 	# iterate over keys (pageID's) to fill the index
 	for i in range(maxID+1):
@@ -55,6 +57,7 @@ def main(stopwords_filename, pagesCollection_filename, features_filename, output
 		
 		# tokenize titleString
 		token_list = searchio.tokenize(stopWords_set, textString, False)
+		instrument.count('tokens_produced', len(token_list))
 		
 		# map feature to feature_occurance in index
 		for t in range(len(token_list)):
@@ -76,7 +79,10 @@ def main(stopwords_filename, pagesCollection_filename, features_filename, output
 		index[pageID] = (sum_d, feature_vector)
 
 	# now the index is built in form {docID: (sum_d, {f_i:occ_i for feature in features})} -- must print to file in form 'pageID sum_d f_i:occ_i ........'
-	printVecrep(output_filename, index, len(features_dict))
+	with instrument.stage('printVecrep'):
+		printVecrep(output_filename, index, len(features_dict))
+	instrument.report()
 	return index
 				
-main(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
\ No newline at end of file
+if __name__ == '__main__':
+	main(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
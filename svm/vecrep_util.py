@@ -1,5 +1,6 @@
 # file of helper methods to vecrep
 # based on XML parser used in createIndex
+import instrument
 
 # input: filename (fname) of the stopWords file
 # output: set of stopwords
@@ -105,6 +106,7 @@ def parse(fname):
         textString = textString + currLine
 
         dictionary[pageID] = textString
+        instrument.count('pages_parsed')
         if pageID > maxID:
             maxID = pageID
         currLine = f.readline()